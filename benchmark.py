@@ -0,0 +1,201 @@
+"""
+End-to-end throughput benchmark: runs each crawler against a local
+MockSpotifyServer and reports items/s, request latency percentiles,
+checkpoint time and peak memory for every stage.
+
+    python benchmark.py --artists 2000 --latency 0.05 --concurrency 8
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import resource
+import argparse
+import tempfile
+import warnings
+import multiprocessing
+import rate_limiter as rl
+import serialization as ser
+from crawl_options import StorageOptions, NetworkOptions
+from mock_spotify_server import SyntheticCatalog, MockSpotifyServer, \
+    create_mock_accessor
+from crawler_related_artists import RelatedArtistsCrawler, SEED_ARTIST_ID
+from crawler_artist_info import ArtistInfoCrawler
+from crawler_top_tracks import TopTracksCrawler
+from crawler_track_info import TrackInfoCrawler
+
+# In dependency order: each stage reads the collated output of an earlier one
+STAGES = [
+    ("related_artists", RelatedArtistsCrawler),
+    ("artist_info", ArtistInfoCrawler),
+    ("top_tracks", TopTracksCrawler),
+    ("track_info", TrackInfoCrawler),
+]
+
+
+def percentile(values, fraction):
+    if len(values) == 0:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def folder_size(dirname):
+    total = 0
+    for root, _, filenames in os.walk(dirname):
+        for filename in filenames:
+            total += os.path.getsize(os.path.join(root, filename))
+    return total
+
+
+def instrumented(crawler_class, latencies, checkpoint_times):
+    # Time every request and checkpoint without changing the crawler itself
+
+    class InstrumentedCrawler(crawler_class):
+
+        def make_search_request(self, items_to_search):
+            start = time.perf_counter()
+            try:
+                return super().make_search_request(items_to_search)
+            finally:
+                latencies.append(time.perf_counter() - start)
+
+        def make_single_request(self, item):
+            start = time.perf_counter()
+            try:
+                return super().make_single_request(item)
+            finally:
+                latencies.append(time.perf_counter() - start)
+
+        def save_current_info(self):
+            start = time.perf_counter()
+            super().save_current_info()
+            checkpoint_times.append(time.perf_counter() - start)
+
+    return InstrumentedCrawler
+
+
+def run_stage(name, crawler_class, url, crawler_kwargs, results, verbose):
+    # Runs in its own process, so peak RSS is per stage
+    if not verbose:
+        sys.stdout = open(os.devnull, "w")
+    warnings.simplefilter("ignore", DeprecationWarning)
+
+    latencies = []
+    checkpoint_times = []
+    crawler_class = instrumented(crawler_class, latencies, checkpoint_times)
+    start = time.perf_counter()
+    crawler = crawler_class(name, client=create_mock_accessor(url),
+                            **crawler_kwargs)
+    elapsed = time.perf_counter() - start
+    items = len(crawler.saved_items) + len(crawler.searched_items)
+
+    results.put({
+        "stage": name,
+        "complete": crawler.complete,
+        "items": items,
+        "seconds": round(elapsed, 3),
+        "items_per_second": round(items / elapsed, 1),
+        "requests": len(latencies),
+        "retries": sum(v["value"] for v in
+                       crawler.metrics.snapshot()["crawler_retries_total"]),
+        "latency_p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+        "latency_p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "checkpoints": len(checkpoint_times),
+        "checkpoint_mean_ms": round(1000 * sum(checkpoint_times) /
+                                    max(1, len(checkpoint_times)), 2),
+        "checkpoint_max_ms": round(max(checkpoint_times, default=0) * 1000, 2),
+        # The crawler's own folder, not including the collated output
+        "data_mb": round(folder_size(crawler.dirname) / 1024**2, 2),
+        # ru_maxrss is in KB on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                             / 1024, 1)
+    })
+
+
+def print_report(report):
+    columns = ["stage", "items", "seconds", "items_per_second", "requests", "retries",
+               "latency_p50_ms", "latency_p99_ms", "checkpoint_mean_ms",
+               "checkpoint_max_ms", "data_mb", "peak_rss_mb"]
+    widths = [max(len(c), *(len(str(r[c])) for r in report)) for c in columns]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    for row in report:
+        print("  ".join(str(row[c]).ljust(w) for c, w in zip(columns, widths)))
+
+
+def benchmark(num_artists=2000, latency=0.0, rate_limit_rate=0.0,
+              timeout_rate=0.0, concurrency=1, rate=1000, items_per_file=1000,
+              count_threshold=100, stages=None, verbose=False, **crawler_kwargs):
+    catalog = SyntheticCatalog(num_artists, seed_artist_id=SEED_ARTIST_ID)
+    server = MockSpotifyServer(catalog, latency=latency,
+                               rate_limit_rate=rate_limit_rate, retry_after=0.1,
+                               timeout_rate=timeout_rate, timeout_seconds=6)
+    server.start()
+
+    # The crawlers write to ./data, so run them in a scratch folder
+    original_dir = os.getcwd()
+    work_dir = tempfile.mkdtemp(prefix="crawler_benchmark_")
+    os.chdir(work_dir)
+    report = []
+    try:
+        for name, crawler_class in STAGES:
+            if stages != None and name not in stages:
+                continue
+            network = NetworkOptions(concurrency=concurrency,
+                                     rate_limiter=rl.RateLimiter(rate=rate))
+            kwargs = dict(crawler_kwargs, items_per_file=items_per_file,
+                          count_threshold=count_threshold, network=network)
+            results = multiprocessing.Queue()
+            process = multiprocessing.Process(
+                target=run_stage,
+                args=(name, crawler_class, server.url, kwargs, results, verbose))
+            process.start()
+            process.join()
+            if process.exitcode != 0:
+                print(f"Stage {name} failed.")
+                break
+            report.append(results.get())
+    finally:
+        os.chdir(original_dir)
+        shutil.rmtree(work_dir, ignore_errors=True)
+        server.stop()
+
+    print(f"\nMock server: {server.request_count} requests, "
+          f"{server.throttle_count} throttled")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the crawlers offline.")
+    parser.add_argument("--artists", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Mean server latency in seconds")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0,
+                        help="Fraction of requests answered with a 429")
+    parser.add_argument("--timeout-rate", type=float, default=0.0,
+                        help="Fraction of requests stalled past the client timeout")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--rate", type=float, default=1000,
+                        help="Starting rate limit, requests per second")
+    parser.add_argument("--items-per-file", type=int, default=1000)
+    parser.add_argument("--count-threshold", type=int, default=100)
+    parser.add_argument("--stages", nargs="*", default=None,
+                        choices=[name for name, _ in STAGES])
+    parser.add_argument("--serializer", choices=ser.FORMATS, default="auto")
+    parser.add_argument("--compression", choices=["gzip", "zstd"], default=None)
+    parser.add_argument("--json-output", default=None,
+                        help="Also write the results to this JSON file")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    report = benchmark(args.artists, args.latency, args.rate_limit_rate,
+                       args.timeout_rate, args.concurrency, args.rate,
+                       args.items_per_file, args.count_threshold, args.stages,
+                       args.verbose,
+                       storage=StorageOptions(serializer=args.serializer,
+                                              compression=args.compression))
+    print_report(report)
+    if args.json_output:
+        with open(args.json_output, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,95 @@
+import os
+import time
+import queue
+import threading
+from functools import partial
+
+
+def fsync_dir(dirname):
+    # Make a rename in dirname durable. Not possible on every platform.
+    try:
+        fd = os.open(dirname or ".", os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def write_atomic(filepath, data, backup_filepath=None):
+    # Write to a temporary file and swap it into place, so a crash leaves
+    # either the old file or the new one, never a torn one. With
+    # backup_filepath, the old file is kept there.
+    temp_filepath = filepath + ".tmp"
+    with open(temp_filepath, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    if backup_filepath != None and os.path.isfile(filepath):
+        os.replace(filepath, backup_filepath)
+    os.replace(temp_filepath, filepath)
+    fsync_dir(os.path.dirname(filepath))
+
+
+class CheckpointWriter():
+    """
+    Runs save jobs on a background thread, in the order they were submitted,
+    so a checkpoint costs the crawl loop little more than copying its state.
+    At most max_pending jobs wait at once. Submitting another blocks until
+    the writer catches up, rather than letting unsaved state pile up.
+    An error in a job stops any further writes, and is raised again from the
+    next submit(), flush() or close().
+    """
+
+    def __init__(self, max_pending=2, write_seconds=None, wait_seconds=None):
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.write_seconds = write_seconds   # Optional metrics histograms
+        self.wait_seconds = wait_seconds
+        self.error = None
+        self.thread = threading.Thread(target=self.run, name="checkpoint-writer",
+                                       daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            job = self.queue.get()
+            try:
+                if job == None:
+                    return
+                if self.error == None:
+                    start = time.perf_counter()
+                    job()
+                    if self.write_seconds != None:
+                        self.write_seconds.observe(time.perf_counter() - start)
+            except BaseException as e:
+                self.error = e
+            finally:
+                self.queue.task_done()
+
+    def submit(self, job, *args):
+        self.check()
+        start = time.perf_counter()
+        self.queue.put(partial(job, *args))
+        if self.wait_seconds != None:
+            self.wait_seconds.observe(time.perf_counter() - start)
+
+    def pending(self):
+        return self.queue.unfinished_tasks
+
+    def flush(self):
+        # Wait until everything submitted so far has been written
+        self.queue.join()
+        self.check()
+
+    def check(self):
+        if self.error != None:
+            raise RuntimeError("Checkpoint write failed.") from self.error
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        self.check()
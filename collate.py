@@ -0,0 +1,195 @@
+"""
+Streams a crawler's saved shards into a single output file, one shard at a
+time, so only one shard's data is held in memory rather than the dataset.
+The IDs already written are also kept, to skip duplicates, so memory still
+grows with the number of items, but by an ID rather than an item's data.
+
+Can also be run on an existing data folder without starting a crawl:
+    python collate.py data/track_info --format jsonl
+"""
+import os
+import csv
+import json
+import argparse
+import shard_index
+import shard_manifest
+import serialization as ser
+
+FORMATS = ["json", "jsonl", "columnar"]
+
+
+def list_shard_paths(dirname, prefix="saved"):
+    # dirname may also be a list of folders, e.g. the workers of a
+    # multi-process crawl (see multi_crawl.py)
+    dirnames = [dirname] if isinstance(dirname, str) else dirname
+    filepaths = []
+    for folder in dirnames:
+        filepaths += shard_manifest.list_shard_paths(folder, prefix)
+    return filepaths
+
+
+def iter_results(dirname, prefix="saved"):
+    # Yield (id, data) for every saved item. Newer shards are read first and
+    # duplicates skipped, so the most recently saved copy of an item wins.
+    seen = set()
+    for filepath in reversed(list_shard_paths(dirname, prefix)):
+        yield from iter_shard(shard_index.load_shard(filepath), seen)
+
+
+def iter_shard(data, seen):
+    for key, value in data.items():
+        if key not in seen:
+            seen.add(key)
+            yield key, value
+
+
+def iter_saved_ids(dirname, prefix="saved"):
+    # Yield a list of the saved IDs in each shard, newest first, read from the
+    # shard indexes rather than the shards. Unlike iter_results, duplicates
+    # are not skipped.
+    for filepath in reversed(list_shard_paths(dirname, prefix)):
+        ids = shard_index.read_index(filepath)
+        if ids == None:
+            # Saved before indexes existed
+            ids = list(shard_index.load_shard(filepath).keys())
+        yield ids
+
+
+def iter_shard_batches(dirname, prefix="saved"):
+    # As iter_results, but one list of (id, data) per shard
+    seen = set()
+    for filepath in reversed(list_shard_paths(dirname, prefix)):
+        yield list(iter_shard(shard_index.load_shard(filepath), seen))
+
+
+def iter_row_batches(dirname, prefix="saved"):
+    # As iter_shard_batches, but flattened rows, and leaving out empty shards
+    for batch in iter_shard_batches(dirname, prefix):
+        if len(batch) > 0:
+            yield [flatten_row(key, value) for key, value in batch]
+
+
+def flatten_row(key, value):
+    # One flat record per item, for the line-based and columnar formats
+    if isinstance(value, dict):
+        row = {"id": key}
+        row.update(value)
+        return row
+    return {"id": key, "value": value}
+
+
+def write_json(dirname, output_filepath, prefix="saved"):
+    count = 0
+    with open(output_filepath, "w") as f:
+        f.write("{")
+        for key, value in iter_results(dirname, prefix):
+            if count > 0:
+                f.write(", ")
+            f.write(ser.dumps_json(str(key)))
+            f.write(": ")
+            f.write(ser.dumps_json(value))
+            count += 1
+        f.write("}")
+    return count
+
+
+def write_jsonl(dirname, output_filepath, prefix="saved"):
+    count = 0
+    with open(output_filepath, "w") as f:
+        for key, value in iter_results(dirname, prefix):
+            f.write(ser.dumps_json(flatten_row(key, value)))
+            f.write("\n")
+            count += 1
+    return count
+
+
+def write_parquet(dirname, output_filepath, prefix="saved"):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # A first pass unifies every shard's schema, so a field missing or all
+    # null in one shard (or an empty list) takes its type from the others
+    schemas = [pa.Table.from_pylist(rows).schema
+               for rows in iter_row_batches(dirname, prefix)]
+    if len(schemas) == 0:
+        return 0
+    schema = pa.unify_schemas(schemas, promote_options="permissive")
+
+    count = 0
+    with pq.ParquetWriter(output_filepath, schema) as writer:
+        for rows in iter_row_batches(dirname, prefix):
+            writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+            count += len(rows)
+    return count
+
+
+def write_csv(dirname, output_filepath, prefix="saved"):
+    # A first pass collects every field, as later items may have fields the
+    # first doesn't
+    fieldnames = {}
+    for rows in iter_row_batches(dirname, prefix):
+        for row in rows:
+            fieldnames.update(dict.fromkeys(row))
+
+    count = 0
+    with open(output_filepath, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(fieldnames))
+        writer.writeheader()
+        for rows in iter_row_batches(dirname, prefix):
+            for row in rows:
+                for field, field_value in row.items():
+                    if isinstance(field_value, (list, dict)):
+                        row[field] = json.dumps(field_value)
+                writer.writerow(row)
+            count += len(rows)
+    return count
+
+
+def has_pyarrow():
+    try:
+        import pyarrow.parquet
+        return True
+    except ImportError:
+        return False
+
+
+def output_extension(output_format):
+    if output_format == "columnar":
+        return ".parquet" if has_pyarrow() else ".csv"
+    return "." + output_format
+
+
+def default_output_path(dirname, output_format="json"):
+    # data/<crawler> is collated into data/<crawler>.<ext>
+    dirname = os.path.normpath(dirname)
+    name = os.path.basename(dirname) + output_extension(output_format)
+    return os.path.join(os.path.dirname(dirname), name)
+
+
+def collate(dirname, output_filepath=None, output_format="json", prefix="saved"):
+    if output_format not in FORMATS:
+        raise ValueError(f"Unknown output format: {output_format}")
+    if output_filepath == None:
+        output_filepath = default_output_path(dirname, output_format)
+
+    if output_format == "json":
+        return write_json(dirname, output_filepath, prefix)
+    elif output_format == "jsonl":
+        return write_jsonl(dirname, output_filepath, prefix)
+    elif has_pyarrow():
+        return write_parquet(dirname, output_filepath, prefix)
+    else:
+        return write_csv(dirname, output_filepath, prefix)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Collate a crawler's saved shards.")
+    parser.add_argument("dirname", help="Crawler data folder, e.g. data/track_info")
+    parser.add_argument("--format", choices=FORMATS, default="json")
+    parser.add_argument("--output", default=None, help="Output file path")
+    parser.add_argument("--prefix", default="saved", help="Shard filename prefix")
+    args = parser.parse_args()
+
+    output_filepath = args.output or default_output_path(args.dirname, args.format)
+    count = collate(args.dirname, output_filepath, args.format, args.prefix)
+    print(f"{count} items collated into file: {output_filepath}")
@@ -0,0 +1,131 @@
+import os
+import sys
+import json
+from array import array
+from checkpoint_writer import fsync_dir
+
+# A simple typed columnar shard: a directory holding one little-endian binary
+# file per field, plus a schema.json describing them. Numeric columns can be
+# opened directly with numpy.memmap(path, dtype=...).
+#
+# Field kinds:
+#   float32, int8, int16, int32, int64, bool -> fixed-width values, with an
+#                                               optional uint8 null mask
+#   str, json -> int64 offsets (count + 1) into a UTF-8 data file
+
+TYPECODES = {
+    "float32": ("f", "<f4"),
+    "int8": ("b", "<i1"),
+    "int16": ("h", "<i2"),
+    "int32": ("i", "<i4"),
+    "int64": ("q", "<i8"),
+    "bool": ("B", "|u1"),
+}
+
+SHARD_EXTENSION = ".cols"
+
+
+def _write_file(filepath, data):
+    with open(filepath, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _write_array(filepath, values):
+    if sys.byteorder == "big":
+        values.byteswap()
+    _write_file(filepath, values.tobytes())
+
+
+def _read_array(filepath, typecode):
+    values = array(typecode)
+    with open(filepath, "rb") as f:
+        values.frombytes(f.read())
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def write_columns(dirpath, ids, rows, schema):
+    # schema is a list of (field, kind); rows are dicts with those fields.
+    # Every file is synced to disk, so the folder can then be swapped into
+    # place as a whole (see shard_index.replace_shard).
+    os.makedirs(dirpath, exist_ok=True)
+    fields = {}
+
+    # The shard's keys are stored as an extra "_key" column
+    for field, kind in [("_key", "str")] + schema:
+        if field == "_key":
+            values = [str(i) for i in ids]
+        else:
+            values = [row.get(field) for row in rows]
+        info = {"kind": kind, "mask": None}
+
+        if kind in ("str", "json"):
+            offsets = array("q", [0])
+            data = bytearray()
+            for value in values:
+                if kind == "json":
+                    value = json.dumps(value)
+                data += ("" if value == None else value).encode("utf-8")
+                offsets.append(len(data))
+            _write_array(os.path.join(dirpath, f"{field}.offsets"), offsets)
+            _write_file(os.path.join(dirpath, f"{field}.bin"), data)
+            info["dtype"] = "utf-8"
+
+        else:
+            typecode, dtype = TYPECODES[kind]
+            column = array(typecode, [0 if v == None else v for v in values])
+            _write_array(os.path.join(dirpath, f"{field}.bin"), column)
+            info["dtype"] = dtype
+
+        # JSON columns encode None themselves, the rest need a null mask
+        if kind != "json" and None in values:
+            info["mask"] = f"{field}.mask"
+            mask = array("B", [0 if v == None else 1 for v in values])
+            _write_array(os.path.join(dirpath, info["mask"]), mask)
+
+        fields[field] = info
+
+    schema_data = {"count": len(ids), "fields": fields}
+    _write_file(os.path.join(dirpath, "schema.json"),
+                json.dumps(schema_data).encode("utf-8"))
+    fsync_dir(dirpath)
+
+
+def read_columns(dirpath):
+    # Read a columnar shard back into {id: row}, the same shape as a JSON shard
+    with open(os.path.join(dirpath, "schema.json"), "r") as f:
+        schema = json.load(f)
+    count = schema["count"]
+    columns = {}
+
+    for field, info in schema["fields"].items():
+        kind = info["kind"]
+        if kind in ("str", "json"):
+            offsets = _read_array(os.path.join(dirpath, f"{field}.offsets"), "q")
+            with open(os.path.join(dirpath, f"{field}.bin"), "rb") as f:
+                data = f.read()
+            values = [data[offsets[i]:offsets[i+1]].decode("utf-8")
+                      for i in range(count)]
+            if kind == "json":
+                values = [json.loads(v) for v in values]
+        else:
+            typecode, _ = TYPECODES[kind]
+            values = list(_read_array(os.path.join(dirpath, f"{field}.bin"),
+                                      typecode))
+            if kind == "float32":
+                # Drop the float32 noise (0.123 -> 0.12300000339746475)
+                values = [float(f"{v:.7g}") for v in values]
+            elif kind == "bool":
+                values = [bool(v) for v in values]
+
+        if info.get("mask") != None:
+            mask = _read_array(os.path.join(dirpath, info["mask"]), "B")
+            values = [v if m else None for v, m in zip(values, mask)]
+        columns[field] = values
+
+    ids = columns.pop("_key")
+    return {ids[i]: {field: columns[field][i] for field in columns}
+            for i in range(count)}
@@ -0,0 +1,166 @@
+import os
+import json
+
+
+class CrawlJournal():
+    """
+    An append-only log of changes to the crawler's item sets.
+
+    Changes are buffered in memory and appended to the journal file at each
+    checkpoint, so a checkpoint only costs as much as the changes made since
+    the last one. Every event sets or clears a single key, so replaying the
+    journal on top of a newer snapshot gives the same result as replaying it
+    on the snapshot it was started from. This means a crash part-way through
+    a compaction is also safe.
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.buffer = []        # Events not yet written to disk
+        self.event_count = 0    # Item events since the last compaction
+
+    def record(self, name, op, *args):
+        self.buffer.append([name, op, *args])
+        if op in ("add", "discard"):
+            self.event_count += len(args[0])
+        else:
+            self.event_count += 1
+
+    def flush(self):
+        if len(self.buffer) == 0:
+            return
+        with open(self.filepath, "a") as f:
+            for event in self.buffer:
+                f.write(json.dumps(event))
+                f.write("\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.buffer = []
+
+    def reset(self):
+        # Called once a full snapshot of the state has been written
+        self.buffer = []
+        self.event_count = 0
+        with open(self.filepath, "w") as f:
+            f.flush()
+            os.fsync(f.fileno())
+
+    def replay(self, containers):
+        # Apply the logged events to the given {name: set/dict} containers
+        if not os.path.isfile(self.filepath):
+            return 0
+        count = 0
+        with open(self.filepath, "r") as f:
+            for line in f:
+                try:
+                    name, op, *args = json.loads(line)
+                except json.decoder.JSONDecodeError:
+                    # A torn final line from a crash mid-write
+                    break
+                container = containers[name]
+                if op == "add":
+                    container.update(args[0])
+                elif op == "discard":
+                    container.difference_update(args[0])
+                elif op == "set":
+                    container[args[0]] = args[1]
+                elif op == "del":
+                    container.pop(args[0], None)
+                elif op == "clear":
+                    container.clear()
+                count += 1
+        return count
+
+
+class JournaledSet():
+    # Wraps a set-like container and records every change to the journal
+
+    def __init__(self, journal, name, inner):
+        self.journal = journal
+        self.name = name
+        self.inner = inner
+
+    def add(self, item):
+        self.inner.add(item)
+        self.journal.record(self.name, "add", [item])
+
+    def update(self, items):
+        items = list(items)
+        self.inner.update(items)
+        self.journal.record(self.name, "add", items)
+
+    def discard(self, item):
+        self.inner.discard(item)
+        self.journal.record(self.name, "discard", [item])
+
+    def remove(self, item):
+        self.inner.remove(item)
+        self.journal.record(self.name, "discard", [item])
+
+    def difference_update(self, items):
+        items = list(items)
+        self.inner.difference_update(items)
+        self.journal.record(self.name, "discard", items)
+
+    def clear(self):
+        self.inner.clear()
+        self.journal.record(self.name, "clear")
+
+    def __contains__(self, item):
+        return item in self.inner
+
+    def __iter__(self):
+        return iter(self.inner)
+
+    def __len__(self):
+        return len(self.inner)
+
+    def __getattr__(self, attr):
+        # Read-only extras of the wrapped container (e.g. scheduler methods)
+        return getattr(self.inner, attr)
+
+
+class JournaledDict():
+    # Wraps a dict-like container and records every change to the journal
+
+    def __init__(self, journal, name, inner):
+        self.journal = journal
+        self.name = name
+        self.inner = inner
+
+    def __setitem__(self, key, value):
+        self.inner[key] = value
+        self.journal.record(self.name, "set", key, value)
+
+    def __delitem__(self, key):
+        del self.inner[key]
+        self.journal.record(self.name, "del", key)
+
+    def update(self, other):
+        for key, value in dict(other).items():
+            self[key] = value
+
+    def pop(self, key, *default):
+        value = self.inner.pop(key, *default)
+        self.journal.record(self.name, "del", key)
+        return value
+
+    def clear(self):
+        self.inner.clear()
+        self.journal.record(self.name, "clear")
+
+    def __getitem__(self, key):
+        return self.inner[key]
+
+    def __contains__(self, key):
+        return key in self.inner
+
+    def __iter__(self):
+        return iter(self.inner)
+
+    def __len__(self):
+        return len(self.inner)
+
+    def __getattr__(self, attr):
+        # keys(), values(), items(), get(), ...
+        return getattr(self.inner, attr)
@@ -0,0 +1,120 @@
+"""
+Options for a crawler, grouped by what they configure, so they are given to
+it as a few objects rather than one long list of arguments:
+
+    RelatedArtistsCrawler("related_artists",
+        storage=StorageOptions(serializer="msgpack", compression="zstd"),
+        network=NetworkOptions(concurrency=8))
+
+Any group left out takes its defaults.
+"""
+
+
+class Options():
+
+    def replace(self, **changes):
+        # A copy with some options changed, e.g. to give one stage of a
+        # pipeline its own rate limiter
+        options = dict(vars(self))
+        for name, value in changes.items():
+            if name not in options:
+                raise TypeError(f"Unknown option: {name}")
+            options[name] = value
+        return type(self)(**options)
+
+
+class StorageOptions(Options):
+    """
+    How the crawl's state and saved shards are kept on disk:
+        state_backend           "json" keeps the item sets in memory, "sqlite"
+                                on disk (see sqlite_state.py)
+        use_journal             Only write the changes at each checkpoint (see
+                                crawl_journal.py), compacting once there are
+                                journal_min_compaction of them
+        frontier_memory_items   Spill the unsearched items to disk, keeping this
+                                many in memory (see frontier.py)
+        serializer, compression How state files and shards are encoded (see
+                                serialization.py)
+        background_checkpoints  Write checkpoints from a background thread
+    """
+
+    def __init__(self, state_backend="json", use_journal=False,
+                 journal_min_compaction=10000, frontier_memory_items=None,
+                 serializer="auto", compression=None,
+                 background_checkpoints=True):
+        if state_backend not in ("json", "sqlite"):
+            raise ValueError(f"Unknown state backend: {state_backend}")
+        if state_backend == "sqlite" and use_journal:
+            raise ValueError("The sqlite state backend is already journaled.")
+        if frontier_memory_items != None and \
+                (use_journal or state_backend != "json"):
+            raise ValueError("The spilling frontier needs the json state "
+                             "backend, without a journal.")
+        self.state_backend = state_backend
+        self.use_journal = use_journal
+        self.journal_min_compaction = journal_min_compaction
+        self.frontier_memory_items = frontier_memory_items
+        self.serializer = serializer
+        self.compression = compression
+        self.background_checkpoints = background_checkpoints
+
+
+class SchedulingOptions(Options):
+    """
+    Which items are searched, and in what order:
+        scheduler               Priority order for the unsearched items, by
+                                name or instance (see scheduler.py)
+        refresh_max_age         Re-search saved items fetched over this many
+                                seconds ago, plus a random refresh_sample_rate
+                                of the rest
+        max_invalid_attempts    Searches an invalid item gets in all
+    """
+
+    def __init__(self, scheduler=None, refresh_max_age=None,
+                 refresh_sample_rate=0.0, max_invalid_attempts=3):
+        self.scheduler = scheduler
+        self.refresh_max_age = refresh_max_age
+        self.refresh_sample_rate = refresh_sample_rate
+        self.max_invalid_attempts = max_invalid_attempts
+
+
+class NetworkOptions(Options):
+    """
+    How requests are made:
+        concurrency             Requests kept in flight at once
+        rate_limiter            A shared rate_limiter.RateLimiter. Spotify
+                                crawlers make their own if not given one.
+        connect_timeout, read_timeout, http_retries
+                                For the Spotify client's session
+        cache_ttl               Serve repeat requests from the on-disk response
+                                cache, up to cache_max_bytes, for this many
+                                seconds (see response_cache.py)
+    """
+
+    def __init__(self, concurrency=1, rate_limiter=None, connect_timeout=3.05,
+                 read_timeout=10, http_retries=3, cache_ttl=None,
+                 cache_max_bytes=2*1024**3):
+        self.concurrency = concurrency
+        self.rate_limiter = rate_limiter
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.http_retries = http_retries
+        self.cache_ttl = cache_ttl
+        self.cache_max_bytes = cache_max_bytes
+
+
+class OutputOptions(Options):
+    """
+    What the crawl writes and reports besides its state:
+        output_format           json, jsonl or columnar, for the collated file
+        record_responses        Keep every raw response, for replay.py
+        metrics_port            Also serve the metrics over HTTP on this port
+        show_progress           Reprint the progress line as the crawl goes
+    """
+
+    def __init__(self, output_format="json", record_responses=False,
+                 metrics_port=None, show_progress=True):
+        self.output_format = output_format
+        self.record_responses = record_responses
+        self.metrics_port = metrics_port
+        self.show_progress = show_progress
@@ -2,50 +2,65 @@ from crawler_base import SpotipyCrawlerBase
 import os
 import time
 import json
+import id_registry
+import shared_functions as sf
+
+# How each field is read from an artist object
+ARTIST_FIELDS = {
+	"id": lambda a: a["id"],
+	"name": lambda a: a["name"],
+	"followers": lambda a: a["followers"]["total"],
+	"popularity": lambda a: a["popularity"],
+	"genres": lambda a: a["genres"]
+}
 
 class ArtistInfoCrawler(SpotipyCrawlerBase):
+	batch_size = 50 # Spotify-imposed limit
+	fields = list(ARTIST_FIELDS)
 
 	def __init__(self, dirname, items_per_file=10000,
-                 count_threshold=100, estimate_time=False):
-		super().__init__(dirname, items_per_file, count_threshold, estimate_time)
+                 count_threshold=100, estimate_time=False, fields=None, **kwargs):
+		# Which fields of ARTIST_FIELDS to keep. Only these are read from each
+		# response.
+		self.fields = sf.select_fields(fields, ARTIST_FIELDS)
+		super().__init__(dirname, items_per_file, count_threshold, estimate_time,
+						 **kwargs)
 
 
 	def initial_setup(self):
 		print("Collecting all Artist IDs...")
+		artist_ids = id_registry.registered_ids(self.data_folder, "artists")
+		if artist_ids != None:
+			self.unsearched_items.update(artist_ids)
+			print(f"{len(self.unsearched_items)} Artist IDs found.")
+			return
 		related_artists_results_filepath = os.path.join(self.data_folder, "related_artists.json")
 		related_artists_data = json.load(open(related_artists_results_filepath, "r"))
 		all_artist_ids = set(related_artists_data.keys())
 		self.unsearched_items = all_artist_ids
 
 
-	def get_items_to_search(self):
-		items_to_search = []
-		count = 0
-		for item in self.unsearched_items:
-			items_to_search.append(item)
-			count += 1
-			if count >= 50: # Spotify-imposed limit
-				break
-		return items_to_search
-
-
 	def make_search_request(self, artists_to_search):
 		results = self.sp.artists(artists_to_search)
 		return results
 
 
 	def process_search_results(self, artists_to_search, results):
+		artists_searched = []
+		artists_not_found = {}
 		for i in range(len(artists_to_search)):
 			original_id = artists_to_search[i]
 			artist_info = results["artists"][i]
+			if artist_info == None:
+				# Spotify returns null for IDs it does not recognise
+				artists_not_found[original_id] = "Not found"
+				continue
+			artists_searched.append(original_id)
 			self.searched_items[original_id] = {
-				"id": artist_info["id"],
-        		"name": artist_info["name"],
-        		"followers": artist_info["followers"]["total"],
-        		"popularity": artist_info["popularity"],
-        		"genres": artist_info["genres"]
-        	}
-        return artists_to_search
+				field: ARTIST_FIELDS[field](artist_info) for field in self.fields
+			}
+		self.reject_items(artists_not_found)
+		return artists_searched
 
 
 	# def search_items(self, artists_to_search):
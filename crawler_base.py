@@ -3,20 +3,89 @@ import os
 import sys
 import time
 import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import re
+import random
 import shared_functions as sf
+import shard_index
+import shard_manifest
+import id_registry
+import collate
+import columnar
+import serialization as ser
+import rate_limiter as rl
+import metrics as mt
+from checkpoint_writer import CheckpointWriter, write_atomic
+from crawl_journal import CrawlJournal, JournaledSet, JournaledDict
+from sqlite_state import SqliteStateStore
+from frontier import PackedIdSet, SpillingFrontier
+from crawl_options import StorageOptions, SchedulingOptions, NetworkOptions, \
+    OutputOptions
+import scheduler as sched
+from response_cache import ResponseCache, CachedSpotify
+from replay import ResponseRecorder
 from requests.exceptions import ReadTimeout
 from OpenSSL.SSL import WantReadError
 from urllib3.exceptions import ReadTimeoutError, MaxRetryError
 from requests.exceptions import ConnectionError
 
+# Waits before each attempt at a request that keeps timing out, and the
+# shorter ladder used for the smaller batches tried when isolating a failure
+SLEEP_TIMES = [0, 0.01, 0.1, 1, 5, 10]
+ISOLATION_SLEEP_TIMES = [0, 1]
+TIMEOUT_ERRORS = (WantReadError, ReadTimeout, ReadTimeoutError, ConnectionError)
+SEARCH_ERRORS = (SpotifyException,) + TIMEOUT_ERRORS
+
+
+def is_server_error(error):
+    # A 5xx response, or the header-less 429 Spotipy raises once the session
+    # has retried 5xx responses as many times as it will. Either way the API is
+    # down, rather than anything being wrong with the items searched.
+    status = getattr(error, "http_status", None)
+    if status == None:
+        return False
+    return status >= 500 or (status == 429 and not rl.is_rate_limited(error))
+
+
+def describe_error(error):
+    # Short reason for an invalid item, e.g. "SpotifyException 404: ..."
+    status = getattr(error, "http_status", None)
+    prefix = type(error).__name__ if status == None \
+        else f"{type(error).__name__} {status}"
+    return f"{prefix}: {error}"[:200]
+
 
 class CrawlerBase():
+    batch_size = 1        # Items searched per make_search_request call
+    bulk_request = True   # Whether the API takes a whole batch in one request.
+                          # If not, make_single_request is called concurrently
+                          # for each item of the batch instead.
+    registry_kind = None  # Kind of ID published_items returns, e.g. "artists",
+                          # kept in the ID registry for downstream crawlers
+    publishes_keys = False  # Whether published_items returns just the item's
+                            # own ID, so saved items can be published from the
+                            # shard indexes without reading the shards
+
     def __init__(self, dirname, items_per_file=10000, count_threshold=100,
-                 estimate_time=False):
+                 estimate_time=False, storage=None, scheduling=None,
+                 network=None, output=None, worker_index=None, worker_count=1,
+                 feed=None, downstream=None, stop_event=None):
+        # Options are grouped by what they configure (see crawl_options.py)
+        storage = storage or StorageOptions()
+        scheduling = scheduling or SchedulingOptions()
+        network = network or NetworkOptions()
+        output = output or OutputOptions()
+
         self.searched_items = {}        # Data for current searched-but-unsaved items
         self.saved_items = set()        # IDs for saved items
         self.unsearched_items = set()   # IDs for unsearched items
-        # self.invalid_items = set()      # IDs for items that failed a search
+        self.pending_items = set()      # IDs for items with a request in flight
+        self.invalid_items = {}         # IDs for items that failed a search -> details
+        self.outbox_items = set()       # IDs found for other workers to search
+        self.fetch_times = {}           # When each searched-but-unsaved item was searched
+        self.complete = False
         
         # Overwrite with a unique directory for each individual crawler.
         # All data folders should be in a universal \data folder.
@@ -24,12 +93,71 @@ class CrawlerBase():
         self.dirname = os.path.join(self.data_folder, dirname)
         os.makedirs(self.dirname, exist_ok=True)    # Ensure output folder exists
         self.saved_prefix = "saved"
+        # How state files and shards are encoded. Any format can be loaded, so
+        # this can be changed between runs.
+        self.serializer = ser.Serializer(storage.serializer, storage.compression)
+        # Checkpoints are written by a background thread while crawling, so
+        # requests carry on while the state is serialized and saved
+        self.background_checkpoints = storage.background_checkpoints
+        self.checkpoint_writer = None
+        self.manifest = None
         self.searched_filepath = os.path.join(self.dirname, "searched.json")
         self.unsearched_filepath = os.path.join(self.dirname, "unsearched.json")
-        # self.invalid_filepath = os.path.join(self.dirname, "invalid.json")
-
-        # Record the download speed / progress, for analysis
-        self.analysis_data = []
+        self.invalid_filepath = os.path.join(self.dirname, "invalid.json")
+        # Invalid items are searched again once everything else has been, up
+        # to this many attempts in all
+        self.max_invalid_attempts = scheduling.max_invalid_attempts
+        self.retried_items = set()      # Invalid items already retried this run
+
+        # Optional append-only journal, so checkpoints only write the changes
+        self.journal = None
+        if storage.use_journal:
+            self.journal = CrawlJournal(os.path.join(self.dirname, "journal.jsonl"))
+        self.journal_min_compaction = storage.journal_min_compaction
+
+        # "json" keeps the item sets in memory; "sqlite" keeps them on disk
+        self.state_store = None
+        if storage.state_backend == "sqlite":
+            self.state_store = SqliteStateStore(
+                os.path.join(self.dirname, "state.sqlite"))
+
+        # Optionally spill the unsearched items to disk, keeping at most
+        # frontier_memory_items of them in memory. Every ID ever queued is
+        # then kept in seen_items, packed, so new IDs are checked against that.
+        # Only for crawlers whose items are Spotify IDs.
+        self.seen_items = None
+        self.frontier_filepath = os.path.join(self.dirname, "frontier.json")
+        if storage.frontier_memory_items != None:
+            self.saved_items = PackedIdSet()
+            self.seen_items = PackedIdSet(os.path.join(self.dirname, "seen.bin"))
+            self.unsearched_items = SpillingFrontier(
+                self.dirname, storage.frontier_memory_items,
+                skip=self.frontier_skip)
+
+        # Optional priority order for the unsearched items (see scheduler.py)
+        self.scheduler = sched.create_scheduler(scheduling.scheduler)
+        self.scheduler_filepath = os.path.join(self.dirname, "scheduler.json")
+        # Checkpoints between snapshots of the priorities only append the
+        # changes to this journal
+        self.scheduler_journal = CrawlJournal(
+            os.path.join(self.dirname, "scheduler.jsonl"))
+        self.scheduler_change_count = 0
+        self.scheduler_saved = False    # Whether scheduler.json is current
+        if self.scheduler != None and self.seen_items != None:
+            raise ValueError("A scheduler needs every unsearched item in memory, "
+                             "so cannot be used with the spilling frontier.")
+
+        # Refresh mode: re-search saved items fetched over refresh_max_age
+        # seconds ago (half that for items that changed when last refreshed),
+        # plus a random refresh_sample_rate of the rest, merging the new data
+        # into the shards they were saved in.
+        self.refresh_max_age = scheduling.refresh_max_age
+        self.refresh_sample_rate = scheduling.refresh_sample_rate
+        if self.refresh_max_age != None and self.seen_items != None:
+            raise ValueError("Refresh mode cannot be used with the spilling "
+                             "frontier, which skips saved items.")
+
+        # Record the total runtime / progress, so ETAs carry over between runs
         self.analysis_filepath = os.path.join(self.dirname, "analysis_data.json")
         
         # Derive certain statistics from the analysis file
@@ -41,8 +169,47 @@ class CrawlerBase():
         self.items_per_file = items_per_file   # Num artists in each saved file
         self.count_threshold = count_threshold   # Update display every threshold
         self.estimate_time = estimate_time   # Whether to include an ETA
+        self.show_progress = output.show_progress   # Reprint progress lines
         # Crawling Artist IDs cannot have an ETA as we don't know how many there
         # will be.
+        self.output_format = output.output_format   # json, jsonl or columnar
+        self.concurrency = network.concurrency   # Requests kept in flight at once
+        self.executor = None   # Thread pool for blocking requests (async mode)
+        self.rate_limiter = network.rate_limiter   # Shared rl.RateLimiter, or None
+
+        # When run as one of several workers (multi_crawl.py), only IDs whose
+        # hash falls in this worker's partition are searched here.
+        self.worker_index = worker_index
+        self.worker_count = worker_count
+        self.outbox_filepath = os.path.join(self.dirname, "outbox.json")
+        self.inbox_filepath = os.path.join(self.dirname, "inbox.json")
+
+        # When run as a pipeline stage (pipeline.py), IDs arrive from the
+        # upstream stage's feed rather than initial_setup, and IDs this stage
+        # finds are published to the downstream stages' feeds.
+        self.feed = feed
+        self.downstream = downstream or []
+        self.stop_event = stop_event   # Set to stop the crawl from another thread
+        self.batch_executor = None     # Threads for single-ID requests
+        # Published IDs are also kept in the shared ID registry (id_registry.py),
+        # which downstream crawlers' initial_setup reads from
+        self.id_registry = None
+
+        # Optionally keep every raw response, for offline replay (replay.py)
+        self.recorder = None
+        if output.record_responses:
+            self.recorder = ResponseRecorder(os.path.join(self.dirname, "raw"),
+                                             items_per_file)
+
+        # Counters / histograms for dashboards. Exported at every checkpoint to
+        # metrics.prom and metrics.jsonl, and served on metrics_port if given.
+        self.metrics = mt.MetricsRegistry(crawler=dirname)
+        self.metrics_port = output.metrics_port
+        self.metrics_server = None
+        self.metrics_filepath = os.path.join(self.dirname, "metrics.prom")
+        self.metrics_log = mt.RollingJsonlWriter(
+            os.path.join(self.dirname, "metrics.jsonl"))
+        self.setup_metrics()
         
         # Attempt to load the Saved, Searched, and Unsearched data
         self.load_saved_data()
@@ -50,59 +217,230 @@ class CrawlerBase():
         if len(self.unsearched_items) == len(self.searched_items) == \
             len(self.saved_items) == 0:
             # This is the first run of the crawler, run the initial setup
-            self.initial_setup()
+            if self.feed == None:
+                self.initial_setup()
+            if self.worker_index != None:
+                self.unsearched_items.difference_update(
+                    [i for i in self.unsearched_items if not self.owns_item(i)])
+
+        if self.seen_items != None and len(self.seen_items) == 0:
+            # First run with a frontier, or imported from unsearched.json
+            self.rebuild_seen_items()
+
+        if self.refresh_max_age != None:
+            self.queue_refresh_items()
+
+        if self.journal != None:
+            self.attach_journal()
+
+        if self.state_store != None:
+            self.adopt_initial_items()
+
+        if self.worker_index != None:
+            self.receive_inbox()
+
+        # Workers would each write the same registry, so only a single crawler
+        # registers its IDs
+        if self.registry_kind != None and self.worker_index == None:
+            self.attach_id_registry()
 
         self.show_start_printout()
 
+        if len(self.downstream) > 0:
+            self.publish_saved_results()
+
         self.crawl()
     
+    @classmethod
+    def offline_instance(cls, serializer="auto", compression=None):
+        # A crawler with empty item sets and no API client, data folder or
+        # crawl loop, for running process_search_results on recorded responses
+        # and saving the results with write_shard.
+        crawler = cls.__new__(cls)
+        crawler.serializer = ser.Serializer(serializer, compression)
+        crawler.searched_items = {}
+        crawler.saved_items = set()
+        crawler.unsearched_items = set()
+        crawler.pending_items = set()
+        crawler.outbox_items = set()
+        crawler.invalid_items = {}
+        crawler.checkpoint_writer = None
+        crawler.manifest = None
+        crawler.worker_index = None
+        crawler.seen_items = None
+        crawler.scheduler = None
+        crawler.downstream = []
+        crawler.id_registry = None
+        crawler.metrics = mt.MetricsRegistry()
+        CrawlerBase.setup_metrics(crawler)   # No API client to time
+        return crawler
+
     ### Save / Load Data #######################################################
     
     def load_saved_data(self):
-        # Load saved items
-        all_filenames = os.listdir(self.dirname)
-        filenames = [f for f in all_filenames if self.saved_prefix in f]
+        self.manifest = shard_manifest.ShardManifest(self.dirname,
+                                                     self.saved_prefix).load()
+        if self.state_store != None:
+            self.load_state_store()
+        else:
+            self.load_json_state()
+
+        outbox_data = self.load_with_backup(self.outbox_filepath)
+        if outbox_data != None:
+            self.outbox_items = set(outbox_data)
+
+        invalid_data = self.load_with_backup(self.invalid_filepath)
+        if invalid_data != None:
+            self.invalid_items = invalid_data
+
+        if self.scheduler != None:
+            self.load_scheduler()
+
+        # Load Analysis
+        self.load_analysis()
+
+
+    def receive_inbox(self):
+        # Queue IDs routed to this worker by the coordinator. The inbox is only
+        # removed once they are safely in the saved state.
+        inbox_data = self.load_with_backup(self.inbox_filepath)
+        if inbox_data == None:
+            return
+        self.add_new_items(inbox_data)
+        self.save_state()
+        self.flush_checkpoints()
+        inbox_filepath = ser.find_variant(self.inbox_filepath)
+        os.remove(inbox_filepath)
+        backup_filepath = self.backup_name(inbox_filepath)
+        if os.path.isfile(backup_filepath):
+            os.remove(backup_filepath)
+
+
+    def load_json_state(self):
+        # Load saved item IDs from the shard indexes. The shards themselves are
+        # only opened when their contents are needed.
+        filepaths = self.list_shard_paths()
         print("Loading saved files...")
         count = 0
-        for filename in filenames:
-            filepath = os.path.join(self.dirname, filename)
-            with open(filepath, "r") as f:
-                data = json.load(f)
-            self.saved_items.update(list(data.keys()))
+        for filepath in filepaths:
+            ids = shard_index.read_index(filepath)
+            if ids == None:
+                # Index lost since the shard was recorded, index it again
+                ids = list(self.load_shard(filepath).keys())
+                shard_index.write_index(filepath, ids)
+            self.saved_items.update(ids)
             count += 1
             if count % 10 == 0:
-                self.reprint(f"{count} / {len(filenames)}")
+                self.reprint(f"{count} / {len(filepaths)}")
 
         searched_data = self.load_with_backup(self.searched_filepath)
         if searched_data != None:
             self.searched_items = searched_data
 
-        unsearched_data = self.load_with_backup(self.unsearched_filepath)
-        if unsearched_data != None:
-            self.unsearched_items = set(unsearched_data)
-
-        # invalid_data = self.load_with_backup(self.invalid_filepath)
-        # if invalid_data != None:
-        #     self.invalid_items = set(invalid_data)
-
-        # Load Analysis
-        self.load_analysis()
+        if self.seen_items != None:
+            self.load_frontier()
+        else:
+            unsearched_data = self.load_with_backup(self.unsearched_filepath)
+            if unsearched_data != None:
+                self.unsearched_items = set(unsearched_data)
+
+        if self.journal != None:
+            self.journal.replay({
+                "searched": self.searched_items,
+                "unsearched": self.unsearched_items,
+                "pending": self.pending_items
+            })
+            # Items that were in flight when the last run stopped
+            self.unsearched_items.update(self.pending_items)
+            self.pending_items.clear()
+
+
+
+    def load_frontier(self):
+        frontier_data = self.load_with_backup(self.frontier_filepath)
+        if frontier_data != None:
+            self.unsearched_items.load(frontier_data["frontier"])
+            self.seen_items.load(frontier_data["seen_count"],
+                                 frontier_data["seen_string_count"])
+            # Items that were in flight when the last run stopped
+            self.unsearched_items.update(frontier_data["pending"])
+        else:
+            # Nothing logged by a run that stopped before its first checkpoint
+            # can be trusted
+            self.unsearched_items.clear()
+            self.seen_items.load(0)
+            # First run with a frontier: take over any existing unsearched.json
+            unsearched_data = self.load_with_backup(self.unsearched_filepath)
+            if unsearched_data != None:
+                self.unsearched_items.update(unsearched_data)
+
+
+    def rebuild_seen_items(self):
+        self.seen_items.update(self.saved_items)
+        self.seen_items.update(self.searched_items.keys())
+        self.seen_items.update(self.pending_items)
+        self.seen_items.update(self.unsearched_items.iter_log())
+
+
+    def frontier_skip(self, item):
+        # Items re-read from the frontier that were searched since it was read
+        return (item in self.saved_items) or (item in self.searched_items) or \
+            (item in self.pending_items) or (not self.owns_item(item))
+
+
+    def load_scheduler(self):
+        scheduler_data = self.load_with_backup(self.scheduler_filepath)
+        if scheduler_data == None or scheduler_data["name"] != self.scheduler.name:
+            if scheduler_data != None:
+                # Items are requeued at the default priority as they're needed
+                print(f"Ignoring saved priorities from the "
+                      f"'{scheduler_data['name']}' scheduler.")
+            # Any changes logged belong to those priorities
+            self.scheduler_journal.reset()
+            return
+        self.scheduler_change_count = self.scheduler_journal.replay(
+            {"priorities": scheduler_data["priorities"]})
+        self.scheduler.load(scheduler_data)
+        self.scheduler_saved = True
+
+
+    def load_state_store(self):
+        store = self.state_store
+        if store.is_empty():
+            # First run with this backend: import any existing JSON state
+            self.load_json_state()
+            store.set_table("saved").update(self.saved_items)
+            store.dict_table("searched").update(self.searched_items)
+            store.set_table("unsearched").update(self.unsearched_items)
+
+        self.saved_items = store.set_table("saved")
+        self.searched_items = store.dict_table("searched")
+        self.unsearched_items = store.set_table("unsearched")
+        self.pending_items = store.set_table("pending")
+
+        # Items that were in flight when the last run stopped
+        self.unsearched_items.update(self.pending_items)
+        self.pending_items.clear()
+        store.commit()
+
+
+    def adopt_initial_items(self):
+        # initial_setup may replace unsearched_items with a plain set
+        table = self.state_store.set_table("unsearched")
+        if self.unsearched_items is not table:
+            table.update(self.unsearched_items)
+            self.unsearched_items = table
+        self.state_store.commit()
 
 
     def save_analysis(self):
         current_runtime = time.time() - self.current_start_time + \
                                                             self.past_runtime
         current_item_count = len(self.saved_items) + len(self.searched_items)
-        self.analysis_data.append( (
-                                    current_runtime,
-                                    current_item_count,
-                                    len(self.unsearched_items)
-                                       )
-                                )
+        # Progress over time is in metrics.jsonl, so only the totals are kept
         analysis_to_save = {
             "current_item_count": current_item_count,
-            "current_runtime": current_runtime,
-            "analysis_data": self.analysis_data
+            "current_runtime": current_runtime
         }
 
         with open(self.analysis_filepath, "w") as f:
@@ -114,21 +452,35 @@ class CrawlerBase():
             analysis_to_load = json.load(open(self.analysis_filepath, "r"))
             self.starting_item_count = analysis_to_load["current_item_count"]
             self.past_runtime = analysis_to_load["current_runtime"]
-            self.analysis_data = analysis_to_load["analysis_data"]
 
 
     def save_results_subset(self):
         subset = {}
         count = 0
-        for key in self.searched_items:
-            subset[key] = self.searched_items[key]
+        for key, value in self.searched_items.items():
+            subset[key] = value
             count += 1
             if count >= self.items_per_file:
                 break
 
-        filepath = self.index_savefile_path()
-        with open(filepath, "w") as f:
-            json.dump(subset, f)
+        now = time.time()
+        fetched_at = {str(key): self.fetch_times.pop(key, now) for key in subset}
+
+        # Refreshed items are merged into the shards they were saved in
+        refreshed = {key: value for key, value in subset.items()
+                     if key in self.saved_items}
+        if len(refreshed) > 0:
+            new_items = {key: value for key, value in subset.items()
+                         if key not in refreshed}
+            # Anything no longer in a shard is saved again as new
+            new_items.update(self.merge_refreshed_items(refreshed, fetched_at))
+        else:
+            new_items = subset
+
+        if len(new_items) > 0:
+            self.run_checkpoint_job(self.write_shard_files,
+                                    self.index_savefile_path(), new_items,
+                                    fetched_at)
 
         items_saved = list(subset.keys())
         self.saved_items.update(items_saved)
@@ -139,74 +491,305 @@ class CrawlerBase():
         self.save_current_info()
 
 
+    def write_shard_files(self, filepath, subset, fetched_at):
+        filepath = self.write_shard(filepath, subset)
+        shard_index.write_index(filepath, subset.keys(), fetched_at)
+        self.manifest.record(filepath, subset.keys())
+
+
+    def merge_refreshed_items(self, refreshed, fetched_at):
+        # Rewrite each shard holding refreshed items, newest shard first, and
+        # return any items not found in a shard.
+        self.flush_checkpoints()   # Shards may still be being written
+        remaining = dict(refreshed)
+        for filepath in reversed(self.list_shard_paths()):
+            if len(remaining) == 0:
+                break
+            index_data = shard_index.read_index_data(filepath)
+            if index_data != None:
+                if not any(shard_index.index_contains(index_data, key)
+                           for key in remaining):
+                    continue
+            data = self.load_shard(filepath)
+            keys = [key for key in remaining if str(key) in data]
+            if len(keys) == 0:
+                continue
+
+            times = shard_index.read_index_times(filepath) or {}
+            shard_fetched_at = {key: value[0] for key, value in times.items()}
+            shard_flags = {key: value[1] for key, value in times.items()}
+            for key in keys:
+                value = remaining.pop(key)
+                # Items that change are refreshed more often (see needs_refresh)
+                changed = data[str(key)] != value
+                data[str(key)] = value
+                shard_fetched_at[str(key)] = fetched_at[str(key)]
+                shard_flags[str(key)] = shard_index.FLAG_CHANGED if changed else 0
+            self.rewrite_shard(filepath, data, shard_fetched_at, shard_flags)
+        return remaining
+
+
+    def rewrite_shard(self, filepath, data, fetched_at, flags):
+        # Written alongside and then swapped in, so a crash can't leave a
+        # half-written shard. The base keeps the whole extension off, e.g.
+        # saved_2 for saved_2.json.gz.
+        base = shard_index.split_shard_extension(filepath)[0]
+        for extension in ser.EXTENSIONS + [columnar.SHARD_EXTENSION]:
+            # Left over from a crash part-way through a rewrite
+            shard_index.remove_shard(f"{base}_tmp{extension}")
+        temp_filepath = self.write_shard(f"{base}_tmp.json", data)
+        new_filepath = base + shard_index.split_shard_extension(temp_filepath)[1]
+        shard_index.replace_shard(temp_filepath, new_filepath)
+        shard_index.write_index(new_filepath, data.keys(), fetched_at, flags)
+        self.manifest.record(new_filepath, data.keys())
+        if new_filepath != filepath:
+            # The crawler now saves shards in a different format. The old
+            # file goes only once the new one is indexed and recorded.
+            shard_index.remove_shard(filepath)
+
+
+    def queue_refresh_items(self):
+        now = time.time()
+        count = 0
+        for filepath in self.list_shard_paths():
+            times = shard_index.read_index_times(filepath)
+            if times == None:
+                continue
+            for item, (fetched_at, flags) in times.items():
+                if self.needs_refresh(now - fetched_at, flags) and \
+                        (item not in self.searched_items) and \
+                        (item not in self.pending_items) and self.owns_item(item):
+                    self.unsearched_items.add(item)
+                    count += 1
+        print(f"{count} saved items queued for refresh.")
+
+
+    def needs_refresh(self, age, flags):
+        max_age = self.refresh_max_age
+        if flags & shard_index.FLAG_CHANGED:
+            max_age /= 2
+        return age >= max_age or random.random() < self.refresh_sample_rate
+
+
+    def write_shard(self, filepath, subset):
+        # Returns the path written, in case a crawler uses its own shard format
+        # (the extension is also the serializer's)
+        filepath = self.serializer.path_for(filepath)
+        write_atomic(filepath, self.serializer.dumps(subset))
+        return filepath
+
+
+    def run_checkpoint_job(self, job, *args):
+        # Jobs must only be given copies of the state, as the crawl carries on
+        # changing it while they run
+        if self.checkpoint_writer != None:
+            self.checkpoint_writer.submit(job, *args)
+        else:
+            job(*args)
+
+
+    def flush_checkpoints(self):
+        # Wait for any checkpoint still being written
+        if self.checkpoint_writer != None:
+            self.checkpoint_writer.flush()
+
+
     def save_with_backup(self, filepath, data):
-        if os.path.isfile(filepath):
-            # Delete previous backup file, if it exists
-            backup_filepath = self.backup_name(filepath)
-            if os.path.isfile(backup_filepath):
-                os.remove(backup_filepath)
-            # Make pre-existing file the backup
-            os.rename(filepath, backup_filepath)
+        self.run_checkpoint_job(self.write_with_backup, filepath, data)
 
-        # Save up-to-date copy of file
-        with open(filepath, "w") as f:
-            json.dump(data, f)
+
+    def write_with_backup(self, filepath, data):
+        # filepath is named as JSON, and saved with the serializer's extension.
+        # The new copy is written in full before the previous one becomes the
+        # backup, so a crash leaves at least one of them intact.
+        filepath = self.serializer.path_for(filepath)
+        write_atomic(filepath, self.serializer.dumps(data),
+                     self.backup_name(filepath))
+
+        # Remove any copy saved in another format by an earlier run
+        for variant in ser.variants(filepath):
+            if variant != filepath:
+                for old_filepath in [variant, self.backup_name(variant)]:
+                    if os.path.isfile(old_filepath):
+                        os.remove(old_filepath)
 
 
     def load_with_backup(self, filepath):
-        # Attempt to load file
-        if os.path.isfile(filepath):
+        # Attempt to load file, in whichever format it was saved
+        filepath = self.serializer.path_for(filepath)
+        if ser.find_variant(filepath) == None:
+            # Crashed between moving the file to the backup and replacing it
+            backup_filepath = ser.find_variant(self.backup_name(filepath))
+            if backup_filepath != None:
+                return ser.load(backup_filepath)
+        filepath = ser.find_variant(filepath)
+        if filepath != None:
             try:
-                with open(filepath, "r") as f:
-                    return json.load(f)
+                return ser.load(filepath)
 
-            except json.decoder.JSONDecodeError:
+            except ser.DECODE_ERRORS:
                 # File is corrupted. Load backup instead.
                 backup_filepath = self.backup_name(filepath)
                 if os.path.isfile(backup_filepath):
-                    with open(backup_filepath, "r") as f:
-                        return json.load(f)
+                    return ser.load(backup_filepath)
 
 
     def save_current_info(self):
-        self.save_with_backup(self.searched_filepath, self.searched_items)
-        self.save_with_backup(self.unsearched_filepath, list(self.unsearched_items))
-        # self.save_with_backup(self.invalid_filepath, list(self.invalid_items))
+        with self.checkpoint_seconds.time():
+            if self.id_registry != None:
+                self.id_registry.flush()
 
-        # Save Analysis
-        self.save_analysis()
+            self.save_state()
 
+            if self.worker_index != None:
+                self.save_with_backup(self.outbox_filepath, list(self.outbox_items))
 
-    def index_savefile_path(self):
-        index = 0
-        while True:
-            filename = "{}_{}.json".format(self.saved_prefix, index)
-            filepath = os.path.join(self.dirname, filename)
-            if os.path.isfile(filepath):
-                index += 1
+            if len(self.invalid_items) > 0:
+                self.save_with_backup(self.invalid_filepath,
+                                      dict(self.invalid_items))
+
+            if self.recorder != None:
+                self.recorder.flush()
+
+            if self.scheduler != None:
+                self.save_scheduler()
+
+            # Save Analysis
+            self.save_analysis()
+
+        self.export_metrics()
+
+
+    def save_state(self):
+        if self.state_store != None:
+            # Everything since the last checkpoint is in one open transaction.
+            # It may record items as saved, so their shard must be written first.
+            self.flush_checkpoints()
+            self.state_store.commit()
+        elif self.journal != None and not self.journal_needs_compaction():
+            # Only write the changes made since the last checkpoint
+            self.flush_checkpoints()
+            self.journal.flush()
+        else:
+            self.save_snapshot()
+
+
+    def save_snapshot(self):
+        if self.journal != None:
+            # Make sure journal + old snapshot is up to date, in case we crash
+            # part-way through writing the new snapshot.
+            self.flush_checkpoints()
+            self.journal.flush()
+
+        self.save_with_backup(self.searched_filepath, dict(self.searched_items))
+        if self.seen_items != None:
+            self.save_frontier()
+        else:
+            # In-flight items have not been processed yet, so save them as unsearched
+            self.save_with_backup(self.unsearched_filepath,
+                                  list(self.unsearched_items) + list(self.pending_items))
+
+        if self.journal != None:
+            # The journal is only cleared once the snapshot is on disk
+            self.flush_checkpoints()
+            self.journal.reset()
+
+
+    def save_frontier(self):
+        # The frontier and seen logs are append-only, so the checkpoint only
+        # records how far to read them. The frontier is made durable first:
+        # an ID that is seen but in neither would never be searched.
+        frontier_data = {
+            "frontier": self.unsearched_items.checkpoint(),
+            "seen_count": self.seen_items.flush(),
+            "seen_string_count": self.seen_items.saved_string_count,
+            "pending": list(self.pending_items)
+        }
+        self.save_with_backup(self.frontier_filepath, frontier_data)
+
+
+    def save_scheduler(self):
+        # Append the priorities changed since the last checkpoint to the
+        # journal, until there are as many changes as priorities. Then the
+        # whole of them are saved, as save_snapshot does for the item sets.
+        changes = self.scheduler.take_changes()
+        self.scheduler_change_count += len(changes)
+        self.run_checkpoint_job(self.write_scheduler_changes, changes)
+        if not self.scheduler_saved or self.scheduler_change_count >= max(
+                self.journal_min_compaction, len(self.scheduler.priorities)):
+            self.save_with_backup(self.scheduler_filepath, self.scheduler.state())
+            # The journal is only cleared once the snapshot is on disk
+            self.run_checkpoint_job(self.scheduler_journal.reset)
+            self.scheduler_change_count = 0
+            self.scheduler_saved = True
+
+
+    def write_scheduler_changes(self, changes):
+        for item, priority in changes.items():
+            if priority == None:
+                self.scheduler_journal.record("priorities", "del", item)
             else:
-                return filepath
+                self.scheduler_journal.record("priorities", "set", item, priority)
+        self.scheduler_journal.flush()
+
+
+    def journal_needs_compaction(self):
+        # Compact once the journal is as large as the state it describes, so
+        # the cost of full snapshots is spread over at least as many changes.
+        state_size = len(self.searched_items) + len(self.unsearched_items)
+        return self.journal.event_count >= max(self.journal_min_compaction,
+                                               state_size)
+
+
+    def attach_journal(self):
+        # Record all further changes to the item sets in the journal, starting
+        # from a fresh snapshot of the replayed state.
+        self.searched_items = JournaledDict(self.journal, "searched",
+                                            self.searched_items)
+        self.unsearched_items = JournaledSet(self.journal, "unsearched",
+                                             self.unsearched_items)
+        self.pending_items = JournaledSet(self.journal, "pending",
+                                          self.pending_items)
+        self.save_snapshot()
+
+
+    def index_savefile_path(self):
+        return self.manifest.allocate()
+
+
+    def list_shard_paths(self):
+        return self.manifest.shard_paths()
+
+
+    def load_shard(self, filepath):
+        return shard_index.load_shard(filepath)
+
+
+    def find_saved_item(self, item_id):
+        # Look up a saved item's data, opening only the shard that holds it
+        self.flush_checkpoints()
+        for filepath in self.list_shard_paths():
+            index_data = shard_index.read_index_data(filepath)
+            if index_data == None or shard_index.index_contains(index_data, item_id):
+                data = self.load_shard(filepath)
+                if str(item_id) in data:
+                    return data[str(item_id)]
+        return None
 
 
     def backup_name(self, path):
-        path_array = path.split(".")
-        path_array.insert(-1, "_backup.")
-        return "".join(path_array)
+        # searched.json -> searched_backup.json
+        base, extension = ser.split_extension(path)
+        return base + "_backup" + extension
 
 
     def collate_results(self):
         print("\nCollating results...")
-        all_results = {}
-        for filename in os.listdir(self.dirname):
-            if self.saved_prefix in filename:
-                filepath = os.path.join(self.dirname, filename)
-                data = json.load(open(filepath, "r"))
-                all_results.update(data)
-
-        output_name = f"{os.path.basename(os.path.normpath(self.dirname))}.json"
-        output_filepath = os.path.join(self.data_folder, output_name)
-        json.dump(all_results, open(output_filepath, "w"))
-        print(f"Data collated into file: {output_filepath}")
+        output_filepath = collate.default_output_path(self.dirname,
+                                                      self.output_format)
+        count = collate.collate(self.dirname, output_filepath,
+                                self.output_format, self.saved_prefix)
+        print(f"{count} items collated into file: {output_filepath}")
 
 
     def log(self, message):
@@ -214,6 +797,63 @@ class CrawlerBase():
         with open(logpath, "a+") as l:
             l.write(f"{message}\n")
 
+    ### Metrics ##############################################################
+
+    def setup_metrics(self):
+        m = self.metrics
+        self.search_seconds = m.histogram(
+            "crawler_search_seconds", "Time per search request, including retries")
+        self.retries = m.counter(
+            "crawler_retries_total", "Search requests retried, by exception type")
+        self.items_counter = m.counter(
+            "crawler_items_total", "Items searched in this run")
+        self.checkpoint_seconds = m.histogram(
+            "crawler_checkpoint_seconds", "Time the crawl loop spends on a "
+            "checkpoint, including waiting for the checkpoint writer")
+        self.checkpoint_write_seconds = m.histogram(
+            "crawler_checkpoint_write_seconds", "Time to write a checkpoint "
+            "file or shard, on the checkpoint writer thread")
+        self.checkpoint_wait_seconds = m.histogram(
+            "crawler_checkpoint_wait_seconds", "Time the crawl loop waited for "
+            "the checkpoint writer to catch up")
+        m.add_collector(self.collect_metrics)
+
+
+    def collect_metrics(self):
+        # Sizes are read at export time rather than tracked on every change
+        m = self.metrics
+        if self.seen_items != None:
+            # May be called from the metrics server thread, so don't read ahead
+            frontier_size = self.unsearched_items.count()
+        else:
+            frontier_size = len(self.unsearched_items)
+        m.gauge("crawler_unsearched_items", "Frontier size").set(frontier_size)
+        m.gauge("crawler_pending_items", "Items with a request in flight").set(
+            len(self.pending_items))
+        m.gauge("crawler_searched_items", "Searched items not yet saved").set(
+            len(self.searched_items))
+        m.gauge("crawler_saved_items", "Items saved in shards").set(
+            len(self.saved_items))
+        m.gauge("crawler_outbox_items", "IDs found for other workers").set(
+            len(self.outbox_items))
+        m.gauge("crawler_invalid_items", "Items that failed a search").set(
+            len(self.invalid_items))
+        if self.seen_items != None:
+            m.gauge("crawler_seen_items", "IDs ever queued").set(
+                len(self.seen_items))
+        if self.current_start_time != None:
+            m.gauge("crawler_items_per_second", "Items searched per second, "
+                    "this run").set(round(self.calculate_item_rate(), 3))
+        if self.rate_limiter != None:
+            m.gauge("crawler_rate_limit", "Current request rate limit, per "
+                    "second").set(round(self.rate_limiter.rate, 3))
+
+
+    def export_metrics(self):
+        mt.write_prometheus_file(self.metrics, self.metrics_filepath)
+        self.metrics_log.write({"time": time.time(),
+                                "metrics": self.metrics.snapshot()})
+
     ### Data Functions #########################################################
     # These functions are the ones to be replaced in each Crawler
     ############################################################################
@@ -224,14 +864,7 @@ class CrawlerBase():
 
 
     def get_items_to_search(self):
-        items_to_search = []
-        count = 0
-        for item in self.unsearched_items:
-            items_to_search.append(item)
-            count += 1
-            if count >= 2:
-                break
-        return items_to_search
+        return self.next_unsearched_items(self.batch_size)
 
 
     def make_search_request(self, items_to_search):
@@ -242,6 +875,12 @@ class CrawlerBase():
         return results
 
 
+    def make_single_request(self, item):
+        # Used instead of make_search_request when bulk_request is False
+        time.sleep(1)
+        return "test"
+
+
     def process_search_results(self, items_to_search, results):
         for i in range(len(items_to_search)):
             self.searched_items[items_to_search[i]] = results[i]
@@ -249,46 +888,447 @@ class CrawlerBase():
 
 
     def clear_searched_items(self, items_searched):
+        now = time.time()
+        for item in items_searched:
+            self.fetch_times[item] = now
+        if len(self.invalid_items) > 0:
+            # Invalid items that have now been searched successfully
+            for item in items_searched:
+                self.invalid_items.pop(item, None)
         self.unsearched_items.difference_update(items_searched)
+        self.pending_items.difference_update(items_searched)
+        if self.scheduler != None:
+            self.scheduler.discard(items_searched)
+
+
+    def owns_item(self, item):
+        if self.worker_index == None:
+            return True
+        return sf.partition_index(item, self.worker_count) == self.worker_index
+
+
+    def add_new_items(self, new_ids, source=None, details=None):
+        # Queue newly discovered IDs that the crawler does not already know
+        # about. source is the item they were found from, and details (one per
+        # ID, e.g. artist objects) can inform the scheduler's priorities.
+        for i, new_id in enumerate(new_ids):
+            if not self.owns_item(new_id):
+                # Another worker's ID, handed over by the coordinator
+                self.outbox_items.add(new_id)
+            elif self.seen_items != None:
+                if new_id not in self.seen_items:
+                    self.seen_items.add(new_id)
+                    self.unsearched_items.add(new_id)
+            elif (new_id not in self.saved_items) and \
+                    (new_id not in self.searched_items) and \
+                    (new_id not in self.pending_items):
+                self.unsearched_items.add(new_id)
+                if self.scheduler != None:
+                    self.scheduler.observe(new_id, source,
+                                           None if details == None else details[i])
+
+
+    def next_unsearched_items(self, n):
+        # Up to n unsearched items, in the scheduler's order if there is one
+        if self.scheduler == None:
+            items = []
+            for item in self.unsearched_items:
+                items.append(item)
+                if len(items) >= n:
+                    break
+            return items
+
+        items = self.scheduler.peek(n, self.unsearched_items)
+        if len(items) < min(n, len(self.unsearched_items)):
+            # Some items were queued without a priority (e.g. by initial_setup)
+            self.scheduler.requeue([item for item in self.unsearched_items
+                                    if item not in self.scheduler.priorities])
+            items = self.scheduler.peek(n, self.unsearched_items)
+        return items
+
+
+    def schedule_from_graph(self, graph, roots):
+        # Prioritise the unsearched items from an already-crawled graph
+        # ({item: [linked items]}), walking it breadth-first from roots.
+        if self.scheduler == None:
+            return
+        roots = [root for root in roots if root in graph]
+        for root in roots:
+            self.scheduler.observe(root)
+        visited = set(roots)
+        queue = deque(roots)
+        while len(queue) > 0:
+            item = queue.popleft()
+            for linked_item in graph.get(item, []):
+                if linked_item in self.unsearched_items:
+                    self.scheduler.observe(linked_item, item)
+                if linked_item not in visited:
+                    visited.add(linked_item)
+                    queue.append(linked_item)
+
+
+    def published_items(self, item, data):
+        # The IDs a downstream pipeline stage needs from a searched item
+        return []
+
+
+    def publish_results(self, items_searched):
+        if len(self.downstream) == 0 and self.id_registry == None:
+            return
+        items = []
+        for item in items_searched:
+            if item in self.searched_items:
+                items += self.published_items(item, self.searched_items[item])
+        if self.id_registry != None:
+            self.id_registry.update(items)
+        for feed in self.downstream:
+            feed.put(items)
+
+
+    def attach_id_registry(self):
+        self.id_registry = id_registry.IdRegistry(
+            id_registry.registry_dirname(self.data_folder),
+            self.registry_kind).load()
+        if len(self.id_registry) == 0 and \
+                len(self.saved_items) + len(self.searched_items) > 0:
+            # Crawled before the registry existed, so register what was found
+            print("Registering IDs found so far...")
+            for items in self.iter_saved_published_items():
+                self.id_registry.update(items)
+            for item, data in self.searched_items.items():
+                self.id_registry.update(self.published_items(item, data))
+            self.id_registry.flush()
+
+
+    def publish_saved_results(self):
+        # Downstream stages only keep the IDs they had taken by their last
+        # checkpoint, so send everything found so far again on every start.
+        for items in self.iter_saved_published_items():
+            for feed in self.downstream:
+                feed.put(items)
+        self.publish_results(list(self.searched_items.keys()))
+
+
+    def iter_saved_published_items(self):
+        # Lists of the IDs published by the saved items. Only read from the
+        # shards themselves when the IDs are not the shards' keys.
+        if self.publishes_keys:
+            yield from collate.iter_saved_ids(self.dirname, self.saved_prefix)
+            return
+        for item, data in collate.iter_results(self.dirname, self.saved_prefix):
+            yield self.published_items(item, data)
+
+
+    def receive_feed(self, timeout=0):
+        if self.feed != None:
+            self.add_new_items(self.feed.drain(timeout))
+
+
+    def feed_open(self):
+        return self.feed != None and not self.feed.finished()
+
+
+    def has_items_to_search(self):
+        # While more IDs may arrive from upstream, only search full batches
+        if self.feed_open():
+            return len(self.unsearched_items) >= self.batch_size
+        return len(self.unsearched_items) > 0
+
+
+    def stop_requested(self):
+        return self.stop_event != None and self.stop_event.is_set()
+
+
+    def claim_items(self, items_to_search):
+        # Move items out of the unsearched set while their request is in flight,
+        # so that get_items_to_search does not hand them out a second time.
+        self.unsearched_items.difference_update(items_to_search)
+        self.pending_items.update(items_to_search)
+
+
+    def release_items(self, items):
+        # Return in-flight items to the unsearched set (e.g. after a cancel)
+        items = [item for item in items if item in self.pending_items]
+        self.pending_items.difference_update(items)
+        self.unsearched_items.update(items)
+        if self.scheduler != None:
+            self.scheduler.requeue(items)
+
+
+    def request_batch(self, items_to_search, partial):
+        # Single-ID requests for a batch are made concurrently, each taking its
+        # own rate limiter token. Results are kept in partial as they arrive,
+        # so a retried batch only re-requests the items that failed.
+        if self.bulk_request:
+            return self.make_search_request(items_to_search)
+        if self.batch_executor == None:
+            self.batch_executor = ThreadPoolExecutor(
+                max_workers=self.batch_size * self.concurrency)
+        futures = [(item, self.batch_executor.submit(self.request_single, item))
+                   for item in items_to_search if item not in partial]
+        error = None
+        for item, future in futures:
+            try:
+                partial[item] = future.result()
+            except Exception as e:
+                error = error or e
+        if error != None:
+            raise error
+        return [partial[item] for item in items_to_search]
+
+
+    def request_single(self, item):
+        if self.rate_limiter != None:
+            self.rate_limiter.acquire()
+        result = self.make_single_request(item)
+        if self.rate_limiter != None:
+            self.rate_limiter.on_success()
+        return result
 
 
     def search_items(self, items_to_search):
-        sleep_times = [0, 0.01, 0.1, 1, 5, 10]
-        success = False
+        partial = {}
+        try:
+            results = self.request_with_retries(items_to_search, partial,
+                                                SLEEP_TIMES)
+        except SEARCH_ERRORS as e:
+            return self.isolate_failures(items_to_search, partial, e)
+        return self.handle_results(items_to_search, results)
+
+
+    def request_with_retries(self, items_to_search, partial, sleep_times):
+        # Raises the last error once out of retries, or straight away for an
+        # error that retrying will not fix (see next_attempt)
+        attempt = 0
 
-        for t in sleep_times:
-            time.sleep(t)
+        while True:
+            time.sleep(sleep_times[attempt])
+            if self.rate_limiter != None and self.bulk_request:
+                self.rate_limiter.acquire()
             try:
-                results = self.make_search_request(items_to_search)
-                success = True
-                break
+                with self.search_seconds.time():
+                    return self.request_batch(items_to_search, partial)
 
-            except (WantReadError, ReadTimeout,
-                    ReadTimeoutError, ConnectionError) as e:
-                log_message = f"Timeout ({t}): {e}"
-                self.log(log_message)
-                continue
+            except SEARCH_ERRORS as e:
+                attempt = self.next_attempt(e, attempt, sleep_times)
+                if attempt == None:
+                    raise
+
+
+    def handle_results(self, items_to_search, results):
+        self.record_results(items_to_search, results)
+        return self.process_search_results(items_to_search, results)
 
-        if not success:
+
+    def isolate_failures(self, items_to_search, partial, error):
+        # Search a failed batch again in halves, down to single items, so that
+        # one bad ID does not stop the rest of its batch being searched. Items
+        # that still fail on their own are set aside as invalid.
+        failed = {}
+        items_searched = self.bisect_batch(items_to_search, partial, error,
+                                           failed)
+        self.reject_items(failed)
+        return items_searched
+
+
+    def bisect_batch(self, items, partial, error, failed):
+        items_searched = []
+        errors = []
+        for half in self.split_failed_batch(items, error, failed):
+            try:
+                results = self.request_with_retries(half, partial,
+                                                    ISOLATION_SLEEP_TIMES)
+            except SEARCH_ERRORS as e:
+                errors.append((half, e))
+                continue
+            items_searched += self.handle_results(half, results)
+
+        self.check_for_outage(items, errors)
+        for half, e in errors:
+            items_searched += self.bisect_batch(half, partial, e, failed)
+        return items_searched
+
+
+    # The retry and bisect decisions, shared by the sync and async drivers
+
+    def next_attempt(self, error, attempt, sleep_times):
+        # After a failed request, returns the attempt to make next, or None if
+        # the error should be raised. Throttling is handled by the rate limiter,
+        # and does not use up the retries. Only timeouts and server errors are
+        # retried.
+        if self.handle_rate_limit(error):
+            self.retries.inc(exception="RateLimited")
+            return attempt
+        if not (isinstance(error, TIMEOUT_ERRORS) or is_server_error(error)):
+            return None
+        self.log(f"Retrying ({sleep_times[attempt]}): {describe_error(error)}")
+        self.retries.inc(exception=type(error).__name__)
+        attempt += 1
+        if attempt >= len(sleep_times):
+            return None
+        return attempt
+
+
+    def record_results(self, items_to_search, results):
+        # Called with each successful response, before it is processed
+        if self.rate_limiter != None and self.bulk_request:
+            self.rate_limiter.on_success()
+        if self.recorder != None:
+            self.recorder.record(items_to_search, results)
+
+
+    def split_failed_batch(self, items, error, failed):
+        # The halves to search again after items failed with error. A single
+        # item has none, and is added to failed instead.
+        self.check_for_server_error(items, error)
+        if len(items) == 1:
+            failed[items[0]] = describe_error(error)
+            return []
+        middle = len(items) // 2
+        return [items[:middle], items[middle:]]
+
+
+    def check_for_outage(self, items, errors):
+        # Both halves of a batch timing out is far more likely to be the API
+        # being unreachable than two bad IDs, so stop rather than set the
+        # whole batch aside.
+        if len(errors) == 2 and \
+                all(isinstance(e, TIMEOUT_ERRORS) or is_server_error(e)
+                    for _, e in errors):
             print("")
-            print(f"\n{items_to_search}")
+            print(f"\n{items}")
             print("Could not process request even after 10s wait.")
-            raise
+            raise errors[-1][1]
 
-        else:
-            return self.process_search_results(items_to_search, results)
+
+    def check_for_server_error(self, items, error):
+        # Server errors are never the items' fault, so stop rather than search
+        # the batch again in halves and set items aside
+        if is_server_error(error):
+            print("")
+            print(f"\n{items}")
+            print(f"Spotify is failing requests: {describe_error(error)}")
+            raise error
+
+
+    def reject_items(self, items_to_reject):
+        # Set items aside as invalid ({item: reason}), out of the crawl until
+        # everything else has been searched (see retry_invalid_items)
+        now = int(time.time())
+        for item, reason in items_to_reject.items():
+            attempts = self.invalid_items.get(item, {}).get("attempts", 0) + 1
+            self.invalid_items[item] = {
+                "reason": reason,
+                "attempts": attempts,
+                "time": now
+            }
+        items = list(items_to_reject)
+        self.unsearched_items.difference_update(items)
+        self.pending_items.difference_update(items)
+        if self.scheduler != None:
+            self.scheduler.discard(items)
+
+
+    def retry_invalid_items(self):
+        # Once nothing else is left, queue the invalid items for another try,
+        # up to max_invalid_attempts in all. Returns True if any were queued.
+        items = [item for item, details in self.invalid_items.items()
+                 if details["attempts"] < self.max_invalid_attempts and
+                 item not in self.retried_items]
+        if len(items) == 0:
+            return False
+        self.reprint(f"Retrying {len(items)} invalid items...", True)
+        self.retried_items.update(items)
+        self.unsearched_items.update(items)
+        if self.scheduler != None:
+            self.scheduler.requeue(items)
+        return True
+
+
+    def handle_rate_limit(self, exception):
+        # Returns True if the exception was a 429 and the request can be retried
+        if self.rate_limiter == None or not rl.is_rate_limited(exception):
+            return False
+        retry_after = rl.get_retry_after(exception)
+        self.rate_limiter.on_throttle(retry_after)
+        self.log(f"Rate limited: retry after {retry_after}s, "
+                 f"rate now {self.rate_limiter.rate:.2f}/s")
+        return True
+
+
+    async def make_search_request_async(self, items_to_search, partial):
+        # Spotipy is blocking, so by default run the request in the thread pool.
+        # Crawlers with a native async client can override this instead.
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.request_batch,
+                                          items_to_search, partial)
+
+
+    async def process_search_results_async(self, items_to_search, results):
+        # Runs on the event loop thread, so the item sets are only ever
+        # modified from one thread.
+        return self.process_search_results(items_to_search, results)
+
+
+    async def search_items_async(self, items_to_search):
+        partial = {}
+        try:
+            results = await self.request_with_retries_async(
+                items_to_search, partial, SLEEP_TIMES)
+        except SEARCH_ERRORS as e:
+            return await self.isolate_failures_async(items_to_search, partial, e)
+        return await self.handle_results_async(items_to_search, results)
 
 
-    # def check_individual_items(self, items_to_reject):
-    #     for item in items_to_reject:
-    #         self.search_items([item])
+    async def request_with_retries_async(self, items_to_search, partial,
+                                         sleep_times):
+        attempt = 0
 
+        while True:
+            await asyncio.sleep(sleep_times[attempt])
+            if self.rate_limiter != None and self.bulk_request:
+                await self.rate_limiter.acquire_async()
+            try:
+                with self.search_seconds.time():
+                    return await self.make_search_request_async(
+                        items_to_search, partial)
 
-    # def reject_items(self, items_to_reject):
-    #     # Add items to invalid items
-    #     # Remove items from unsearched items
-    #     # Save
-    #     pass
+            except SEARCH_ERRORS as e:
+                attempt = self.next_attempt(e, attempt, sleep_times)
+                if attempt == None:
+                    raise
+
+
+    async def handle_results_async(self, items_to_search, results):
+        self.record_results(items_to_search, results)
+        return await self.process_search_results_async(items_to_search, results)
+
+
+    async def isolate_failures_async(self, items_to_search, partial, error):
+        failed = {}
+        items_searched = await self.bisect_batch_async(items_to_search, partial,
+                                                       error, failed)
+        self.reject_items(failed)
+        return items_searched
+
+
+    async def bisect_batch_async(self, items, partial, error, failed):
+        items_searched = []
+        errors = []
+        for half in self.split_failed_batch(items, error, failed):
+            try:
+                results = await self.request_with_retries_async(
+                    half, partial, ISOLATION_SLEEP_TIMES)
+            except SEARCH_ERRORS as e:
+                errors.append((half, e))
+                continue
+            items_searched += await self.handle_results_async(half, results)
+
+        self.check_for_outage(items, errors)
+        for half, e in errors:
+            items_searched += await self.bisect_batch_async(half, partial, e,
+                                                            failed)
+        return items_searched
 
 
     ### Other Functions ########################################################
@@ -301,6 +1341,8 @@ class CrawlerBase():
 
 
     def show_info_printout(self, endrun=False):
+        if not (self.show_progress or endrun):
+            return
         metrics = self.calculate_metrics()
 
         if endrun:
@@ -359,10 +1401,12 @@ class CrawlerBase():
         current_runtime = time.time() - self.current_start_time
         total_runtime = current_runtime + self.past_runtime
         item_rate = new_items / current_runtime
-        current_percent = total_searched / total_items
+        # A worker can start a round with nothing to search
+        current_percent = total_searched / total_items if total_items else 1
         remaining_percent = 1 - current_percent
         percent_per_second = current_percent / total_runtime
-        estimated_time_remaining = remaining_percent / percent_per_second
+        estimated_time_remaining = remaining_percent / percent_per_second \
+            if percent_per_second else 0
 
         return {
             "total_searched": total_searched,
@@ -376,49 +1420,180 @@ class CrawlerBase():
         }
 
 
+    def calculate_item_rate(self):
+        # As calculate_metrics()["item_rate"], but only from the searched and
+        # saved counts. Called from the metrics thread, which must not read the
+        # unsearched items: a spilling frontier reads ahead when its length is
+        # taken.
+        total_searched = len(self.searched_items) + len(self.saved_items)
+        new_items = total_searched - self.starting_item_count
+        return new_items / (time.time() - self.current_start_time)
+
+
     ### Main Crawl #############################################################
 
     def crawl(self):
         self.current_start_time = time.time()
-        local_count = 0
         complete = False
+        if self.metrics_port != None:
+            self.metrics_server = mt.serve_metrics(self.metrics, self.metrics_port)
+
+        if self.background_checkpoints:
+            self.checkpoint_writer = CheckpointWriter(
+                write_seconds=self.checkpoint_write_seconds,
+                wait_seconds=self.checkpoint_wait_seconds)
+
+        try:
+            if self.concurrency > 1:
+                complete = asyncio.run(self.crawl_async())
+            else:
+                complete = self.crawl_sync()
+
+        except KeyboardInterrupt:
+            self.reprint("Crawl Interrupted. Saving data...", True)
+            self.save_current_info()
+
+        finally:
+            if self.checkpoint_writer != None:
+                # Finish writing the last checkpoint
+                self.checkpoint_writer.close()
+                self.checkpoint_writer = None
+            if self.state_store != None:
+                # Every clean stop has just committed, so this only drops what
+                # a crash left uncommitted, as if the process had died, and
+                # releases the database's write lock
+                self.state_store.rollback()
+            if self.recorder != None:
+                self.recorder.close()
+            if self.seen_items != None:
+                self.unsearched_items.close()
+            if self.metrics_server != None:
+                self.metrics_server.shutdown()
+                self.metrics_server.server_close()
+            if self.batch_executor != None:
+                self.batch_executor.shutdown(wait=False, cancel_futures=True)
+                self.batch_executor = None
+            self.complete = complete
+            if complete:
+                self.reprint("Crawl Complete!", True)
+                if self.id_registry != None:
+                    self.id_registry.mark_complete()
+                for feed in self.downstream:
+                    feed.close()
+            self.show_info_printout(True)
+            if complete and self.worker_index == None:
+                # Workers' shards are collated together by the coordinator
+                self.collate_results()
+
+
+    def crawl_sync(self):
+        local_count = 0
+
+        while True:
+
+            if self.stop_requested():
+                # Handled the same as a Ctrl-C on the main thread
+                raise KeyboardInterrupt
+
+            self.receive_feed()
+
+            # Exit loop if no more items to search
+            if not self.has_items_to_search():
+                if self.feed_open():
+                    # Wait for the upstream stage to find more
+                    self.receive_feed(timeout=1)
+                    continue
+                if self.retry_invalid_items():
+                    continue
+                self.save_results_subset()
+                return True
+
+            # If over file limit, save subset
+            if len(self.searched_items) >= self.items_per_file:
+                self.save_results_subset()
+
+            items_to_search = self.get_items_to_search()
+
+            items_searched = self.search_items(items_to_search)
+
+            self.publish_results(items_searched)
+            self.clear_searched_items(items_searched)
+
+            local_count += len(items_searched)
+            self.items_counter.inc(len(items_searched))
+
+            if local_count >= self.count_threshold:
+                self.show_info_printout()
+                self.save_current_info()
+                local_count = 0
+
+
+    async def crawl_async(self):
+        # Keep up to self.concurrency requests in flight. All bookkeeping
+        # happens on the event loop thread between awaits, so the item sets
+        # stay consistent and checkpoints see a coherent state.
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        tasks = {}
+        local_count = 0
 
         try:
             while True:
 
+                if self.stop_requested():
+                    raise KeyboardInterrupt
+
+                self.receive_feed()
+
+                # Top up the in-flight requests
+                while len(tasks) < self.concurrency and \
+                        self.has_items_to_search():
+                    items_to_search = self.get_items_to_search()
+                    self.claim_items(items_to_search)
+                    task = asyncio.ensure_future(
+                        self.search_items_async(items_to_search))
+                    tasks[task] = items_to_search
+
                 # Exit loop if no more items to search
-                if len(self.unsearched_items) == 0:
+                if len(tasks) == 0:
+                    if self.feed_open():
+                        await asyncio.sleep(0.5)
+                        continue
+                    if self.retry_invalid_items():
+                        continue
                     self.save_results_subset()
-                    complete = True
-                    break
+                    return True
+
+                # Wake up now and then to take new IDs or stop, if need be
+                timeout = None if self.feed == None and self.stop_event == None \
+                    else 0.5
+                done, _ = await asyncio.wait(
+                    tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    items_to_search = tasks.pop(task)
+                    items_searched = task.result()
+                    self.publish_results(items_searched)
+                    self.clear_searched_items(items_searched)
+                    # Anything claimed but not reported as searched is retried
+                    self.release_items(items_to_search)
+                    local_count += len(items_searched)
+                    self.items_counter.inc(len(items_searched))
 
                 # If over file limit, save subset
                 if len(self.searched_items) >= self.items_per_file:
                     self.save_results_subset()
 
-                items_to_search = self.get_items_to_search()
-
-                items_searched = self.search_items(items_to_search)
-
-                self.clear_searched_items(items_searched)
-
-                local_count += len(items_searched)
-
                 if local_count >= self.count_threshold:
                     self.show_info_printout()
                     self.save_current_info()
                     local_count = 0
 
-        except KeyboardInterrupt:
-            self.reprint("Crawl Interrupted. Saving data...", True)
-            self.save_current_info()
-
         finally:
-            if complete:
-                self.reprint("Crawl Complete!", True)
-            self.show_info_printout(True)
-            if complete:
-                self.collate_results()
+            for task in tasks:
+                task.cancel()
+            self.release_items(list(self.pending_items))
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
 
 
 class SpotipyCrawlerBase(CrawlerBase):
@@ -432,10 +1607,43 @@ class SpotipyCrawlerBase(CrawlerBase):
     """
 
     def __init__(self, dirname, items_per_file=10000, count_threshold=100,
-                 estimate_time=False):
-        self.sp = sf.create_spotipy_accessor()
+                 estimate_time=False, credentials=None, client=None,
+                 network=None, **kwargs):
+        network = network or NetworkOptions()
+        # client can be any Spotipy-like client, e.g. one for the mock server
+        if client == None:
+            # Enough pooled connections for every request thread to keep one
+            pool_size = network.concurrency * self.batch_size
+            client = sf.create_spotipy_accessor(
+                credentials, pool_size, network.connect_timeout,
+                network.read_timeout, network.http_retries)
+        self.sp = client
+        if network.cache_ttl != None:
+            # Serve repeat requests from the shared on-disk response cache
+            cache = ResponseCache(os.path.join("data", "cache", "responses.sqlite"),
+                                  network.cache_ttl, network.cache_max_bytes)
+            self.sp = CachedSpotify(self.sp, cache)
+        # Each crawler gets its own adaptive limiter unless given one. Crawlers
+        # run at the same time should be given the same one, as pipeline.py
+        # does, so they share the quota.
+        if network.rate_limiter == None:
+            network = network.replace(rate_limiter=rl.RateLimiter())
         super().__init__(dirname, items_per_file, count_threshold,
-                         estimate_time)
+                         estimate_time, network=network, **kwargs)
+
+
+    def setup_metrics(self):
+        super().setup_metrics()
+        # Time the API calls themselves, underneath any response cache
+        request_seconds = self.metrics.histogram(
+            "spotify_request_seconds", "Spotify API request latency, by endpoint")
+        request_errors = self.metrics.counter(
+            "spotify_request_errors_total", "Failed Spotify API requests, by "
+            "endpoint and exception type")
+        if isinstance(self.sp, CachedSpotify):
+            self.sp.sp = mt.TimedClient(self.sp.sp, request_seconds, request_errors)
+        else:
+            self.sp = mt.TimedClient(self.sp, request_seconds, request_errors)
 
 
 if __name__ == "__main__":
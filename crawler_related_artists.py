@@ -1,35 +1,59 @@
 from crawler_base import SpotipyCrawlerBase
+from crawl_options import StorageOptions
+import graph_export
+
+SEED_ARTIST_ID = "4iHNK0tOyZPYnBU7nGAgpQ"
 
 class RelatedArtistsCrawler(SpotipyCrawlerBase):
+	# There is no bulk endpoint for related artists, so each batch is
+	# requested one artist at a time, concurrently
+	batch_size = 20
+	bulk_request = False
+	registry_kind = "artists"
+	publishes_keys = True   # See published_items
 
 	def __init__(self, dirname, items_per_file=10000,
-                 count_threshold=100, estimate_time=False):
-		super().__init__(dirname, items_per_file, count_threshold, estimate_time)
+                 count_threshold=100, estimate_time=False, graph_output=False,
+                 storage=None, scheduling=None, **kwargs):
+		self.graph_output = graph_output   # Also export the graph as CSR arrays
+		# The artist graph is too large to keep every unsearched ID in memory,
+		# unless a scheduler needs them all to order the crawl
+		if storage == None and (scheduling == None or scheduling.scheduler == None):
+			storage = StorageOptions(frontier_memory_items=100000)
+		super().__init__(dirname, items_per_file, count_threshold, estimate_time,
+						 storage=storage, scheduling=scheduling, **kwargs)
 
 
 	def initial_setup(self):
-		self.unsearched_items.add("4iHNK0tOyZPYnBU7nGAgpQ") # Add seed artist
+		self.unsearched_items.add(SEED_ARTIST_ID) # Add seed artist
+
 
+	def collate_results(self):
+		super().collate_results()
+		if self.graph_output:
+			output_dirpath = graph_export.default_output_path(self.dirname)
+			nodes, edges = graph_export.export_graph(self.dirname, output_dirpath,
+													 self.saved_prefix)
+			print(f"{nodes} nodes and {edges} edges exported to: {output_dirpath}")
 
-	def get_items_to_search(self):
-		for item in self.unsearched_items:
-			return item
 
+	def published_items(self, artist_id, related_ids):
+		# Each searched artist is passed on to the artist info and top tracks stages
+		return [artist_id]
 
-	def make_search_request(self, artist_id):
+
+	def make_single_request(self, artist_id):
 		results = self.sp.artist_related_artists(artist_id)
 		return results
 
 
-	def process_search_results(self, artist_id, results):
-		new_ids = [artist["id"] for artist in related_artists["artists"]]
-		for new_id in new_ids:
-			if (new_id not in self.saved_items) and \
-											(new_id not in self.searched_items):
-				self.unsearched_items.add(new_id)
-		self.searched_items[artist_id] = new_ids
-		# self.clear_searched_items takes in a list, so return ID as a list.
-		return [artist_id]
+	def process_search_results(self, artists_to_search, results):
+		for artist_id, artist_results in zip(artists_to_search, results):
+			new_ids = [artist["id"] for artist in artist_results["artists"]]
+			# The artist objects carry popularity, for the popularity scheduler
+			self.add_new_items(new_ids, artist_id, artist_results["artists"])
+			self.searched_items[artist_id] = new_ids
+		return artists_to_search
 
 
 	# def search_items(self, artist_id):
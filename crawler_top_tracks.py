@@ -1,39 +1,72 @@
 from crawler_base import SpotipyCrawlerBase
+from crawler_related_artists import SEED_ARTIST_ID
 import os
 import time
 import json
+import id_registry
 
 class TopTracksCrawler(SpotipyCrawlerBase):
+	# There is no bulk endpoint for top tracks, so each batch is requested
+	# one artist at a time, concurrently
+	batch_size = 20
+	bulk_request = False
+	registry_kind = "tracks"
+	market = "US"
 
 	def __init__(self, dirname, items_per_file=10000,
-                 count_threshold=100, estimate_time=False):
-		super().__init__(dirname, items_per_file, count_threshold, estimate_time)
+                 count_threshold=100, estimate_time=False, market="US", **kwargs):
+		self.market = market   # Country whose top tracks are fetched
+		super().__init__(dirname, items_per_file, count_threshold, estimate_time,
+						 **kwargs)
 
 
 	def initial_setup(self):
 		print("Collecting all Artist IDs...")
+		artist_ids = id_registry.registered_ids(self.data_folder, "artists")
+		if artist_ids != None and self.scheduler == None:
+			# Stream the IDs, rather than loading the whole graph. A scheduler
+			# needs the graph itself to order them.
+			self.unsearched_items.update(artist_ids)
+			print(f"{len(self.unsearched_items)} Artist IDs found.")
+			return
 		related_artists_results_filepath = os.path.join(self.data_folder, "related_artists.json")
 		related_artists_data = json.load(open(related_artists_results_filepath, "r"))
 		all_artist_ids = set(related_artists_data.keys())
 		self.unsearched_items = all_artist_ids
+		self.schedule_from_graph(related_artists_data, [SEED_ARTIST_ID])
+		if self.scheduler != None and self.scheduler.name == "popularity":
+			self.schedule_by_popularity()
 
 
-	def get_items_to_search(self):
-		for item in self.unsearched_items:
-			return item
+	def schedule_by_popularity(self):
+		# Popularity is only known once the artist info has been crawled
+		artist_info_filepath = os.path.join(self.data_folder, "artist_info.json")
+		if not os.path.isfile(artist_info_filepath):
+			print("No artist info found, so all artists have equal priority.")
+			return
+		artist_info_data = json.load(open(artist_info_filepath, "r"))
+		for artist_id, artist_info in artist_info_data.items():
+			if artist_id in self.unsearched_items:
+				self.scheduler.observe(artist_id, None, artist_info)
 
 
-	def make_search_request(self, artist_id):
-		results = self.sp.artist_top_tracks(artist_id)
+	def published_items(self, artist_id, top_track_ids):
+		# Each artist's top tracks are passed on to the track info stage
+		return top_track_ids
+
+
+	def make_single_request(self, artist_id):
+		results = self.sp.artist_top_tracks(artist_id, country=self.market)
 		return results
 
 
-	def process_search_results(self, artist_id, results):
-		top_track_ids = []
-		for track in results["tracks"]:
-			top_track_ids.append(track["id"])
-		self.searched_items[artist_id] = top_track_ids
-		return [artist_id]
+	def process_search_results(self, artists_to_search, results):
+		for artist_id, artist_results in zip(artists_to_search, results):
+			top_track_ids = []
+			for track in artist_results["tracks"]:
+				top_track_ids.append(track["id"])
+			self.searched_items[artist_id] = top_track_ids
+		return artists_to_search
 
 
 
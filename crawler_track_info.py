@@ -1,18 +1,134 @@
 from crawler_base import SpotipyCrawlerBase
+from checkpoint_writer import fsync_dir
 import os
 import time
 import json
+import columnar
+import shard_index
+import id_registry
+import markets
+import shared_functions as sf
 from urllib3.exceptions import MaxRetryError
 
+# Column types used when saving shards in columnar format
+TRACK_SCHEMA = [
+	("artists", "json"),
+	("duration_ms", "int32"),
+	("explicit", "bool"),
+	("id", "str"),
+	("name", "str"),
+	("popularity", "int8"),
+	("track_number", "int16"),
+	("release_date", "str"),
+	("release_date_precision", "str"),
+	("album_name", "str"),
+	("album_total_tracks", "int16"),
+	("available_markets", "json"),
+	("danceability", "float32"),
+	("energy", "float32"),
+	("key", "int8"),
+	("loudness", "float32"),
+	("mode", "int8"),
+	("speechiness", "float32"),
+	("acousticness", "float32"),
+	("instrumentalness", "float32"),
+	("liveness", "float32"),
+	("valence", "float32"),
+	("tempo", "float32"),
+	("time_signature", "int8"),
+	("duration_ms2", "int32")
+]
+
+# How each field is read from a track object
+TRACK_FIELDS = {
+	"artists": lambda t: [artist["id"] for artist in t["artists"]],
+	"duration_ms": lambda t: t["duration_ms"],
+	"explicit": lambda t: t["explicit"],
+	"id": lambda t: t["id"],
+	"name": lambda t: t["name"],
+	"popularity": lambda t: t["popularity"],
+	"track_number": lambda t: t["track_number"],
+	"release_date": lambda t: t["album"]["release_date"],
+	"release_date_precision": lambda t: t["album"]["release_date_precision"],
+	"album_name": lambda t: t["album"]["name"],
+	"album_total_tracks": lambda t: t["album"]["total_tracks"],
+	"available_markets": lambda t: t["available_markets"]
+}
+
+# Fields read from the audio features, by the name they are saved under
+AUDIO_FEATURE_FIELDS = {
+	"danceability": "danceability",
+	"energy": "energy",
+	"key": "key",
+	"loudness": "loudness",
+	"mode": "mode",
+	"speechiness": "speechiness",
+	"acousticness": "acousticness",
+	"instrumentalness": "instrumentalness",
+	"liveness": "liveness",
+	"valence": "valence",
+	"tempo": "tempo",
+	"time_signature": "time_signature",
+	"duration_ms2": "duration_ms"
+}
+
+FIELDS = [field for field, _ in TRACK_SCHEMA]
+
 class TrackInfoCrawler(SpotipyCrawlerBase):
+	batch_size = 50 # Spotify-imposed limit for sp.tracks()
+	market = None
+	fields = FIELDS
+	columnar_output = False
+	markets_format = "list"
 
 	def __init__(self, dirname, items_per_file=10000,
-                 count_threshold=100, estimate_time=False):
-		super().__init__(dirname, items_per_file, count_threshold, estimate_time)
+                 count_threshold=100, estimate_time=False, columnar_output=False,
+                 market=None, fields=None, markets_format="list", **kwargs):
+		self.columnar_output = columnar_output   # Save shards as typed column files
+		# With a market (country code), the API leaves out each track's
+		# available_markets, which are most of the response
+		self.market = market
+		if market != None:
+			if fields != None and "available_markets" in fields:
+				raise ValueError("available_markets is only returned without a market.")
+			if fields == None:
+				fields = [field for field in FIELDS if field != "available_markets"]
+		# Which fields to keep, as a subset of FIELDS. Only these are read from
+		# each response.
+		self.fields = sf.select_fields(fields, FIELDS)
+		# available_markets are saved as a "list" or a "bitmask" (see markets.py)
+		if markets_format not in markets.MARKETS_FORMATS:
+			raise ValueError(f"Unknown markets format: {markets_format}")
+		self.markets_format = markets_format
+		super().__init__(dirname, items_per_file, count_threshold, estimate_time,
+						 **kwargs)
+
+
+	def write_shard(self, filepath, subset):
+		if not self.columnar_output:
+			return super().write_shard(filepath, subset)
+		filepath = os.path.splitext(filepath)[0] + columnar.SHARD_EXTENSION
+		ids = list(subset.keys())
+		rows = [subset[track_id] for track_id in ids]
+		schema = [(field, kind) for field, kind in TRACK_SCHEMA if field in self.fields]
+		# Written alongside and then swapped in, so a crash can't leave a
+		# half-written shard
+		temp_filepath = filepath + ".tmp"
+		shard_index.remove_shard(temp_filepath)
+		columnar.write_columns(temp_filepath, ids, rows, schema)
+		shard_index.replace_shard(temp_filepath, filepath)
+		fsync_dir(os.path.dirname(filepath))
+		return filepath
 
 
 	def initial_setup(self):
 		print("Collecting all Track IDs...")
+		track_ids = id_registry.registered_ids(self.data_folder, "tracks")
+		if track_ids != None:
+			# Already deduplicated, so streamed straight into the unsearched set
+			self.unsearched_items.update(track_ids)
+			print(f"{len(self.unsearched_items)} Track IDs found.")
+			return
 		top_tracks_filepath = os.path.join(self.data_folder, "top_tracks.json")
 		top_tracks_data = json.load(open(top_tracks_filepath, "r"))
 		all_track_ids = set()
@@ -22,32 +138,24 @@ class TrackInfoCrawler(SpotipyCrawlerBase):
 		self.unsearched_items = all_track_ids
 
 
-	def get_items_to_search(self):
-		items_to_search = []
-		count = 0
-		for item in self.unsearched_items:
-			items_to_search.append(item)
-			count += 1
-			if count >= 50: # Spotify-imposed limit for sp.tracks()
-				break
-		return items_to_search
-
-
 	def make_search_request(self, tracks_to_search):
 		results = {}
-		results["info"] = self.sp.tracks(tracks_to_search)
+		results["info"] = self.sp.tracks(tracks_to_search, market=self.market)
+		if not any(field in AUDIO_FEATURE_FIELDS for field in self.fields):
+			# No audio features kept, so don't request them
+			results["af"] = [None] * len(tracks_to_search)
+			return results
 		try:
-			print("Testing...")
 			results["af"] = self.sp.audio_features(tracks_to_search)
 		except MaxRetryError:
-			print("Error 1")
+			self.log("Audio features request failed, requesting each track alone")
 			af_results = []
 			for track_id in tracks_to_search:
 				try:
 					r = self.sp.audio_features([track_id])
 					af_results += r
 				except MaxRetryError:
-					print("Error 2")
+					self.log(f"Audio features request failed for track {track_id}")
 					af_results += [None]
 			results["af"] = af_results
 
@@ -59,63 +167,37 @@ class TrackInfoCrawler(SpotipyCrawlerBase):
 		r_af = results["af"]
 
 		track_info = {}
+		tracks_not_found = {}
 
 		for i in range(len(tracks_to_search)):
 			info = {}
 			t_info = r_info["tracks"][i]
 			t_af = r_af[i]
 
-			artist_ids = []
-			for artist in t_info["artists"]:
-				artist_ids.append(artist["id"])
-			info["artists"] = artist_ids
-
-			info["duration_ms"] = t_info["duration_ms"]
-			info["explicit"] = t_info["explicit"]
-			info["id"] = t_info["id"]
-			info["name"] = t_info["name"]
-			info["popularity"] = t_info["popularity"]
-			info["track_number"] = t_info["track_number"]
-			info["release_date"] = t_info["album"]["release_date"]
-			info["release_date_precision"] = t_info["album"]["release_date_precision"]
-			info["album_name"] = t_info["album"]["name"]
-			info["album_total_tracks"] = t_info["album"]["total_tracks"]
-			info["available_markets"] = t_info["available_markets"]
-
-			if t_af != None:
-				info["danceability"] = t_af["danceability"]
-				info["energy"] = t_af["energy"]
-				info["key"] = t_af["key"]
-				info["loudness"] = t_af["loudness"]
-				info["mode"] = t_af["mode"]
-				info["speechiness"] = t_af["speechiness"]
-				info["acousticness"] = t_af["acousticness"]
-				info["instrumentalness"] = t_af["instrumentalness"]
-				info["liveness"] = t_af["liveness"]
-				info["valence"] = t_af["valence"]
-				info["tempo"] = t_af["tempo"]
-				info["time_signature"] = t_af["time_signature"]
-				info["duration_ms2"] = t_af["duration_ms"]
-
-			else:
-				info["danceability"] = None
-				info["energy"] = None
-				info["key"] = None
-				info["loudness"] = None
-				info["mode"] = None
-				info["speechiness"] = None
-				info["acousticness"] = None
-				info["instrumentalness"] = None
-				info["liveness"] = None
-				info["valence"] = None
-				info["tempo"] = None
-				info["time_signature"] = None
-				info["duration_ms2"] = None
+			if t_info == None:
+				# Spotify returns null for IDs it does not recognise
+				tracks_not_found[tracks_to_search[i]] = "Not found"
+				continue
+
+			# Only the fields kept are read, rather than building the whole
+			# record and dropping some
+			for field in self.fields:
+				if field in TRACK_FIELDS:
+					info[field] = TRACK_FIELDS[field](t_info)
+				elif t_af != None:
+					info[field] = t_af[AUDIO_FEATURE_FIELDS[field]]
+				else:
+					info[field] = None
+
+			if self.markets_format == "bitmask" and "available_markets" in info:
+				info["available_markets"] = markets.encode_markets(
+					info["available_markets"])
 
 			track_info[tracks_to_search[i]] = info
 
 		self.searched_items.update(track_info)
-		return tracks_to_search
+		self.reject_items(tracks_not_found)
+		return list(track_info.keys())
 
 
 
@@ -0,0 +1,437 @@
+"""
+Compact, disk-backed item sets for crawls that outgrow memory, e.g. walking
+the whole Spotify artist graph.
+
+Spotify IDs are 22 base62 characters encoding a 128-bit number, so each one
+packs into 16 bytes. PackedIdSet keeps them as one sorted bytearray plus a
+small set of recent additions, about 20 bytes per ID rather than the 100+ of
+a Python set of strings.
+
+SpillingFrontier holds the unsearched IDs as an append-only log on disk, with
+only a bounded chunk read into memory at a time.
+
+Anything that doesn't pack (not 22 base62 characters, or over 128 bits) is
+kept as a plain string alongside, rather than rejected.
+"""
+import os
+import bisect
+import glob
+import re
+import itertools
+
+# Spotify's base62 alphabet: digits, then lowercase, then uppercase
+BASE62 = "0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"
+BASE62_VALUES = {char: i for i, char in enumerate(BASE62)}
+ID_LENGTH = 22
+RECORD_SIZE = 16
+FENCE_STEP = 256        # Records per fence, see PackedIdSet.contains_packed
+MERGE_WINDOW = 65536    # Records rebuilt at a time by PackedIdSet.merge
+
+
+def pack_id(item_id):
+    # 22-char base62 Spotify ID -> 16 bytes, ordered like the numbers they encode
+    if not isinstance(item_id, str) or len(item_id) != ID_LENGTH:
+        raise ValueError(f"Not a Spotify ID: {item_id!r}")
+    number = 0
+    try:
+        for char in item_id:
+            number = number * 62 + BASE62_VALUES[char]
+        return number.to_bytes(RECORD_SIZE, "big")
+    except (KeyError, OverflowError):
+        raise ValueError(f"Not a Spotify ID: {item_id!r}") from None
+
+
+def unpack_id(record):
+    number = int.from_bytes(record, "big")
+    chars = []
+    for _ in range(ID_LENGTH):
+        number, remainder = divmod(number, 62)
+        chars.append(BASE62[remainder])
+    return "".join(reversed(chars))
+
+
+class _Records():
+    # Sequence view of fixed-width records in a bytes object, for bisect
+
+    def __init__(self, data):
+        self.data = data
+
+    def __len__(self):
+        return len(self.data) // RECORD_SIZE
+
+    def __getitem__(self, i):
+        return self.data[i * RECORD_SIZE:(i + 1) * RECORD_SIZE]
+
+
+def read_records(filepath, start=0, count=None):
+    with open(filepath, "rb") as f:
+        f.seek(start * RECORD_SIZE)
+        data = f.read(-1 if count == None else count * RECORD_SIZE)
+    return [data[i:i + RECORD_SIZE] for i in range(0, len(data), RECORD_SIZE)]
+
+
+def read_strings(filepath, count):
+    # The first count lines of a file of unpackable IDs, one per line
+    if count == 0 or not os.path.isfile(filepath):
+        return []
+    with open(filepath, "r", encoding="utf-8") as f:
+        lines = f.read().split("\n")
+    return lines[:count]
+
+
+def truncate_strings(filepath, count):
+    if os.path.isfile(filepath):
+        strings = read_strings(filepath, count)
+        with open(filepath, "w", encoding="utf-8") as f:
+            f.write("".join(string + "\n" for string in strings))
+
+
+def truncate_records(filepath, count):
+    # Drop anything appended after the last checkpoint
+    if os.path.isfile(filepath) and \
+            os.path.getsize(filepath) > count * RECORD_SIZE:
+        with open(filepath, "r+b") as f:
+            f.truncate(count * RECORD_SIZE)
+
+
+class PackedIdSet():
+    """
+    Add-only set of Spotify IDs. New IDs go into a small delta set, which is
+    merged into the sorted base once it reaches 1/16 of its size, so the
+    merge cost per ID stays constant. Every FENCE_STEP-th base record is also
+    kept in a list, so lookups mostly bisect in C. Given a filepath, new IDs are also
+    appended there by flush(), and load() restores the set from that file.
+    IDs that don't pack are kept in a plain set, and saved to filepath + ".str".
+    """
+
+    def __init__(self, filepath=None, merge_min=65536, load_chunk=1000000):
+        self.base = b""           # Sorted 16-byte records
+        self.fences = []          # Every FENCE_STEP-th record of the base
+        self.delta = set()        # Packed IDs not yet merged into the base
+        self.filepath = filepath
+        self.unsaved = []         # Packed IDs not yet appended to the file
+        self.saved_count = 0      # Records in the file as of the last flush
+        self.merge_min = merge_min
+        self.load_chunk = load_chunk
+        self.strings = set()      # IDs that don't pack
+        self.unsaved_strings = []
+        self.saved_string_count = 0
+        self.strings_filepath = None if filepath == None else filepath + ".str"
+
+    def __len__(self):
+        return len(self.base) // RECORD_SIZE + len(self.delta) + len(self.strings)
+
+    def __contains__(self, item_id):
+        try:
+            return self.contains_packed(pack_id(item_id))
+        except ValueError:
+            return item_id in self.strings
+
+    def contains_packed(self, record):
+        if record in self.delta:
+            return True
+        fence = bisect.bisect_right(self.fences, record) - 1
+        if fence < 0:
+            return False
+        records = _Records(self.base)
+        start = fence * FENCE_STEP
+        end = min(start + FENCE_STEP, len(records))
+        i = bisect.bisect_left(records, record, start, end)
+        return i < end and records[i] == record
+
+    def __iter__(self):
+        for i in range(0, len(self.base), RECORD_SIZE):
+            yield unpack_id(self.base[i:i + RECORD_SIZE])
+        for record in list(self.delta):
+            yield unpack_id(record)
+        for item_id in list(self.strings):
+            yield item_id
+
+    def add_string(self, item_id):
+        if item_id not in self.strings:
+            self.strings.add(item_id)
+            if self.filepath != None:
+                self.unsaved_strings.append(item_id)
+
+    def add(self, item_id):
+        try:
+            record = pack_id(item_id)
+        except ValueError:
+            self.add_string(item_id)
+            return
+        if self.contains_packed(record):
+            return
+        self.delta.add(record)
+        if self.filepath != None:
+            self.unsaved.append(record)
+        if len(self.delta) >= max(self.merge_min, len(self) // 16):
+            self.merge()
+
+    def update(self, item_ids):
+        if self.filepath != None:
+            for item_id in item_ids:
+                self.add(item_id)
+            return
+        # Nothing to write, so skip the lookups and leave merge() to drop
+        # IDs already in the base. Much faster for bulk loads.
+        threshold = max(self.merge_min, len(self) // 16)
+        for item_id in item_ids:
+            try:
+                self.delta.add(pack_id(item_id))
+            except ValueError:
+                self.strings.add(item_id)
+                continue
+            if len(self.delta) >= threshold:
+                self.merge()
+                threshold = max(self.merge_min, len(self) // 16)
+
+    def merge(self):
+        # Rebuild the base a window at a time, so only one window of records
+        # is ever held as separate objects. Windows with no new IDs are copied
+        # across as they are.
+        delta = sorted(self.delta)
+        records = _Records(self.base)
+        parts = []
+        d = 0
+        for start in range(0, len(records), MERGE_WINDOW):
+            end = min(start + MERGE_WINDOW, len(records))
+            if end == len(records):
+                d_end = len(delta)
+            else:
+                d_end = bisect.bisect_left(delta, records[end], d)
+            if d_end == d:
+                parts.append(self.base[start * RECORD_SIZE:end * RECORD_SIZE])
+                continue
+            data = self.base[start * RECORD_SIZE:end * RECORD_SIZE]
+            window = [data[i:i + RECORD_SIZE]
+                      for i in range(0, len(data), RECORD_SIZE)]
+            # Two sorted runs, which sort() merges in one pass. New IDs may
+            # already be in the base, so drop the duplicates.
+            window += delta[d:d_end]
+            window.sort()
+            parts.append(b"".join(dict.fromkeys(window)))
+            d = d_end
+        if len(records) == 0:
+            parts.append(b"".join(delta))
+        self.base = b"".join(parts)
+        self.fences = [self.base[i:i + RECORD_SIZE] for i in
+                       range(0, len(self.base), FENCE_STEP * RECORD_SIZE)]
+        self.delta = set()
+
+    def flush(self):
+        # Append new IDs to the file and return its record count, for the
+        # checkpoint to record along with saved_string_count.
+        if len(self.unsaved_strings) > 0:
+            with open(self.strings_filepath, "a", encoding="utf-8") as f:
+                f.write("".join(item_id + "\n" for item_id in self.unsaved_strings))
+                f.flush()
+                os.fsync(f.fileno())
+            self.saved_string_count += len(self.unsaved_strings)
+            self.unsaved_strings = []
+        if len(self.unsaved) > 0:
+            with open(self.filepath, "ab") as f:
+                f.write(b"".join(self.unsaved))
+                f.flush()
+                os.fsync(f.fileno())
+            self.saved_count += len(self.unsaved)
+            self.unsaved = []
+        return self.saved_count
+
+    def load(self, count, string_count=0):
+        # Restore the first count records of the file (and string_count
+        # unpackable IDs), i.e. the set as of the checkpoint that recorded
+        # them. Loaded a chunk at a time, to keep the peak memory near the
+        # final size.
+        truncate_strings(self.strings_filepath, string_count)
+        self.strings = set(read_strings(self.strings_filepath, string_count))
+        self.saved_string_count = len(self.strings)
+        truncate_records(self.filepath, count)
+        start = 0
+        while start < count:
+            chunk = read_records(self.filepath, start, min(self.load_chunk,
+                                                           count - start))
+            if len(chunk) == 0:
+                break
+            self.delta.update(chunk)
+            self.merge()
+            start += len(chunk)
+        self.saved_count = start
+
+
+class SpillingFrontier():
+    """
+    The unsearched item set as an append-only log of packed IDs on disk.
+    Added IDs are written to the end of the log, and up to max_memory_items
+    at a time are read from the front into an in-memory buffer, in the order
+    they were added. Only buffered items can be handed out or removed.
+
+    A checkpoint records the log position the buffer was read from, so after
+    a restart the buffer is re-read from there. skip(item) filters out items
+    searched since, which must be known from the crawler's other state.
+    IDs that don't pack are rare, so are held in memory and saved in the
+    checkpoint itself.
+
+    Only the crawl thread may use a frontier. Reading it fills the buffer
+    from the log, so even len() changes it. Other threads use count().
+    """
+
+    def __init__(self, dirname, max_memory_items=100000, skip=None,
+                 compact_min=1000000, prefix="frontier"):
+        self.dirname = dirname
+        self.prefix = prefix
+        self.max_memory_items = max_memory_items
+        self.skip = skip
+        self.compact_min = compact_min   # Only compact logs of this many records
+        self.buffer = {}          # Buffered IDs, in log order (dict as ordered set)
+        self.generation = 0       # Log file number, incremented on compaction
+        self.chunk_start = 0      # Log position the buffer was read from
+        self.read_count = 0       # Log records read so far
+        self.write_count = 0      # Log records written so far
+        self.writer = None
+        self.unpacked = {}        # IDs that don't pack (dict as ordered set)
+
+    def log_path(self, generation=None):
+        if generation == None:
+            generation = self.generation
+        return os.path.join(self.dirname, f"{self.prefix}_{generation}.spill")
+
+    def open_writer(self):
+        if self.writer == None:
+            self.writer = open(self.log_path(), "ab")
+        return self.writer
+
+    def __len__(self):
+        # Reading ahead here means a non-zero length always has an item to
+        # hand out, even if the unread log turns out to be skipped items.
+        self.fill()
+        return self.count()
+
+    def count(self):
+        # As len(), without reading ahead. Only reads counters, so is safe to
+        # call from another thread, e.g. for metrics.
+        return len(self.buffer) + len(self.unpacked) + \
+            self.write_count - self.read_count
+
+    def __iter__(self):
+        self.fill()
+        return itertools.chain(self.buffer, self.unpacked)
+
+    def add(self, item_id):
+        try:
+            record = pack_id(item_id)
+        except ValueError:
+            self.unpacked[item_id] = None
+            return
+        self.open_writer().write(record)
+        self.write_count += 1
+
+    def update(self, item_ids):
+        for item_id in item_ids:
+            self.add(item_id)
+
+    def discard(self, item_id):
+        self.buffer.pop(item_id, None)
+        self.unpacked.pop(item_id, None)
+
+    def difference_update(self, item_ids):
+        for item_id in item_ids:
+            self.discard(item_id)
+
+    def fill(self):
+        # Read the next chunk of the log once the buffer has been used up
+        while len(self.buffer) == 0 and self.read_count < self.write_count:
+            if self.writer != None:
+                self.writer.flush()
+            self.chunk_start = self.read_count
+            records = read_records(self.log_path(), self.read_count,
+                                   self.max_memory_items)
+            if len(records) == 0:
+                break
+            self.read_count += len(records)
+            for record in records:
+                item_id = unpack_id(record)
+                if self.skip == None or not self.skip(item_id):
+                    self.buffer[item_id] = None
+
+    def iter_log(self):
+        # Every ID added so far, including buffered and searched ones
+        if self.writer != None:
+            self.writer.flush()
+        for start in range(0, self.write_count, self.max_memory_items):
+            for record in read_records(self.log_path(), start,
+                                       min(self.max_memory_items,
+                                           self.write_count - start)):
+                yield unpack_id(record)
+        yield from list(self.unpacked)
+
+    def checkpoint(self):
+        # Make the log durable and return the state needed to resume from it
+        if self.writer != None:
+            self.writer.flush()
+            os.fsync(self.writer.fileno())
+        if self.chunk_start >= self.compact_min and \
+                self.chunk_start * 2 >= self.write_count:
+            self.compact()
+        return {
+            "generation": self.generation,
+            "chunk_start": self.chunk_start,
+            "write_count": self.write_count,
+            "unpacked": list(self.unpacked)
+        }
+
+    def compact(self):
+        # Copy the still-needed end of the log into a new file. The previous
+        # file is kept, as the backup checkpoint may still refer to it.
+        if self.writer != None:
+            self.writer.close()
+            self.writer = None
+        old_path = self.log_path()
+        self.generation += 1
+        with open(old_path, "rb") as source, open(self.log_path(), "wb") as f:
+            source.seek(self.chunk_start * RECORD_SIZE)
+            while True:
+                data = source.read(self.max_memory_items * RECORD_SIZE)
+                if len(data) == 0:
+                    break
+                f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        self.read_count -= self.chunk_start
+        self.write_count -= self.chunk_start
+        self.chunk_start = 0
+        self.remove_old_logs(self.generation - 1)
+
+    def remove_old_logs(self, keep_from):
+        pattern = re.compile(rf"^{self.prefix}_(\d+)\.spill$")
+        for filepath in glob.glob(os.path.join(self.dirname, "*.spill")):
+            match = pattern.match(os.path.basename(filepath))
+            if match and int(match.group(1)) < keep_from:
+                os.remove(filepath)
+
+    def clear(self):
+        # Start again from an empty log, removing any left by a run that
+        # stopped before its first checkpoint
+        self.close()
+        self.remove_old_logs(float("inf"))
+        self.buffer = {}
+        self.unpacked = {}
+        self.generation = self.chunk_start = self.read_count = self.write_count = 0
+
+    def load(self, state):
+        # Resume from a checkpoint: drop anything logged after it, and re-read
+        # the buffer from where it was read last time.
+        if self.writer != None:
+            self.writer.close()
+            self.writer = None
+        self.generation = state["generation"]
+        self.write_count = state["write_count"]
+        self.chunk_start = self.read_count = state["chunk_start"]
+        self.buffer = {}
+        self.unpacked = dict.fromkeys(item_id for item_id in state["unpacked"]
+                                      if self.skip == None or not self.skip(item_id))
+        truncate_records(self.log_path(), self.write_count)
+
+    def close(self):
+        if self.writer != None:
+            self.writer.close()
+            self.writer = None
@@ -0,0 +1,188 @@
+"""
+Exports the related artists graph as compressed sparse rows (CSR), for graph
+analysis without parsing the collated JSON. Artist IDs are interned to dense
+node numbers, in the order they are first seen, and the graph folder holds:
+
+    offsets.bin      int64, nodes + 1: node n's neighbours are
+                     neighbours[offsets[n]:offsets[n+1]]
+    neighbours.bin   int32, one per edge, the related artists' node numbers
+    ids.bin          the artist ID of each node, as fixed-width ASCII records
+    graph.json       node and edge counts, and each file's NumPy dtype
+
+Artists that were found but not searched yet are nodes with no neighbours.
+Every file is little-endian and can be opened with numpy.memmap, or with
+load_graph() below.
+
+    python graph_export.py data/related_artists
+"""
+import os
+import sys
+import json
+import argparse
+from array import array
+import collate
+import shard_index
+
+GRAPH_EXTENSION = ".graph"
+
+
+def default_output_path(dirname):
+    # data/related_artists is exported to data/related_artists.graph
+    return os.path.normpath(dirname) + GRAPH_EXTENSION
+
+
+def write_array(f, values):
+    if sys.byteorder == "big":
+        values.byteswap()
+    values.tofile(f)
+
+
+def read_array(filepath, typecode):
+    values = array(typecode)
+    with open(filepath, "rb") as f:
+        values.frombytes(f.read())
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def export_graph(dirname, output_dirpath=None, prefix="saved"):
+    # Returns (nodes, edges). Reads one shard at a time, so memory use is the
+    # ID table and collate's set of the IDs read (both growing with the number
+    # of artists), 16 bytes per node and 4 bytes per edge.
+    if output_dirpath == None:
+        output_dirpath = default_output_path(dirname)
+    node_ids = {}          # Artist ID -> node number
+    neighbours = array("i")
+    starts = array("q")    # Node number -> row start in neighbours, -1 if unsearched
+    ends = array("q")      # Node number -> row end in neighbours
+    searched = 0
+
+    def intern(artist_id):
+        node = node_ids.get(artist_id)
+        if node == None:
+            node = node_ids[artist_id] = len(node_ids)
+            starts.append(-1)
+            ends.append(-1)
+        return node
+
+    for artist_id, related_ids in collate.iter_results(dirname, prefix):
+        node = intern(artist_id)
+        start = len(neighbours)
+        neighbours.extend(intern(related_id) for related_id in related_ids)
+        starts[node] = start
+        ends[node] = len(neighbours)
+        searched += 1
+
+    # Rows were read in shard order, so are written out in node order
+    temp_dirpath = output_dirpath + ".tmp"
+    shard_index.remove_shard(temp_dirpath)
+    os.makedirs(temp_dirpath)
+    offsets = array("q", [0])
+    with open(os.path.join(temp_dirpath, "neighbours.bin"), "wb") as f:
+        for node in range(len(node_ids)):
+            if starts[node] >= 0:
+                row = neighbours[starts[node]:ends[node]]
+                write_array(f, row)
+                offsets.append(offsets[-1] + len(row))
+            else:
+                offsets.append(offsets[-1])
+    with open(os.path.join(temp_dirpath, "offsets.bin"), "wb") as f:
+        write_array(f, offsets)
+
+    width = max((len(artist_id) for artist_id in node_ids), default=1)
+    with open(os.path.join(temp_dirpath, "ids.bin"), "wb") as f:
+        # Dicts keep insertion order, which is node order
+        f.write(b"".join(artist_id.encode("ascii").ljust(width, b"\0")
+                         for artist_id in node_ids))
+
+    meta = {
+        "nodes": len(node_ids),
+        "edges": len(neighbours),
+        "searched": searched,
+        "offsets": {"file": "offsets.bin", "dtype": "<i8"},
+        "neighbours": {"file": "neighbours.bin", "dtype": "<i4"},
+        "ids": {"file": "ids.bin", "dtype": f"S{width}"}
+    }
+    with open(os.path.join(temp_dirpath, "graph.json"), "w") as f:
+        json.dump(meta, f)
+    shard_index.replace_shard(temp_dirpath, output_dirpath)
+    return len(node_ids), len(neighbours)
+
+
+class CSRGraph():
+    # offsets, neighbours and ids are numpy memmaps if NumPy is installed,
+    # otherwise arrays (and a list of IDs) read into memory
+
+    def __init__(self, dirpath, use_numpy=None):
+        with open(os.path.join(dirpath, "graph.json"), "r") as f:
+            self.meta = json.load(f)
+        if use_numpy == None:
+            use_numpy = has_numpy()
+        self.node_ids = None
+
+        if use_numpy:
+            import numpy as np
+            def open_array(name):
+                info = self.meta[name]
+                filepath = os.path.join(dirpath, info["file"])
+                if os.path.getsize(filepath) == 0:
+                    # An empty file can't be memory-mapped
+                    return np.zeros(0, dtype=info["dtype"])
+                return np.memmap(filepath, dtype=info["dtype"], mode="r")
+            self.offsets = open_array("offsets")
+            self.neighbours = open_array("neighbours")
+            self.ids = open_array("ids")
+        else:
+            self.offsets = read_array(os.path.join(dirpath, "offsets.bin"), "q")
+            self.neighbours = read_array(os.path.join(dirpath, "neighbours.bin"),
+                                         "i")
+            width = int(self.meta["ids"]["dtype"][1:])
+            with open(os.path.join(dirpath, "ids.bin"), "rb") as f:
+                data = f.read()
+            self.ids = [data[i:i+width]
+                        for i in range(0, len(data), width)]
+
+    def __len__(self):
+        return self.meta["nodes"]
+
+    def artist_id(self, node):
+        return bytes(self.ids[node]).rstrip(b"\0").decode("ascii")
+
+    def node(self, artist_id):
+        # Builds the reverse lookup on first use
+        if self.node_ids == None:
+            self.node_ids = {self.artist_id(node): node
+                             for node in range(len(self))}
+        return self.node_ids[artist_id]
+
+    def neighbours_of(self, node):
+        return self.neighbours[self.offsets[node]:self.offsets[node + 1]]
+
+    def degree(self, node):
+        return int(self.offsets[node + 1] - self.offsets[node])
+
+
+def has_numpy():
+    try:
+        import numpy
+        return True
+    except ImportError:
+        return False
+
+
+def load_graph(dirpath, use_numpy=None):
+    return CSRGraph(dirpath, use_numpy)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the related artists "
+                                     "graph as CSR arrays.")
+    parser.add_argument("dirname", help="Crawler data folder, e.g. data/related_artists")
+    parser.add_argument("--output", default=None, help="Output folder path")
+    parser.add_argument("--prefix", default="saved", help="Shard filename prefix")
+    args = parser.parse_args()
+
+    output_dirpath = args.output or default_output_path(args.dirname)
+    nodes, edges = export_graph(args.dirname, output_dirpath, args.prefix)
+    print(f"{nodes} nodes and {edges} edges exported to: {output_dirpath}")
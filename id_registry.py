@@ -0,0 +1,102 @@
+"""
+A shared, on-disk registry of the IDs each crawler passes on to the next, so
+a downstream crawler's initial_setup can stream them rather than load the
+whole of the upstream crawler's collated results:
+
+    data/ids/artists.bin    Searched artists (from related_artists)
+    data/ids/tracks.bin     Top tracks found (from top_tracks)
+
+Each ID is stored once, packed as the 128-bit number it encodes (see
+frontier.pack_id), in the order it was registered, so its position in the
+file is its interned number. Anything that doesn't pack is kept as text in
+the .bin.str file alongside. The accompanying .json file records how many
+of each had been written as of the last checkpoint, and whether the crawler
+writing them has completed.
+"""
+import os
+import json
+from checkpoint_writer import write_atomic
+from frontier import PackedIdSet, read_records, read_strings, unpack_id
+
+LOAD_CHUNK = 100000
+
+
+def registry_dirname(data_folder):
+    return os.path.join(data_folder, "ids")
+
+
+class IdRegistry():
+    # Only one crawler may register each kind of ID
+
+    def __init__(self, dirname, kind):
+        os.makedirs(dirname, exist_ok=True)
+        self.filepath = os.path.join(dirname, f"{kind}.bin")
+        self.meta_filepath = os.path.join(dirname, f"{kind}.json")
+        self.ids = PackedIdSet(self.filepath)
+        self.complete = False
+        self.saved_meta = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def load(self):
+        # Returns self, restored to the last checkpoint
+        meta = load_meta(self.meta_filepath)
+        if meta == None:
+            meta = {"count": 0, "string_count": 0, "complete": False}
+        self.ids.load(meta["count"], meta["string_count"])
+        self.complete = meta["complete"]
+        self.saved_meta = meta
+        return self
+
+    def update(self, item_ids):
+        # IDs that don't pack are kept as strings, rather than failing the crawl
+        for item_id in item_ids:
+            # Local files in a playlist or chart have no track ID
+            if item_id != None:
+                self.ids.add(item_id)
+
+    def flush(self):
+        # Called at each checkpoint, before the crawler's own state is saved,
+        # so the registry always holds every ID the saved state has found
+        meta = {"count": self.ids.flush(),
+                "string_count": self.ids.saved_string_count,
+                "complete": self.complete}
+        if meta != self.saved_meta:
+            write_atomic(self.meta_filepath, json.dumps(meta).encode("utf-8"))
+            self.saved_meta = meta
+
+    def mark_complete(self):
+        self.complete = True
+        self.flush()
+
+
+def load_meta(meta_filepath):
+    if not os.path.isfile(meta_filepath):
+        return None
+    with open(meta_filepath, "r") as f:
+        return json.load(f)
+
+
+def iter_ids(filepath, count, string_count=0):
+    # Registered IDs in order, read a chunk at a time, then any that don't pack
+    start = 0
+    while start < count:
+        chunk = read_records(filepath, start, min(LOAD_CHUNK, count - start))
+        if len(chunk) == 0:
+            break
+        for record in chunk:
+            yield unpack_id(record)
+        start += len(chunk)
+    yield from read_strings(filepath + ".str", string_count)
+
+
+def registered_ids(data_folder, kind):
+    # An iterator over the IDs registered by a completed upstream crawler, or
+    # None if it has not completed (or ran before the registry existed)
+    dirname = registry_dirname(data_folder)
+    meta = load_meta(os.path.join(dirname, f"{kind}.json"))
+    if meta == None or not meta["complete"]:
+        return None
+    return iter_ids(os.path.join(dirname, f"{kind}.bin"), meta["count"],
+                    meta["string_count"])
@@ -0,0 +1,55 @@
+"""
+Compact storage for a track's available_markets, which is most of the size of
+a track's data: a list of up to 184 country codes becomes a hex string of at
+most 46 characters, a bitmask over the fixed COUNTRIES table below.
+
+    encode_markets(["GB", "US"])    -> "10000000000000000000000000000100000000000000"
+    decode_markets("1000...0000")   -> ["GB", "US"]
+
+Bit i is COUNTRIES[i], so the table must never be reordered. New markets are
+only ever added at the end. A list holding a code not in the table is kept as
+a list, so nothing is lost.
+"""
+
+# Spotify's markets (ISO 3166-1 alpha-2), as of the table being written
+COUNTRIES = [
+    "AD", "AE", "AG", "AL", "AM", "AO", "AR", "AT", "AU", "AZ", "BA", "BB",
+    "BD", "BE", "BF", "BG", "BH", "BI", "BJ", "BN", "BO", "BR", "BS", "BT",
+    "BW", "BY", "BZ", "CA", "CD", "CG", "CH", "CI", "CL", "CM", "CO", "CR",
+    "CV", "CW", "CY", "CZ", "DE", "DJ", "DK", "DM", "DO", "DZ", "EC", "EE",
+    "EG", "ES", "ET", "FI", "FJ", "FM", "FR", "GA", "GB", "GD", "GE", "GH",
+    "GM", "GN", "GQ", "GR", "GT", "GW", "GY", "HK", "HN", "HR", "HT", "HU",
+    "ID", "IE", "IL", "IN", "IQ", "IS", "IT", "JM", "JO", "JP", "KE", "KG",
+    "KH", "KI", "KM", "KN", "KR", "KW", "KZ", "LA", "LB", "LC", "LI", "LK",
+    "LR", "LS", "LT", "LU", "LV", "LY", "MA", "MC", "MD", "ME", "MG", "MH",
+    "MK", "ML", "MN", "MO", "MR", "MT", "MU", "MV", "MW", "MX", "MY", "MZ",
+    "NA", "NE", "NG", "NI", "NL", "NO", "NP", "NR", "NZ", "OM", "PA", "PE",
+    "PG", "PH", "PK", "PL", "PS", "PT", "PW", "PY", "QA", "RO", "RS", "RW",
+    "SA", "SB", "SC", "SE", "SG", "SI", "SK", "SL", "SM", "SN", "SR", "ST",
+    "SV", "SZ", "TD", "TG", "TH", "TJ", "TL", "TN", "TO", "TR", "TT", "TV",
+    "TW", "TZ", "UA", "UG", "US", "UY", "UZ", "VC", "VE", "VN", "VU", "WS",
+    "XK", "ZA", "ZM", "ZW"
+]
+COUNTRY_BITS = {country: i for i, country in enumerate(COUNTRIES)}
+
+MARKETS_FORMATS = ["list", "bitmask"]
+
+
+def encode_markets(markets):
+    # A hex string rather than an int, as a mask of over 64 bits can't be
+    # saved by orjson or msgpack
+    mask = 0
+    for market in markets:
+        bit = COUNTRY_BITS.get(market)
+        if bit == None:
+            return list(markets)
+        mask |= 1 << bit
+    return format(mask, "x")
+
+
+def decode_markets(value):
+    # Accepts either form, so data saved as lists still reads the same
+    if value == None or isinstance(value, list):
+        return value
+    mask = int(value, 16)
+    return [country for i, country in enumerate(COUNTRIES) if mask >> i & 1]
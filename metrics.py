@@ -0,0 +1,242 @@
+import os
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Seconds, suitable for both API requests and checkpoints
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(label_key, extra=None):
+    items = list(label_key) + list(extra or [])
+    if len(items) == 0:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+class Metric():
+    kind = None
+
+    def __init__(self, registry, name, description):
+        self.registry = registry
+        self.name = name
+        self.description = description
+        self.values = {}   # label key -> value
+
+    def labelled(self, labels):
+        # Labels common to the whole registry (e.g. crawler name) come first
+        merged = dict(self.registry.labels)
+        merged.update(labels)
+        return _label_key(merged)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.labelled(labels)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        return [f"{self.name}{_format_labels(k)} {v}" for k, v in self.values.items()]
+
+    def snapshot(self):
+        return [{"labels": dict(k), "value": v} for k, v in self.values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self.labelled(labels)
+        with self.registry.lock:
+            self.values[key] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, registry, name, description, buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, description)
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        key = self.labelled(labels)
+        with self.registry.lock:
+            if key not in self.values:
+                self.values[key] = {"counts": [0] * len(self.buckets),
+                                    "sum": 0, "count": 0}
+            data = self.values[key]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data["counts"][i] += 1
+            data["sum"] += value
+            data["count"] += 1
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def render(self):
+        lines = []
+        for key, data in self.values.items():
+            for bound, count in zip(self.buckets, data["counts"]):
+                lines.append(f"{self.name}_bucket"
+                             f"{_format_labels(key, [('le', bound)])} {count}")
+            lines.append(f"{self.name}_bucket"
+                         f"{_format_labels(key, [('le', '+Inf')])} {data['count']}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {data['sum']}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {data['count']}")
+        return lines
+
+    def snapshot(self):
+        return [{"labels": dict(k), "count": d["count"], "sum": round(d["sum"], 6)}
+                for k, d in self.values.items()]
+
+
+class _Timer():
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class MetricsRegistry():
+    """
+    Counters, gauges and histograms for a crawler, exportable as Prometheus
+    text or as a JSON snapshot. Collectors are called before every export to
+    refresh gauges that are cheaper to read on demand (e.g. frontier size).
+    """
+
+    def __init__(self, **labels):
+        self.labels = labels
+        self.metrics = {}
+        self.collectors = []
+        self.lock = threading.Lock()
+
+    def _get(self, cls, name, description, **kwargs):
+        if name not in self.metrics:
+            self.metrics[name] = cls(self, name, description, **kwargs)
+        return self.metrics[name]
+
+    def counter(self, name, description):
+        return self._get(Counter, name, description)
+
+    def gauge(self, name, description):
+        return self._get(Gauge, name, description)
+
+    def histogram(self, name, description, buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, description, buckets=buckets)
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def collect(self):
+        for collector in self.collectors:
+            collector()
+
+    def to_prometheus(self):
+        self.collect()
+        lines = []
+        with self.lock:
+            for metric in self.metrics.values():
+                lines.append(f"# HELP {metric.name} {metric.description}")
+                lines.append(f"# TYPE {metric.name} {metric.kind}")
+                lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        self.collect()
+        with self.lock:
+            return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+
+def write_prometheus_file(registry, filepath):
+    # Written atomically, for node_exporter's textfile collector
+    temp_filepath = filepath + ".tmp"
+    with open(temp_filepath, "w") as f:
+        f.write(registry.to_prometheus())
+    os.replace(temp_filepath, filepath)
+
+
+class RollingJsonlWriter():
+    # Appends one JSON snapshot per line, rotating the file when it gets large
+
+    def __init__(self, filepath, max_bytes=10*1024**2, backups=3):
+        self.filepath = filepath
+        self.max_bytes = max_bytes
+        self.backups = backups
+
+    def write(self, record):
+        if os.path.isfile(self.filepath) and \
+                os.path.getsize(self.filepath) >= self.max_bytes:
+            self.rotate()
+        with open(self.filepath, "a") as f:
+            f.write(json.dumps(record))
+            f.write("\n")
+
+    def rotate(self):
+        # metrics.jsonl -> metrics.jsonl.1 -> ... -> metrics.jsonl.<backups>
+        for i in range(self.backups - 1, 0, -1):
+            source = f"{self.filepath}.{i}"
+            if os.path.isfile(source):
+                os.replace(source, f"{self.filepath}.{i + 1}")
+        os.replace(self.filepath, f"{self.filepath}.1")
+
+
+class TimedClient():
+    # Wraps an API client, timing each method call per endpoint
+
+    def __init__(self, client, histogram, errors):
+        self.client = client
+        self.histogram = histogram
+        self.errors = errors
+
+    def __getattr__(self, attr):
+        value = getattr(self.client, attr)
+        if not callable(value):
+            return value
+
+        def timed(*args, **kwargs):
+            with self.histogram.time(endpoint=attr):
+                try:
+                    return value(*args, **kwargs)
+                except Exception as e:
+                    self.errors.inc(endpoint=attr, exception=type(e).__name__)
+                    raise
+        return timed
+
+
+def serve_metrics(registry, port, host="0.0.0.0"):
+    # Serve /metrics for Prometheus to scrape, from a background thread
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            body = registry.to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
@@ -0,0 +1,344 @@
+"""
+A local stand-in for the parts of the Spotify Web API the crawlers use, built
+on a synthetic, deterministic artist graph. Supports added latency, injected
+429s (with Retry-After) and slow responses that trip client timeouts, so the
+crawlers can be tested and benchmarked without live credentials.
+
+    python mock_spotify_server.py --artists 5000 --latency 0.05 --port 8090
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import shared_functions as sf
+from frontier import BASE62, BASE62_VALUES
+
+ID_BITS = 128
+ID_MASK = (1 << ID_BITS) - 1
+MULTIPLIER = 0x9E3779B97F4A7C15F39CC0605CEDC835   # Odd, so invertible mod 2^128
+INVERSE = pow(MULTIPLIER, -1, 1 << ID_BITS)
+TRACK_FLAG = 1 << 100
+
+MARKETS = ["AD", "AR", "AT", "AU", "BE", "BR", "CA", "CH", "DE", "DK", "ES",
+           "FI", "FR", "GB", "IE", "IT", "JP", "MX", "NL", "NO", "NZ", "PL",
+           "PT", "SE", "US"]
+GENRES = ["pop", "rock", "indie", "jazz", "hip hop", "folk", "electronic",
+          "classical", "metal", "soul"]
+
+
+def encode_base62(number, length=22):
+    chars = []
+    for _ in range(length):
+        number, remainder = divmod(number, 62)
+        chars.append(BASE62[remainder])
+    return "".join(reversed(chars))
+
+
+def decode_base62(text):
+    number = 0
+    for char in text:
+        number = number * 62 + BASE62_VALUES[char]
+    return number
+
+
+class SyntheticCatalog():
+    """
+    num_artists artists, each with related_count related artists and
+    tracks_per_artist top tracks. IDs are 22-char base62 strings made by an
+    invertible scramble of the item's index, so lookups need no tables. They
+    are spread over the whole 128-bit range, as Spotify's are. Every
+    artist links to the next one, so the whole graph is reachable from any
+    seed.
+    """
+
+    def __init__(self, num_artists=2000, related_count=20, tracks_per_artist=10,
+                 seed=0, seed_artist_id=None):
+        self.num_artists = num_artists
+        self.related_count = related_count
+        self.tracks_per_artist = tracks_per_artist
+        self.seed = seed
+        # Lets a crawler's hard-coded seed artist map onto artist 0
+        self.seed_artist_id = seed_artist_id
+
+    def make_id(self, number):
+        return encode_base62(((number + self.seed) * MULTIPLIER) & ID_MASK)
+
+    def parse_id(self, item_id):
+        if item_id == self.seed_artist_id:
+            return 0
+        try:
+            number = decode_base62(item_id)
+        except KeyError:
+            return None
+        if len(item_id) != 22 or number > ID_MASK:
+            return None
+        return ((number * INVERSE) & ID_MASK) - self.seed
+
+    def artist_id(self, index):
+        if index == 0 and self.seed_artist_id != None:
+            return self.seed_artist_id
+        return self.make_id(index)
+
+    def track_id(self, index):
+        return self.make_id(TRACK_FLAG + index)
+
+    def artist_index(self, item_id):
+        number = self.parse_id(item_id)
+        if number == None or not 0 <= number < self.num_artists:
+            return None
+        return number
+
+    def track_index(self, item_id):
+        number = self.parse_id(item_id)
+        if number == None:
+            return None
+        number -= TRACK_FLAG
+        if not 0 <= number < self.num_artists * self.tracks_per_artist:
+            return None
+        return number
+
+    def rng(self, kind, index):
+        return random.Random(f"{self.seed}:{kind}:{index}")
+
+    def artist(self, index):
+        rng = self.rng("artist", index)
+        return {
+            "id": self.artist_id(index),
+            "name": f"Artist {index}",
+            "type": "artist",
+            "popularity": rng.randint(0, 100),
+            "followers": {"href": None, "total": rng.randint(0, 10**7)},
+            "genres": rng.sample(GENRES, rng.randint(0, 3))
+        }
+
+    def related_artists(self, index):
+        rng = self.rng("related", index)
+        count = min(self.related_count, self.num_artists - 1)
+        related = {(index + 1) % self.num_artists}
+        while len(related) < count:
+            other = rng.randrange(self.num_artists)
+            if other != index:
+                related.add(other)
+        return [self.artist(i) for i in sorted(related)]
+
+    def track(self, index, market=None):
+        rng = self.rng("track", index)
+        artist_index = index // self.tracks_per_artist
+        track = {
+            "id": self.track_id(index),
+            "name": f"Track {index}",
+            "type": "track",
+            "duration_ms": rng.randint(60000, 400000),
+            "explicit": rng.random() < 0.2,
+            "popularity": rng.randint(0, 100),
+            "track_number": index % self.tracks_per_artist + 1,
+            "artists": [{"id": self.artist_id(artist_index),
+                         "name": f"Artist {artist_index}", "type": "artist"}],
+            "album": {
+                "name": f"Album {artist_index}",
+                "release_date": f"{rng.randint(1960, 2020)}-01-01",
+                "release_date_precision": "day",
+                "total_tracks": self.tracks_per_artist,
+                "available_markets": list(MARKETS)
+            }
+        }
+        # As with the real API, a market replaces the markets list
+        if market == None:
+            track["available_markets"] = rng.sample(MARKETS, rng.randint(1, len(MARKETS)))
+        else:
+            track["is_playable"] = True
+        return track
+
+    def top_tracks(self, artist_index, market=None):
+        start = artist_index * self.tracks_per_artist
+        return [self.track(i, market)
+                for i in range(start, start + self.tracks_per_artist)]
+
+    def audio_features(self, index):
+        rng = self.rng("features", index)
+        # Some tracks have no audio features, as on the real API
+        if rng.random() < 0.02:
+            return None
+        return {
+            "id": self.track_id(index),
+            "danceability": round(rng.random(), 3),
+            "energy": round(rng.random(), 3),
+            "key": rng.randint(0, 11),
+            "loudness": round(rng.uniform(-40, 0), 3),
+            "mode": rng.randint(0, 1),
+            "speechiness": round(rng.random(), 4),
+            "acousticness": round(rng.random(), 4),
+            "instrumentalness": round(rng.random(), 4),
+            "liveness": round(rng.random(), 4),
+            "valence": round(rng.random(), 3),
+            "tempo": round(rng.uniform(60, 200), 3),
+            "time_signature": rng.choice([3, 4, 4, 4, 5]),
+            "duration_ms": rng.randint(60000, 400000)
+        }
+
+
+class MockSpotifyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # Keep-alive, like the real API
+    disable_nagle_algorithm = True  # Headers and body are written separately
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, data, headers=None):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status, message, headers=None):
+        self.send_json(status, {"error": {"status": status, "message": message}},
+                       headers)
+
+    def do_POST(self):
+        # Client credentials token endpoint
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        self.send_json(200, {"access_token": "mock-token", "token_type": "Bearer",
+                             "expires_in": 3600})
+
+    def do_GET(self):
+        server = self.server
+        server.count_request()
+        if server.latency > 0:
+            time.sleep(max(0, random.gauss(server.latency, server.latency / 4)))
+        if random.random() < server.timeout_rate:
+            time.sleep(server.timeout_seconds)
+        if random.random() < server.rate_limit_rate:
+            server.count_throttle()
+            self.send_error_json(429, "API rate limit exceeded",
+                                 {"Retry-After": str(server.retry_after)})
+            return
+
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = [p for p in url.path.split("/") if p]
+        if len(parts) == 0 or parts[0] != "v1":
+            self.send_error_json(404, "Not found")
+            return
+        parts = parts[1:]
+        ids = query.get("ids", [""])[0].split(",") if "ids" in query else []
+        market = query.get("market", query.get("country", [None]))[0]
+        catalog = server.catalog
+
+        if parts == ["artists"]:
+            artists = []
+            for item_id in ids:
+                index = catalog.artist_index(item_id)
+                artists.append(None if index == None else catalog.artist(index))
+            self.send_json(200, {"artists": artists})
+
+        elif len(parts) == 3 and parts[0] == "artists":
+            index = catalog.artist_index(parts[1])
+            if index == None:
+                self.send_error_json(404, "non existing id")
+            elif parts[2] == "related-artists":
+                self.send_json(200, {"artists": catalog.related_artists(index)})
+            elif parts[2] == "top-tracks":
+                self.send_json(200, {"tracks": catalog.top_tracks(index, market)})
+            else:
+                self.send_error_json(404, "Not found")
+
+        elif parts == ["tracks"]:
+            tracks = []
+            for item_id in ids:
+                index = catalog.track_index(item_id)
+                tracks.append(None if index == None else catalog.track(index, market))
+            self.send_json(200, {"tracks": tracks})
+
+        elif parts == ["audio-features"]:
+            features = []
+            for item_id in ids:
+                index = catalog.track_index(item_id)
+                features.append(None if index == None else catalog.audio_features(index))
+            self.send_json(200, {"audio_features": features})
+
+        else:
+            self.send_error_json(404, "Not found")
+
+
+class MockSpotifyServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, catalog, host="127.0.0.1", port=0, latency=0.0,
+                 rate_limit_rate=0.0, retry_after=1, timeout_rate=0.0,
+                 timeout_seconds=30):
+        super().__init__((host, port), MockSpotifyHandler)
+        self.catalog = catalog
+        self.latency = latency                   # Mean seconds per request
+        self.rate_limit_rate = rate_limit_rate   # Fraction of requests given a 429
+        self.retry_after = retry_after           # Retry-After sent with a 429
+        self.timeout_rate = timeout_rate         # Fraction of requests stalled
+        self.timeout_seconds = timeout_seconds
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.throttle_count = 0
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count_request(self):
+        with self.lock:
+            self.request_count += 1
+
+    def count_throttle(self):
+        with self.lock:
+            self.throttle_count += 1
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def create_mock_accessor(url, requests_timeout=5, pool_size=64):
+    # A Spotipy client that talks to a MockSpotifyServer instead of Spotify,
+    # over the same kind of pooled session as the real one
+    import spotipy
+    sp = spotipy.Spotify(auth="mock-token", requests_timeout=requests_timeout,
+                         requests_session=sf.create_http_session(pool_size, retries=0))
+    sp.prefix = f"{url}/v1/"
+    return sp
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a mock Spotify API server.")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--artists", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1)
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    from crawler_related_artists import SEED_ARTIST_ID
+    catalog = SyntheticCatalog(args.artists, seed=args.seed,
+                               seed_artist_id=SEED_ARTIST_ID)
+    server = MockSpotifyServer(catalog, port=args.port, latency=args.latency,
+                               rate_limit_rate=args.rate_limit_rate,
+                               retry_after=args.retry_after,
+                               timeout_rate=args.timeout_rate)
+    print(f"Mock Spotify API on {server.url}/v1/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
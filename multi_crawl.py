@@ -0,0 +1,127 @@
+"""
+Runs a Spotify crawler as several worker processes, one per set of app
+credentials, so throughput scales with the number of credentials held.
+
+Each worker only searches the IDs whose hash falls in its partition, and
+saves into its own folder (data/<crawler>/worker_<N>). IDs a worker discovers
+for another partition go to its outbox. Between rounds the coordinator moves
+outbox IDs into the owning worker's inbox, and starts another round, of only
+the workers given new IDs, until none are left to hand over. The workers' shards are then collated together.
+
+    python multi_crawl.py crawler_related_artists:RelatedArtistsCrawler related_artists
+"""
+import os
+import sys
+import json
+import argparse
+import multiprocessing
+import collate
+import serialization as ser
+import shared_functions as sf
+from checkpoint_writer import write_atomic
+from replay import load_class
+
+
+def worker_dirname(dirname, index):
+    return os.path.join(dirname, f"worker_{index}")
+
+
+def run_worker(crawler_class, dirname, index, count, credentials, kwargs):
+    crawler = crawler_class(worker_dirname(dirname, index), worker_index=index,
+                            worker_count=count, credentials=credentials, **kwargs)
+    # A non-zero exit tells the coordinator the crawl was interrupted
+    sys.exit(0 if crawler.complete else 1)
+
+
+def load_id_file(filepath):
+    # Workers may save in any format (see serialization.py)
+    filepath = ser.find_variant(filepath)
+    if filepath == None:
+        return []
+    return ser.load(filepath)
+
+
+def exchange_outboxes(folders, count):
+    # Route every worker's outbox IDs to the inbox of the worker that owns
+    # them, and return how many were moved and which workers now have an
+    # inbox to search. Inboxes are written before outboxes are cleared, so a
+    # crash here can at worst hand an ID over twice, which the worker ignores.
+    inboxes = [set(load_id_file(os.path.join(f, "inbox.json"))) for f in folders]
+    moved = 0
+    for folder in folders:
+        for item in load_id_file(os.path.join(folder, "outbox.json")):
+            inboxes[sf.partition_index(item, count)].add(item)
+            moved += 1
+
+    for folder, inbox in zip(folders, inboxes):
+        if len(inbox) > 0:
+            write_atomic(os.path.join(folder, "inbox.json"),
+                         json.dumps(list(inbox)).encode("utf-8"))
+    for folder in folders:
+        for filepath in ser.variants(os.path.join(folder, "outbox.json")) + \
+                ser.variants(os.path.join(folder, "outbox_backup.json")):
+            if os.path.isfile(filepath):
+                os.remove(filepath)
+    return moved, [i for i, inbox in enumerate(inboxes) if len(inbox) > 0]
+
+
+def multi_crawl(crawler_class, dirname, credentials_list=None,
+                output_format="json", data_folder="data", **kwargs):
+    if credentials_list == None:
+        credentials_list = sf.get_all_credentials()
+    count = len(credentials_list)
+    folders = [os.path.join(data_folder, worker_dirname(dirname, i))
+               for i in range(count)]
+    print(f"Crawling with {count} workers...")
+
+    crawl_round = 0
+    active = list(range(count))   # Every worker starts, or resumes, in round 1
+    while True:
+        crawl_round += 1
+        print(f"\n-Round {crawl_round}: {len(active)} workers-")
+        workers = []
+        for i in active:
+            worker = multiprocessing.Process(
+                target=run_worker,
+                args=(crawler_class, dirname, i, count, credentials_list[i],
+                      kwargs))
+            worker.start()
+            workers.append(worker)
+
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            # Workers get the interrupt too, and save their own state
+            for worker in workers:
+                worker.join()
+            print("Crawl Interrupted.")
+            return None
+
+        if any(worker.exitcode != 0 for worker in workers):
+            print("A worker did not complete, stopping.")
+            return None
+
+        moved, active = exchange_outboxes(folders, count)
+        print(f"{moved} IDs handed over between workers.")
+        if len(active) == 0:
+            break
+
+    output_filepath = collate.default_output_path(
+        os.path.join(data_folder, dirname), output_format)
+    total = collate.collate(folders, output_filepath, output_format)
+    print(f"{total} items collated into file: {output_filepath}")
+    return output_filepath
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a crawler across workers.")
+    parser.add_argument("crawler", help="e.g. crawler_related_artists:RelatedArtistsCrawler")
+    parser.add_argument("dirname", help="Crawler folder name, e.g. related_artists")
+    parser.add_argument("--credentials", default=sf.CREDENTIALS_PATH,
+                        help="JSON file with a list of credential sets")
+    parser.add_argument("--format", choices=collate.FORMATS, default="json")
+    args = parser.parse_args()
+
+    multi_crawl(load_class(args.crawler), args.dirname,
+                sf.get_all_credentials(args.credentials), args.format)
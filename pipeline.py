@@ -0,0 +1,137 @@
+"""
+Runs the four Spotify crawlers at once, each in its own thread, streaming the
+IDs each stage finds straight into the stages that need them:
+
+    related_artists -> artist_info
+                    -> top_tracks -> track_info
+
+Each stage keeps its own state and checkpoints as usual. A downstream stage
+skips its initial_setup (which would wait for the upstream's collated file)
+and instead takes IDs from a StageFeed until the upstream stage completes.
+Whatever was in a feed when the pipeline stopped is sent again on restart,
+as each upstream stage re-publishes its saved results when it starts.
+
+    python pipeline.py --concurrency 4
+"""
+import queue
+import argparse
+import threading
+import rate_limiter as rl
+from crawl_options import NetworkOptions, OutputOptions
+from crawler_related_artists import RelatedArtistsCrawler
+from crawler_artist_info import ArtistInfoCrawler
+from crawler_top_tracks import TopTracksCrawler
+from crawler_track_info import TrackInfoCrawler
+
+# (stage name, crawler class, upstream stage name)
+STAGES = [
+    ("related_artists", RelatedArtistsCrawler, None),
+    ("artist_info", ArtistInfoCrawler, "related_artists"),
+    ("top_tracks", TopTracksCrawler, "related_artists"),
+    ("track_info", TrackInfoCrawler, "top_tracks"),
+]
+
+
+class StageFeed():
+    # A thread-safe queue of IDs from one stage to another, closed once the
+    # upstream stage has completed
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.done = threading.Event()
+
+    def put(self, items):
+        if len(items) > 0:
+            self.queue.put(list(items))
+
+    def close(self):
+        self.done.set()
+
+    def drain(self, timeout=0):
+        # All the IDs queued so far, waiting up to timeout for the first ones
+        items = []
+        try:
+            items += self.queue.get(timeout=timeout) if timeout > 0 \
+                else self.queue.get_nowait()
+            while True:
+                items += self.queue.get_nowait()
+        except queue.Empty:
+            pass
+        return items
+
+    def finished(self):
+        # Closed, and everything queued has been taken
+        return self.done.is_set() and self.queue.empty()
+
+
+def run_stage(name, crawler_class, kwargs, stop_event, results):
+    try:
+        crawler = crawler_class(name, stop_event=stop_event, **kwargs)
+        results[name] = crawler.complete
+    except BaseException:
+        # Stop the other stages, rather than leave them waiting on this one
+        results[name] = False
+        stop_event.set()
+        raise
+
+
+def pipeline(stages=None, network=None, client_factory=None, output=None,
+             **kwargs):
+    # stages limits the run to some stage names (upstream stages of those not
+    # run must already be complete). client_factory gives each stage its own
+    # API client; otherwise they make their own from the credentials.
+    network = network or NetworkOptions()
+    if network.rate_limiter == None:
+        # One limiter across all stages, as they share the same credentials
+        network = network.replace(rate_limiter=rl.RateLimiter())
+    # The stages' progress lines would overwrite each other
+    output = (output or OutputOptions()).replace(show_progress=False)
+    stop_event = threading.Event()
+    feeds = {name: StageFeed() for name, _, upstream in STAGES
+             if upstream != None}
+    results = {}
+    threads = []
+    for name, crawler_class, upstream in STAGES:
+        if stages != None and name not in stages:
+            continue
+        stage_kwargs = dict(kwargs, network=network, output=output)
+        if client_factory != None:
+            stage_kwargs["client"] = client_factory()
+        if upstream != None and (stages == None or upstream in stages):
+            stage_kwargs["feed"] = feeds[name]
+        stage_kwargs["downstream"] = [feeds[downstream] for downstream, _, source
+                                      in STAGES if source == name and
+                                      (stages == None or downstream in stages)]
+        thread = threading.Thread(target=run_stage, name=name,
+                                  args=(name, crawler_class, stage_kwargs,
+                                        stop_event, results))
+        thread.start()
+        threads.append(thread)
+
+    try:
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(0.5)
+    except KeyboardInterrupt:
+        # Only the main thread sees the interrupt, so pass it on
+        print("Pipeline Interrupted. Saving data...")
+        stop_event.set()
+        for thread in threads:
+            thread.join()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run all crawler stages at once.")
+    parser.add_argument("--stages", nargs="*", default=None,
+                        choices=[name for name, _, _ in STAGES])
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--rate", type=float, default=10,
+                        help="Starting rate limit, requests per second")
+    args = parser.parse_args()
+
+    network = NetworkOptions(concurrency=args.concurrency,
+                             rate_limiter=rl.RateLimiter(rate=args.rate))
+    results = pipeline(args.stages, network)
+    for name, complete in results.items():
+        print(f"{name}: {'complete' if complete else 'incomplete'}")
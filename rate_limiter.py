@@ -0,0 +1,104 @@
+import time
+import asyncio
+import threading
+
+
+class RateLimiter():
+    """
+    An adaptive token bucket shared by all requests made by a crawler.
+
+    Tokens refill at self.rate per second, up to self.capacity. Every request
+    takes one token. When Spotify answers with a 429, the rate is cut
+    multiplicatively and no tokens are handed out until the Retry-After period
+    has passed. Every successful request then adds a small fixed amount back to
+    the rate (AIMD), so the crawler settles just under the real quota.
+
+    Concurrent requests sent before a 429 tend to be throttled together, so
+    the rate is only cut once per cool-down window: until the Retry-After
+    period, or at least cooldown seconds, has passed since the last cut.
+    """
+
+    def __init__(self, rate=10, capacity=None, min_rate=0.1, max_rate=100,
+                 increase=0.05, decrease=0.5, cooldown=1):
+        self.rate = rate                  # Current tokens per second
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase          # Rate added after each success
+        self.decrease = decrease          # Rate multiplier after a 429
+        self.capacity = capacity if capacity != None else max(1, rate)
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self.blocked_until = 0            # Set from Retry-After
+        self.cooldown = cooldown          # Minimum seconds between rate cuts
+        self.cooldown_until = 0           # No further cuts until then
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self.last_refill
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.last_refill = now
+
+    def _reserve(self):
+        # Take a token if one is available, otherwise return the time to wait
+        with self.lock:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        while True:
+            wait = self._reserve()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        while True:
+            wait = self._reserve()
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def on_success(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self, retry_after=None):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = 0
+            if retry_after != None:
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+            if now < self.cooldown_until:
+                # A request sent before the last cut. Nothing is sent while
+                # blocked, so no cut until the block ends either.
+                self.cooldown_until = max(self.cooldown_until, self.blocked_until)
+                return
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self.cooldown_until = max(self.blocked_until, now + self.cooldown)
+
+
+def retry_after_header(exception):
+    # SpotifyException carries the response headers from Spotipy 2.12 onwards
+    headers = getattr(exception, "headers", None) or {}
+    return headers.get("Retry-After", headers.get("retry-after"))
+
+
+def get_retry_after(exception, default=1):
+    try:
+        return float(retry_after_header(exception))
+    except (TypeError, ValueError):
+        return default
+
+
+def is_rate_limited(exception):
+    # A 429 from Spotify itself. Once the HTTP session's retries run out,
+    # Spotipy raises a 429 with no headers ("Max Retries") whatever the
+    # responses were, which is not a throttle (see crawler_base.is_server_error).
+    return getattr(exception, "http_status", None) == 429 and \
+        retry_after_header(exception) != None
@@ -0,0 +1,139 @@
+"""
+Records raw API responses during a crawl, and re-runs a crawler's
+process_search_results over them offline, across several processes and
+without an API client. Useful after changing what a crawler extracts:
+    python replay.py crawler_track_info:TrackInfoCrawler track_info
+"""
+import os
+import re
+import gzip
+import json
+import argparse
+import importlib
+import multiprocessing
+import shard_index
+import shard_manifest
+import collate
+import serialization as ser
+
+
+class ResponseRecorder():
+    # Appends (items_to_search, results) pairs to gzipped JSON Lines files.
+    # Each flush ends a gzip member, so everything recorded up to the last
+    # checkpoint can be read back after a crash.
+
+    def __init__(self, dirname, records_per_file=10000):
+        self.dirname = dirname
+        os.makedirs(dirname, exist_ok=True)
+        self.records_per_file = records_per_file
+        self.file = None
+        self.count = 0
+        self.index = len(list_raw_files(dirname))
+
+    def record(self, items_to_search, results):
+        if self.count >= self.records_per_file:
+            self.close()
+            self.index += 1
+            self.count = 0
+        if self.file == None:
+            # Appended as a new member of the file, after any flushed ones
+            filepath = os.path.join(self.dirname, f"raw_{self.index}.jsonl.gz")
+            self.file = gzip.open(filepath, "at")
+        self.file.write(json.dumps({"items": items_to_search, "results": results}))
+        self.file.write("\n")
+        self.count += 1
+
+    def flush(self):
+        self.close()
+
+    def close(self):
+        if self.file != None:
+            self.file.close()
+            self.file = None
+
+
+def list_raw_files(dirname):
+    pattern = re.compile(r"^raw_(\d+)\.jsonl\.gz$")
+    files = []
+    if os.path.isdir(dirname):
+        for filename in os.listdir(dirname):
+            match = pattern.match(filename)
+            if match:
+                files.append((int(match.group(1)), os.path.join(dirname, filename)))
+    return [filepath for _, filepath in sorted(files)]
+
+
+def read_records(filepath):
+    with gzip.open(filepath, "rt") as f:
+        try:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.decoder.JSONDecodeError:
+                    # Torn final record from a crash mid-write
+                    return
+                yield record["items"], record["results"]
+        except EOFError:
+            # File was not closed cleanly
+            return
+
+
+def replay_file(crawler_class, filepath, output_dirname, index,
+                serializer="auto", compression=None):
+    crawler = crawler_class.offline_instance(serializer, compression)
+    for items_to_search, results in read_records(filepath):
+        crawler.process_search_results(items_to_search, results)
+
+    # Saved as the crawler saves its own shards
+    subset = dict(crawler.searched_items)
+    shard_path = crawler.write_shard(
+        os.path.join(output_dirname, f"saved_{index}.json"), subset)
+    shard_index.write_index(shard_path, subset.keys())
+    return len(subset)
+
+
+def replay(crawler_class, dirname, output_dirname=None, processes=None,
+           output_format="json", data_folder="data", serializer="auto",
+           compression=None):
+    # Recorded files are replayed in order, one shard each, so when an item was
+    # searched more than once the latest response wins in the collated output.
+    raw_dirname = os.path.join(data_folder, dirname, "raw")
+    output_dirname = os.path.join(data_folder, output_dirname or f"{dirname}_replay")
+    os.makedirs(output_dirname, exist_ok=True)
+
+    filepaths = list_raw_files(raw_dirname)
+    print(f"Replaying {len(filepaths)} recorded files...")
+    jobs = [(crawler_class, filepath, output_dirname, i, serializer, compression)
+            for i, filepath in enumerate(filepaths)]
+    with multiprocessing.Pool(processes) as pool:
+        counts = pool.starmap(replay_file, jobs)
+    print(f"{sum(counts)} items processed.")
+    # Shards were written by separate processes, so are recorded together
+    shard_manifest.ShardManifest(output_dirname).rebuild()
+
+    output_filepath = collate.default_output_path(output_dirname, output_format)
+    count = collate.collate(output_dirname, output_filepath, output_format)
+    print(f"{count} items collated into file: {output_filepath}")
+    return output_filepath
+
+
+def load_class(path):
+    # "module:Class", e.g. "crawler_track_info:TrackInfoCrawler"
+    module_name, class_name = path.split(":")
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded responses.")
+    parser.add_argument("crawler", help="e.g. crawler_track_info:TrackInfoCrawler")
+    parser.add_argument("dirname", help="Crawler folder name, e.g. track_info")
+    parser.add_argument("--output", default=None, help="Output folder name")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--format", choices=collate.FORMATS, default="json")
+    parser.add_argument("--serializer", choices=ser.FORMATS, default="auto",
+                        help="Format the replayed shards are saved in")
+    parser.add_argument("--compression", choices=["gzip", "zstd"], default=None)
+    args = parser.parse_args()
+
+    replay(load_class(args.crawler), args.dirname, args.output, args.processes,
+           args.format, serializer=args.serializer, compression=args.compression)
@@ -0,0 +1,153 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+MISSING = object()   # Returned by ResponseCache.get on a cache miss
+
+
+class ResponseCache():
+    """
+    An on-disk cache of raw API responses, keyed by (endpoint, id, market).
+
+    Entries older than ttl seconds are treated as misses. Once the cache is
+    over max_bytes, the least recently used entries are evicted.
+    """
+
+    def __init__(self, filepath, ttl=7*24*3600, max_bytes=2*1024**3):
+        os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        # Requests may run on worker threads, so share one locked connection
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(filepath, check_same_thread=False,
+                                    isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                endpoint TEXT, item_id TEXT, market TEXT, data TEXT,
+                size INTEGER, fetched_at REAL, accessed_at REAL,
+                PRIMARY KEY (endpoint, item_id, market))""")
+        self.conn.execute("""CREATE INDEX IF NOT EXISTS responses_lru
+                             ON responses (accessed_at)""")
+        self.total_bytes = self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, endpoint, item_id, market=None):
+        key = (endpoint, str(item_id), market or "")
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT data, fetched_at FROM responses WHERE endpoint = ? "
+                "AND item_id = ? AND market = ?", key).fetchone()
+            if row == None or now - row[1] > self.ttl:
+                self.misses += 1
+                return MISSING
+            self.conn.execute(
+                "UPDATE responses SET accessed_at = ? WHERE endpoint = ? "
+                "AND item_id = ? AND market = ?", (now,) + key)
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, endpoint, item_id, data, market=None):
+        key = (endpoint, str(item_id), market or "")
+        text = json.dumps(data)
+        now = time.time()
+        with self.lock:
+            old = self.conn.execute(
+                "SELECT size FROM responses WHERE endpoint = ? AND item_id = ? "
+                "AND market = ?", key).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                key + (text, len(text), now, now))
+            self.total_bytes += len(text) - (old[0] if old else 0)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Drop least recently used entries until back under 90% of the cap
+        target = self.max_bytes * 0.9
+        while self.total_bytes > target:
+            rows = self.conn.execute(
+                "SELECT rowid, size FROM responses ORDER BY accessed_at "
+                "LIMIT 1000").fetchall()
+            if len(rows) == 0:
+                self.total_bytes = 0
+                return
+            freed = 0
+            to_delete = []
+            for rowid, size in rows:
+                to_delete.append((rowid,))
+                freed += size
+                if self.total_bytes - freed <= target:
+                    break
+            self.conn.executemany("DELETE FROM responses WHERE rowid = ?",
+                                  to_delete)
+            self.total_bytes -= freed
+
+
+class CachedSpotify():
+    """
+    Wraps a spotipy.Spotify client, answering the crawler endpoints from a
+    ResponseCache where possible. Batch endpoints are cached per ID, so only
+    the uncached IDs of a batch are requested. Anything else is passed
+    straight through to the client.
+    """
+
+    def __init__(self, sp, cache):
+        self.sp = sp
+        self.cache = cache
+
+    def _cached_batch(self, endpoint, ids, fetch, market=None):
+        results = {}
+        missing = []
+        for item_id in ids:
+            data = self.cache.get(endpoint, item_id, market)
+            if data is MISSING:
+                missing.append(item_id)
+            else:
+                results[item_id] = data
+        if len(missing) > 0:
+            for item_id, data in zip(missing, fetch(missing)):
+                self.cache.put(endpoint, item_id, data, market)
+                results[item_id] = data
+        return [results[item_id] for item_id in ids]
+
+    def _cached_single(self, endpoint, item_id, fetch, market=None):
+        data = self.cache.get(endpoint, item_id, market)
+        if data is MISSING:
+            data = fetch()
+            self.cache.put(endpoint, item_id, data, market)
+        return data
+
+    def artists(self, artists):
+        return {"artists": self._cached_batch(
+            "artists", artists,
+            lambda ids: self.sp.artists(ids)["artists"])}
+
+    def artist_related_artists(self, artist_id):
+        return self._cached_single(
+            "artist_related_artists", artist_id,
+            lambda: self.sp.artist_related_artists(artist_id))
+
+    def artist_top_tracks(self, artist_id, country="US"):
+        return self._cached_single(
+            "artist_top_tracks", artist_id,
+            lambda: self.sp.artist_top_tracks(artist_id, country), country)
+
+    def tracks(self, tracks, market=None):
+        return {"tracks": self._cached_batch(
+            "tracks", tracks,
+            lambda ids: self.sp.tracks(ids, market=market)["tracks"], market)}
+
+    def audio_features(self, tracks):
+        return self._cached_batch(
+            "audio_features", tracks,
+            lambda ids: self.sp.audio_features(ids))
+
+    def __getattr__(self, attr):
+        return getattr(self.sp, attr)
@@ -0,0 +1,200 @@
+"""
+Orders a crawler's unsearched items, so that a crawl stopped part-way has
+already searched the most useful ones:
+    * "bfs"         Fewest hops from the seed first
+    * "in_degree"   Most referenced (by searched items) first
+    * "popularity"  Most popular first, once the popularity is known
+
+The unsearched set stays the source of truth. A scheduler only holds a
+priority for each item, and drops queue entries lazily once their item has
+been claimed, searched or re-prioritised. The heap is compacted once these
+stale entries outnumber the live ones.
+"""
+import heapq
+import itertools
+from collections import deque
+
+MIN_COMPACTION = 1000   # Stale heap entries allowed before compacting
+
+
+class Scheduler():
+    # Lowest priority value first, ties in the order items were queued
+    name = None
+
+    def __init__(self):
+        self.priorities = {}   # Item -> current priority
+        self.changes = {}      # Item -> priority (None once discarded) since
+                               # the last checkpoint
+        self.heap = []
+        self.order = itertools.count()
+
+    def priority_for(self, item, source, detail):
+        # Returns the item's new priority, or None to leave it unchanged
+        raise NotImplementedError
+
+    def default_priority(self):
+        # For items queued without being observed, e.g. a crawl's seed items
+        return 0
+
+    def observe(self, item, source=None, detail=None):
+        # An unsearched item was referenced by source (with optional detail,
+        # e.g. the artist object it came from)
+        priority = self.priority_for(item, source, detail)
+        if priority != None and priority != self.priorities.get(item):
+            self.priorities[item] = priority
+            self.changes[item] = priority
+            self.push(item, priority)
+
+    def push(self, item, priority):
+        heapq.heappush(self.heap, (priority, next(self.order), item))
+        if len(self.heap) > 2 * len(self.priorities) + MIN_COMPACTION:
+            self.compact()
+
+    def compact(self):
+        # Keep only each item's current entry, in the order it was queued
+        entries = {}
+        for entry in self.heap:
+            priority, order, item = entry
+            if self.priorities.get(item) == priority and \
+                    (item not in entries or order < entries[item][1]):
+                entries[item] = entry
+        self.heap = list(entries.values())
+        heapq.heapify(self.heap)
+
+    def requeue(self, items):
+        # Queue items again, e.g. after a cancelled request
+        for item in items:
+            if item not in self.priorities:
+                self.priorities[item] = self.changes[item] = self.default_priority()
+            self.push(item, self.priorities[item])
+
+    def discard(self, items):
+        for item in items:
+            if self.priorities.pop(item, None) != None:
+                self.changes[item] = None
+
+    def is_current(self, item, priority, unsearched):
+        return self.priorities.get(item) == priority and item in unsearched
+
+    def peek(self, n, unsearched):
+        # The n highest priority unsearched items, left in the queue
+        items = []
+        entries = []
+        while len(self.heap) > 0 and len(items) < n:
+            entry = heapq.heappop(self.heap)
+            priority, _, item = entry
+            if self.is_current(item, priority, unsearched) and item not in items:
+                items.append(item)
+                entries.append(entry)
+        for entry in entries:
+            heapq.heappush(self.heap, entry)
+        return items
+
+    def take_changes(self):
+        # The priorities set or discarded since this was last called, so a
+        # checkpoint need only save those (see CrawlerBase.save_scheduler)
+        changes = self.changes
+        self.changes = {}
+        return changes
+
+    def state(self):
+        # A copy, as it may be saved while the crawl carries on
+        return {"name": self.name, "priorities": dict(self.priorities)}
+
+    def load(self, state):
+        self.priorities = state["priorities"]
+        self.changes = {}
+        self.heap = [(priority, next(self.order), item)
+                     for item, priority in self.priorities.items()]
+        heapq.heapify(self.heap)
+
+
+class BFSScheduler(Scheduler):
+    """
+    Priority is the hop distance from the seed. Distances are small integers,
+    so this uses a bucket queue (one FIFO per distance) rather than a heap.
+    """
+    name = "bfs"
+
+    def __init__(self):
+        super().__init__()
+        self.buckets = {}   # Distance -> deque of items
+        self.min_depth = 0
+
+    def priority_for(self, item, source, detail):
+        depth = 0 if source == None else self.priorities.get(source, 0) + 1
+        if item in self.priorities and self.priorities[item] <= depth:
+            return None
+        return depth
+
+    def default_priority(self):
+        return max(self.buckets, default=-1) + 1
+
+    def push(self, item, priority):
+        self.buckets.setdefault(priority, deque()).append(item)
+        self.min_depth = min(self.min_depth, priority)
+
+    def peek(self, n, unsearched):
+        items = []
+        depth = self.min_depth
+        max_depth = max(self.buckets, default=-1)
+        while depth <= max_depth and len(items) < n:
+            bucket = self.buckets.get(depth)
+            # Drop stale entries from the front, then read past valid ones
+            while bucket and not self.is_current(bucket[0], depth, unsearched):
+                bucket.popleft()
+            if not bucket:
+                self.buckets.pop(depth, None)
+                if depth == self.min_depth:
+                    self.min_depth = depth + 1
+                depth += 1
+                continue
+            for item in bucket:
+                if self.is_current(item, depth, unsearched) and item not in items:
+                    items.append(item)
+                    if len(items) >= n:
+                        break
+            depth += 1
+        return items
+
+    def load(self, state):
+        self.priorities = state["priorities"]
+        self.changes = {}
+        self.buckets = {}
+        self.min_depth = 0
+        for item, depth in self.priorities.items():
+            self.push(item, depth)
+
+
+class InDegreeScheduler(Scheduler):
+    # Priority is minus the number of times the item has been referenced
+    name = "in_degree"
+
+    def priority_for(self, item, source, detail):
+        return self.priorities.get(item, 0) - 1
+
+
+class PopularityScheduler(Scheduler):
+    # Priority is minus the item's popularity, where the source gave one
+    name = "popularity"
+
+    def priority_for(self, item, source, detail):
+        if detail == None or detail.get("popularity") == None:
+            return None if item in self.priorities else 0
+        return -detail["popularity"]
+
+
+SCHEDULERS = {
+    "bfs": BFSScheduler,
+    "in_degree": InDegreeScheduler,
+    "popularity": PopularityScheduler
+}
+
+
+def create_scheduler(scheduler):
+    # scheduler can be a name from SCHEDULERS or a Scheduler instance
+    if scheduler == None or isinstance(scheduler, Scheduler):
+        return scheduler
+    if scheduler not in SCHEDULERS:
+        raise ValueError(f"Unknown scheduler: {scheduler}")
+    return SCHEDULERS[scheduler]()
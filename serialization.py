@@ -0,0 +1,156 @@
+"""
+Encoding for the crawlers' state files and saved shards: orjson or msgpack
+when installed, stdlib json otherwise, optionally compressed with gzip or
+zstd. Files are decoded by their content rather than their name, so older
+plain JSON files keep loading whatever a crawler is set to write.
+
+    Serializer("auto")                  orjson if installed, else json
+    Serializer("msgpack", "zstd")       saved_0.msgpack.zst, searched.msgpack.zst...
+"""
+import os
+import json
+import gzip
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+FORMATS = ["auto", "json", "orjson", "msgpack"]
+COMPRESSIONS = [None, "gzip", "zstd"]
+
+FORMAT_EXTENSIONS = {"json": ".json", "orjson": ".json", "msgpack": ".msgpack"}
+COMPRESSION_EXTENSIONS = {None: "", "gzip": ".gz", "zstd": ".zst"}
+# Every extension a serialized file may have, longest first
+EXTENSIONS = sorted({f + c for f in FORMAT_EXTENSIONS.values()
+                     for c in COMPRESSION_EXTENSIONS.values()},
+                    key=len, reverse=True)
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# What a truncated or corrupted file may raise when decoded
+DECODE_ERRORS = (ValueError, EOFError, OSError)
+if zstandard != None:
+    DECODE_ERRORS += (zstandard.ZstdError,)
+
+
+def split_extension(filepath):
+    # "saved_0.msgpack.zst" -> ("saved_0", ".msgpack.zst")
+    for extension in EXTENSIONS:
+        if filepath.endswith(extension):
+            return filepath[:-len(extension)], extension
+    return os.path.splitext(filepath)
+
+
+def variants(filepath):
+    # The same file under every extension it could have been written with
+    base = split_extension(filepath)[0]
+    return [base + extension for extension in EXTENSIONS]
+
+
+def find_variant(filepath):
+    # filepath if it exists, otherwise the same file written in another
+    # format, or None
+    if os.path.isfile(filepath):
+        return filepath
+    for variant in variants(filepath):
+        if os.path.isfile(variant):
+            return variant
+    return None
+
+
+class Serializer():
+
+    def __init__(self, format="auto", compression=None, level=None):
+        if format == "auto":
+            format = "orjson" if orjson != None else "json"
+        if format not in FORMATS:
+            raise ValueError(f"Unknown serialization format: {format}")
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression: {compression}")
+        if format == "orjson" and orjson == None:
+            raise ImportError("The orjson format needs orjson installed.")
+        if format == "msgpack" and msgpack == None:
+            raise ImportError("The msgpack format needs msgpack installed.")
+        if compression == "zstd" and zstandard == None:
+            raise ImportError("zstd compression needs zstandard installed.")
+        self.format = format
+        self.compression = compression
+        # Compression level, by default 6 for gzip (faster than its own
+        # default of 9, for much the same size) and 3 for zstd
+        if level == None:
+            level = 6 if compression == "gzip" else 3
+        self.level = level
+        self.extension = FORMAT_EXTENSIONS[format] + \
+            COMPRESSION_EXTENSIONS[compression]
+
+    def path_for(self, filepath):
+        # filepath with this serializer's extension, e.g. searched.json ->
+        # searched.msgpack.zst
+        return split_extension(filepath)[0] + self.extension
+
+    def dumps(self, data):
+        if self.format == "orjson":
+            # Non-string keys are written as strings, as json does
+            raw = orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+        elif self.format == "msgpack":
+            raw = msgpack.packb(data, use_bin_type=True)
+        else:
+            raw = json.dumps(data).encode("utf-8")
+
+        if self.compression == "gzip":
+            return gzip.compress(raw, compresslevel=self.level)
+        elif self.compression == "zstd":
+            return zstandard.ZstdCompressor(level=self.level).compress(raw)
+        return raw
+
+    def dump(self, data, filepath):
+        with open(filepath, "wb") as f:
+            f.write(self.dumps(data))
+
+
+def loads(raw):
+    if raw.startswith(GZIP_MAGIC):
+        raw = gzip.decompress(raw)
+    elif raw.startswith(ZSTD_MAGIC):
+        if zstandard == None:
+            raise ImportError("Reading zstd files needs zstandard installed.")
+        raw = zstandard.ZstdDecompressor().decompressobj().decompress(raw)
+
+    # Saved data is always a map or array. In msgpack those start with a byte
+    # of 0x80 or above, which JSON (ASCII text) never does.
+    first = raw.lstrip()[:1]
+    if first != b"" and first[0] >= 0x80:
+        if msgpack == None:
+            raise ImportError("Reading msgpack files needs msgpack installed.")
+        return msgpack.unpackb(raw, raw=False, strict_map_key=False)
+    if orjson != None:
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            # Stricter than json, e.g. about NaN, so try json before giving up
+            pass
+    return json.loads(raw)
+
+
+def load(filepath):
+    with open(filepath, "rb") as f:
+        return loads(f.read())
+
+
+def dumps_json(value):
+    # A JSON string, for output files that must stay JSON
+    if orjson != None:
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+    return json.dumps(value)
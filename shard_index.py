@@ -0,0 +1,153 @@
+import os
+import re
+import struct
+import shutil
+import columnar
+import serialization as ser
+
+# Sidecar index for a saved shard: the shard's IDs as a sorted array of
+# fixed-width, null-padded records, so they can be loaded (or binary searched)
+# without parsing the shard itself.
+#
+# Layout: magic (4s), version (B), record width (H), record count (I), records
+# Version 2 then adds, in record order, each item's fetch time (uint32 epoch
+# seconds, 0 if unknown) and flags (uint8), for refresh mode.
+MAGIC = b"SIDX"
+VERSION = 2
+HEADER = struct.Struct("<4sBHI")
+FLAG_CHANGED = 1   # The item's data changed when it was last refreshed
+
+
+def split_shard_extension(shard_path):
+    # "saved_0.msgpack.zst" -> ("saved_0", ".msgpack.zst")
+    if shard_path.endswith(columnar.SHARD_EXTENSION):
+        return os.path.splitext(shard_path)
+    return ser.split_extension(shard_path)
+
+
+def index_path(shard_path):
+    return split_shard_extension(shard_path)[0] + ".idx"
+
+
+def write_index(shard_path, ids, fetched_at=None, flags=None):
+    # IDs are stored as strings, the same as the keys of the JSON shard.
+    # fetched_at and flags are optional dicts keyed by those strings.
+    keys = sorted(str(i) for i in ids)
+    records = [key.encode("utf-8") for key in keys]
+    width = max((len(r) for r in records), default=0)
+    fetched_at = fetched_at or {}
+    flags = flags or {}
+    # Written alongside and then swapped in, so a crash leaves the old index
+    path = index_path(shard_path)
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, width, len(records)))
+        f.write(b"".join(r.ljust(width, b"\0") for r in records))
+        f.write(struct.pack(f"<{len(keys)}I",
+                            *(int(fetched_at.get(key, 0)) for key in keys)))
+        f.write(bytes(flags.get(key, 0) for key in keys))
+    os.replace(temp_path, path)
+
+
+def read_index_data(shard_path):
+    # Returns (width, count, records) or None if the index is missing or bad
+    path = index_path(shard_path)
+    if not os.path.isfile(path):
+        return None
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < HEADER.size:
+        return None
+    magic, version, width, count = HEADER.unpack_from(data)
+    size = width * count
+    # Version 1 indexes have no fetch times or flags
+    expected = size if version == 1 else size + 5 * count
+    if magic != MAGIC or version not in (1, 2) or \
+            len(data) - HEADER.size != expected:
+        return None
+    records = memoryview(data)[HEADER.size:HEADER.size + size]
+    return width, count, records
+
+
+def read_index(shard_path):
+    index_data = read_index_data(shard_path)
+    if index_data == None:
+        return None
+    width, count, records = index_data
+    return [bytes(records[i*width:(i+1)*width]).rstrip(b"\0").decode("utf-8")
+            for i in range(count)]
+
+
+def read_index_times(shard_path):
+    # Returns {id: (fetched_at, flags)}, or None if the index is missing or
+    # bad. Items in version 1 indexes have an unknown (0) fetch time.
+    path = index_path(shard_path)
+    ids = read_index(shard_path)
+    if ids == None:
+        return None
+    with open(path, "rb") as f:
+        data = f.read()
+    version = HEADER.unpack_from(data)[1]
+    if version == 1:
+        return {item_id: (0, 0) for item_id in ids}
+    count = len(ids)
+    start = len(data) - 5 * count
+    fetched_at = struct.unpack_from(f"<{count}I", data, start)
+    flags = data[start + 4 * count:]
+    return {item_id: (fetched_at[i], flags[i]) for i, item_id in enumerate(ids)}
+
+
+def index_contains(index_data, item_id):
+    # Binary search the sorted records, without decoding the whole index
+    width, count, records = index_data
+    key = str(item_id).encode("utf-8").ljust(width, b"\0")
+    if len(key) > width:
+        return False
+    low, high = 0, count
+    while low < high:
+        mid = (low + high) // 2
+        record = bytes(records[mid*width:(mid+1)*width])
+        if record < key:
+            low = mid + 1
+        elif record > key:
+            high = mid
+        else:
+            return True
+    return False
+
+
+def list_shard_paths(dirname, prefix="saved"):
+    # Saved shards in the order they were written
+    extensions = "|".join(re.escape(e) for e in
+                          ser.EXTENSIONS + [columnar.SHARD_EXTENSION])
+    pattern = re.compile(r"^{}_(\d+)({})$".format(re.escape(prefix), extensions))
+    shards = []
+    for filename in os.listdir(dirname):
+        match = pattern.match(filename)
+        if match:
+            shards.append((int(match.group(1)), os.path.join(dirname, filename)))
+    return [filepath for _, filepath in sorted(shards)]
+
+
+def replace_shard(temp_path, shard_path):
+    # Swap a rewritten shard (a file, or a columnar shard's folder) into place
+    if os.path.isdir(shard_path):
+        old_path = shard_path + ".old"
+        os.rename(shard_path, old_path)
+        os.rename(temp_path, shard_path)
+        shutil.rmtree(old_path)
+    else:
+        os.replace(temp_path, shard_path)
+
+
+def remove_shard(shard_path):
+    if os.path.isdir(shard_path):
+        shutil.rmtree(shard_path)
+    elif os.path.isfile(shard_path):
+        os.remove(shard_path)
+
+
+def load_shard(filepath):
+    if filepath.endswith(columnar.SHARD_EXTENSION):
+        return columnar.read_columns(filepath)
+    return ser.load(filepath)
@@ -0,0 +1,226 @@
+"""
+A record of a crawler's saved shards, so they can be found and checked
+without listing or probing the data folder:
+
+    {"index": 3, "path": "saved_3.json", "count": 100, "min_id": "...",
+     "max_id": "...", "id_hash": "...", "bytes": 51234, "sha256": "..."}
+
+The manifest is an append-only log with one line per shard written, where a
+later line for the same index replaces the earlier one (e.g. after a refresh
+rewrites the shard). New shards are numbered from a counter, one past the
+highest index recorded. Data folders from before the manifest existed are
+listed from disk once, and their manifest written then.
+
+Check a data folder's shards against its manifest:
+    python shard_manifest.py data/track_info
+"""
+import os
+import sys
+import json
+import hashlib
+import argparse
+import threading
+import shard_index
+from checkpoint_writer import write_atomic
+
+CHUNK_SIZE = 1 << 20
+
+
+def manifest_path(dirname, prefix="saved"):
+    return os.path.join(dirname, f"{prefix}_manifest.jsonl")
+
+
+def shard_files(shard_path):
+    # A columnar shard is a folder of column files
+    if os.path.isdir(shard_path):
+        return [os.path.join(shard_path, filename)
+                for filename in sorted(os.listdir(shard_path))]
+    return [shard_path]
+
+
+def file_digest(shard_path):
+    # Returns (bytes, sha256 hex digest) of a shard's file(s)
+    size = 0
+    digest = hashlib.sha256()
+    for filepath in shard_files(shard_path):
+        with open(filepath, "rb") as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                digest.update(chunk)
+    return size, digest.hexdigest()
+
+
+def id_summary(ids):
+    # Count, range and a hash of a shard's IDs, to check its index against
+    keys = sorted(str(i) for i in ids)
+    id_hash = hashlib.sha256("\n".join(keys).encode("utf-8")).hexdigest()[:16]
+    return {
+        "count": len(keys),
+        "min_id": keys[0] if len(keys) > 0 else None,
+        "max_id": keys[-1] if len(keys) > 0 else None,
+        "id_hash": id_hash
+    }
+
+
+def shard_number(shard_path, prefix="saved"):
+    # data/x/saved_12.msgpack -> 12
+    base = os.path.basename(shard_index.split_shard_extension(shard_path)[0])
+    return int(base[len(prefix) + 1:])
+
+
+class ShardManifest():
+
+    def __init__(self, dirname, prefix="saved"):
+        self.dirname = dirname
+        self.prefix = prefix
+        self.filepath = manifest_path(dirname, prefix)
+        self.entries = {}      # Shard index -> manifest entry
+        self.next_index = 0
+        # Shards are recorded from the checkpoint writer thread
+        self.lock = threading.Lock()
+
+    def load(self):
+        # Returns self, with the shards listed from disk if there is no
+        # manifest yet
+        if not os.path.isfile(self.filepath):
+            self.rebuild()
+            return self
+        line_count = 0
+        torn = False
+        with open(self.filepath, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.decoder.JSONDecodeError:
+                    # A torn final line from a crash mid-write
+                    torn = True
+                    break
+                self.entries[entry["index"]] = entry
+                line_count += 1
+        self.next_index = max(self.entries, default=-1) + 1
+        if torn or line_count > len(self.entries):
+            # Drop replaced lines, and anything torn before appending more
+            self.compact()
+        return self
+
+    def rebuild(self):
+        # List the shards from disk and record each one again
+        self.entries = {}
+        for filepath in shard_index.list_shard_paths(self.dirname, self.prefix):
+            ids = shard_index.read_index(filepath)
+            if ids == None:
+                # Shard saved before indexes existed, index it now
+                ids = list(shard_index.load_shard(filepath).keys())
+                shard_index.write_index(filepath, ids)
+            entry = self.describe(filepath, ids)
+            self.entries[entry["index"]] = entry
+        self.next_index = max(self.entries, default=-1) + 1
+        if len(self.entries) > 0:
+            self.compact()
+
+    def compact(self):
+        data = "".join(json.dumps(self.entries[index]) + "\n"
+                       for index in sorted(self.entries))
+        write_atomic(self.filepath, data.encode("utf-8"))
+
+    def allocate(self):
+        # The path for the next new shard, named as JSON (as write_shard
+        # expects) whatever format it ends up saved in
+        with self.lock:
+            index = self.next_index
+            self.next_index += 1
+        filename = "{}_{}.json".format(self.prefix, index)
+        return os.path.join(self.dirname, filename)
+
+    def describe(self, shard_path, ids):
+        size, sha256 = file_digest(shard_path)
+        entry = {"index": shard_number(shard_path, self.prefix),
+                 "path": os.path.basename(shard_path)}
+        entry.update(id_summary(ids))
+        entry["bytes"] = size
+        entry["sha256"] = sha256
+        return entry
+
+    def record(self, shard_path, ids):
+        # Called once a shard and its index have been written. The shard is
+        # read back for its checksum, which is cheap next to serializing it.
+        entry = self.describe(shard_path, ids)
+        with self.lock:
+            with open(self.filepath, "a") as f:
+                f.write(json.dumps(entry))
+                f.write("\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.entries[entry["index"]] = entry
+            self.next_index = max(self.next_index, entry["index"] + 1)
+
+    def shard_paths(self):
+        # Saved shards in the order they were written
+        with self.lock:
+            return [os.path.join(self.dirname, self.entries[index]["path"])
+                    for index in sorted(self.entries)]
+
+    def verify(self):
+        # Returns a list of problems found, empty if every shard matches
+        problems = []
+        for index in sorted(self.entries):
+            entry = self.entries[index]
+            filepath = os.path.join(self.dirname, entry["path"])
+            if not os.path.exists(filepath):
+                problems.append(f"{entry['path']}: missing")
+                continue
+            size, sha256 = file_digest(filepath)
+            if size != entry["bytes"]:
+                problems.append(f"{entry['path']}: {size} bytes, expected "
+                                f"{entry['bytes']}")
+            elif sha256 != entry["sha256"]:
+                problems.append(f"{entry['path']}: checksum mismatch")
+            ids = shard_index.read_index(filepath)
+            if ids == None:
+                problems.append(f"{entry['path']}: index missing or unreadable")
+            elif id_summary(ids)["id_hash"] != entry["id_hash"]:
+                problems.append(f"{entry['path']}: index does not match the "
+                                f"{entry['count']} IDs recorded")
+        listed = set(self.shard_paths())
+        for filepath in shard_index.list_shard_paths(self.dirname, self.prefix):
+            if filepath not in listed:
+                problems.append(f"{os.path.basename(filepath)}: not in manifest")
+        return problems
+
+
+def list_shard_paths(dirname, prefix="saved"):
+    # Read-only: folders without a manifest are listed from disk, rather
+    # than having one written
+    if os.path.isfile(manifest_path(dirname, prefix)):
+        return ShardManifest(dirname, prefix).load().shard_paths()
+    return shard_index.list_shard_paths(dirname, prefix)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check a crawler's saved "
+                                     "shards against their manifest.")
+    parser.add_argument("dirname", help="Crawler data folder, e.g. data/track_info")
+    parser.add_argument("--prefix", default="saved", help="Shard filename prefix")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Record the shards on disk as a new manifest")
+    args = parser.parse_args()
+
+    manifest = ShardManifest(args.dirname, args.prefix)
+    if args.rebuild:
+        manifest.rebuild()
+    elif not os.path.isfile(manifest.filepath):
+        print(f"No manifest found: {manifest.filepath}")
+        sys.exit(1)
+    else:
+        manifest.load()
+
+    problems = manifest.verify()
+    for problem in problems:
+        print(problem)
+    items = sum(entry["count"] for entry in manifest.entries.values())
+    print(f"{len(manifest.entries)} shards, {items} items, "
+          f"{len(problems)} problems.")
+    sys.exit(1 if len(problems) > 0 else 0)
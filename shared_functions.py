@@ -1,4 +1,5 @@
 import os
+import zlib
 import pathlib
 import json
 import pickle
@@ -28,19 +29,76 @@ def get_kill_status():
 
 ##### Spotipy API ####################################################################################
 
-def get_private_details():
-    return json.load(open("spotify_credentials.private", "r"))
-
-def create_spotipy_accessor():
+CREDENTIALS_PATH = "spotify_credentials.private"
+
+def get_private_details(filepath=CREDENTIALS_PATH):
+    creds = json.load(open(filepath, "r"))
+    # The file may hold a list of credential sets, for multi-worker crawls
+    if isinstance(creds, list):
+        return creds[0]
+    return creds
+
+def get_all_credentials(filepath=CREDENTIALS_PATH):
+    creds = json.load(open(filepath, "r"))
+    if isinstance(creds, list):
+        return creds
+    return [creds]
+
+def create_http_session(pool_size=10, retries=3, backoff_factor=0.3,
+                        status_forcelist=(500, 502, 503, 504)):
+    # A keep-alive session with one connection per thread that may use it, so
+    # requests reuse open connections rather than each paying a TLS handshake.
+    # Safe to share between a crawler's threads.
+    import requests
+    from urllib3.util.retry import Retry
+
+    # Connection errors and 5xx responses are retried here. Read timeouts are
+    # not, so a stalled request fails fast and search_items decides what to do.
+    # 429s are left to the crawlers' rate limiter, which honours Retry-After.
+    retry = Retry(total=retries, connect=retries, read=False, status=retries,
+                  backoff_factor=backoff_factor, status_forcelist=status_forcelist,
+                  allowed_methods=frozenset(['GET', 'POST']))
+    adapter = requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=pool_size,
+                                            max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def create_spotipy_accessor(creds=None, pool_size=10, connect_timeout=3.05, read_timeout=10,
+                            retries=3, session=None):
     import spotipy
     from spotipy.oauth2 import SpotifyClientCredentials
 
-    creds = get_private_details()
-    client_credentials_manager = SpotifyClientCredentials(client_id=creds['client_id'], client_secret=creds['client_secret'])
-    sp = spotipy.Spotify(client_credentials_manager=client_credentials_manager, retries=10)
+    if creds == None:
+        creds = get_private_details()
+    if session == None:
+        session = create_http_session(pool_size, retries)
+    timeout = (connect_timeout, read_timeout)
+    client_credentials_manager = SpotifyClientCredentials(client_id=creds['client_id'], client_secret=creds['client_secret'],
+                                                          requests_session=session, requests_timeout=timeout)
+    sp = spotipy.Spotify(client_credentials_manager=client_credentials_manager,
+                         requests_session=session, requests_timeout=timeout)
     return sp
 
 
+def partition_index(item, count):
+    # Which of count workers owns an ID. Stable across processes and runs,
+    # unlike hash().
+    return zlib.crc32(str(item).encode("utf-8")) % count
+
+
+def select_fields(fields, available):
+    # A crawler's fields option: which of the available fields to keep from
+    # each response, in the order given. None keeps them all.
+    if fields == None:
+        return list(available)
+    unknown = [field for field in fields if field not in available]
+    if len(unknown) > 0:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return list(fields)
+
+
 default_scope = 'user-library-read, playlist-read-collaborative, playlist-read-private, user-top-read, user-follow-read'
 
 def get_user_permissions(scope=default_scope):
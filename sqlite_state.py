@@ -0,0 +1,171 @@
+import json
+import sqlite3
+
+
+class SqliteStateStore():
+    """
+    Keeps the crawler's item sets in a SQLite database instead of in memory.
+
+    Each set or dict is one table keyed on an indexed id column. Changes are
+    made inside one open transaction that is committed at each checkpoint,
+    so a crash rolls back to the last checkpoint.
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.conn = sqlite3.connect(filepath, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.tables = {}
+
+    def is_empty(self):
+        count = self.conn.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type='table'").fetchone()
+        return count[0] == 0
+
+    def set_table(self, name):
+        if name not in self.tables:
+            self.tables[name] = SqliteSet(self.conn, name)
+        return self.tables[name]
+
+    def dict_table(self, name):
+        if name not in self.tables:
+            self.tables[name] = SqliteDict(self.conn, name)
+        return self.tables[name]
+
+    def commit(self):
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+
+class SqliteTable():
+    page_size = 1000   # Rows fetched per query when iterating
+
+    def __init__(self, conn, name, columns):
+        self.conn = conn
+        self.name = name
+        # No type on the id column, so int and str IDs are stored as given
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {name} ({columns})")
+        # COUNT(*) is a full scan in SQLite, so keep the length ourselves
+        self.length = conn.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0]
+
+    def __contains__(self, item):
+        row = self.conn.execute(
+            f"SELECT 1 FROM {self.name} WHERE id = ?", (item,)).fetchone()
+        return row != None
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        for row in self._iter_rows("id"):
+            yield row[0]
+
+    def _iter_rows(self, columns):
+        # Page through by rowid rather than holding a cursor open, so the
+        # table can be changed while it is being iterated over.
+        last_rowid = 0
+        while True:
+            rows = self.conn.execute(
+                f"SELECT rowid, {columns} FROM {self.name} WHERE rowid > ? "
+                f"ORDER BY rowid LIMIT ?", (last_rowid, self.page_size)
+            ).fetchall()
+            if len(rows) == 0:
+                return
+            for row in rows:
+                yield row[1:]
+            last_rowid = rows[-1][0]
+
+    def _delete(self, items):
+        cursor = self.conn.executemany(
+            f"DELETE FROM {self.name} WHERE id = ?", [(i,) for i in items])
+        self.length -= cursor.rowcount
+
+    def clear(self):
+        self.conn.execute(f"DELETE FROM {self.name}")
+        self.length = 0
+
+
+class SqliteSet(SqliteTable):
+
+    def __init__(self, conn, name):
+        super().__init__(conn, name, "id PRIMARY KEY")
+
+    def add(self, item):
+        self.update([item])
+
+    def update(self, items):
+        cursor = self.conn.executemany(
+            f"INSERT OR IGNORE INTO {self.name} (id) VALUES (?)",
+            [(i,) for i in items])
+        self.length += cursor.rowcount
+
+    def discard(self, item):
+        self._delete([item])
+
+    def difference_update(self, items):
+        self._delete(items)
+
+
+class SqliteDict(SqliteTable):
+
+    def __init__(self, conn, name):
+        super().__init__(conn, name, "id PRIMARY KEY, data TEXT")
+
+    def __getitem__(self, key):
+        row = self.conn.execute(
+            f"SELECT data FROM {self.name} WHERE id = ?", (key,)).fetchone()
+        if row == None:
+            raise KeyError(key)
+        return json.loads(row[0])
+
+    def __setitem__(self, key, value):
+        self.update({key: value})
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._delete([key])
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def pop(self, key, *default):
+        try:
+            value = self[key]
+        except KeyError:
+            if default:
+                return default[0]
+            raise
+        self._delete([key])
+        return value
+
+    def update(self, other):
+        rows = [(k, json.dumps(v)) for k, v in dict(other).items()]
+        new_count = 0
+        for key, _ in rows:
+            if key not in self:
+                new_count += 1
+        self.conn.executemany(
+            f"INSERT OR REPLACE INTO {self.name} (id, data) VALUES (?, ?)", rows)
+        self.length += new_count
+
+    def keys(self):
+        return iter(self)
+
+    def values(self):
+        for (data,) in self._iter_rows("data"):
+            yield json.loads(data)
+
+    def items(self):
+        for key, data in self._iter_rows("id, data"):
+            yield key, json.loads(data)
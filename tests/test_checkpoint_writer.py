@@ -0,0 +1,101 @@
+import os
+import json
+import threading
+import pytest
+import checkpoint_writer
+from checkpoint_writer import CheckpointWriter, write_atomic
+from crawler_base import CrawlerBase
+
+
+def test_jobs_run_in_order():
+    writer = CheckpointWriter()
+    written = []
+    for i in range(20):
+        writer.submit(written.append, i)
+    writer.flush()
+    assert written == list(range(20))
+    writer.close()
+    assert not writer.thread.is_alive()
+
+
+def test_submit_waits_for_writer():
+    writer = CheckpointWriter(max_pending=2)
+    release = threading.Event()
+    writer.submit(release.wait)
+    writer.submit(lambda: None)
+    writer.submit(lambda: None)
+    # The first job is running and two are queued, so the next must wait
+    blocked = threading.Thread(target=writer.submit, args=(lambda: None,))
+    blocked.start()
+    blocked.join(0.2)
+    assert blocked.is_alive()
+    release.set()
+    blocked.join()
+    writer.close()
+
+
+def test_error_stops_later_writes():
+    writer = CheckpointWriter()
+    written = []
+    def fail():
+        raise OSError("disk full")
+    writer.submit(fail)
+    writer.submit(written.append, "after")
+    with pytest.raises(RuntimeError) as info:
+        writer.flush()
+    assert isinstance(info.value.__cause__, OSError)
+    assert written == []
+    with pytest.raises(RuntimeError):
+        writer.submit(written.append, "later")
+    with pytest.raises(RuntimeError):
+        writer.close()
+
+
+def test_write_atomic_keeps_backup(tmp_path):
+    filepath = str(tmp_path / "state.json")
+    backup_filepath = str(tmp_path / "state_backup.json")
+    write_atomic(filepath, b"1", backup_filepath)
+    write_atomic(filepath, b"2", backup_filepath)
+    assert open(filepath, "rb").read() == b"2"
+    assert open(backup_filepath, "rb").read() == b"1"
+    assert sorted(os.listdir(tmp_path)) == ["state.json", "state_backup.json"]
+
+
+def test_crash_while_writing_leaves_old_file(tmp_path, monkeypatch):
+    filepath = str(tmp_path / "state.json")
+    write_atomic(filepath, b"old")
+    def crash(fd):
+        raise OSError("crashed")
+    monkeypatch.setattr(checkpoint_writer.os, "fsync", crash)
+    with pytest.raises(OSError):
+        write_atomic(filepath, b"new")
+    assert open(filepath, "rb").read() == b"old"
+
+
+def test_crash_between_renames_loads_backup(tmp_path, monkeypatch):
+    crawler = CrawlerBase.offline_instance()
+    filepath = str(tmp_path / "state.json")
+    crawler.write_with_backup(filepath, {"count": 1})
+    crawler.write_with_backup(filepath, {"count": 2})
+
+    # The old copy has become the backup, but the new one is not in place
+    replace = os.replace
+    def crash(source, destination):
+        if destination == filepath:
+            raise OSError("crashed")
+        replace(source, destination)
+    monkeypatch.setattr(checkpoint_writer.os, "replace", crash)
+    with pytest.raises(OSError):
+        crawler.write_with_backup(filepath, {"count": 3})
+    assert not os.path.exists(filepath)
+    assert crawler.load_with_backup(filepath) == {"count": 2}
+
+
+def test_corrupt_file_loads_backup(tmp_path):
+    crawler = CrawlerBase.offline_instance()
+    filepath = str(tmp_path / "state.json")
+    crawler.write_with_backup(filepath, {"count": 1})
+    crawler.write_with_backup(filepath, {"count": 2})
+    with open(filepath, "w") as f:
+        f.write(json.dumps({"count": 3})[:5])
+    assert crawler.load_with_backup(filepath) == {"count": 1}
@@ -0,0 +1,77 @@
+import csv
+import json
+import pytest
+import collate
+import shard_index
+import shard_manifest
+import serialization as ser
+
+# Shards oldest first. "a" is saved again in the newest, which wins. The
+# newest shard, read first, lacks fields and has only empty lists.
+SHARDS = [
+    {"a": {"name": "old", "tags": ["z"]},
+     "b": {"name": "B", "tags": ["y"], "score": 2.5, "extra": False}},
+    {"c": {"name": "C", "tags": [], "score": None}},
+    {"a": {"name": "A", "tags": []}},
+]
+EXPECTED = {
+    "a": {"name": "A", "tags": []},
+    "b": {"name": "B", "tags": ["y"], "score": 2.5, "extra": False},
+    "c": {"name": "C", "tags": [], "score": None},
+}
+
+
+@pytest.fixture
+def dirname(tmp_path):
+    serializer = ser.Serializer("json", "gzip")
+    for i, data in enumerate(SHARDS):
+        shard_path = serializer.path_for(str(tmp_path / f"saved_{i}.json"))
+        with open(shard_path, "wb") as f:
+            f.write(serializer.dumps(data))
+        shard_index.write_index(shard_path, data.keys())
+    shard_manifest.ShardManifest(str(tmp_path)).rebuild()
+    return str(tmp_path)
+
+
+def test_collate_json(dirname, tmp_path):
+    output = str(tmp_path / "out.json")
+    assert collate.collate(dirname, output, "json") == 3
+    with open(output, "r") as f:
+        assert json.load(f) == EXPECTED
+
+
+def test_collate_jsonl(dirname, tmp_path):
+    output = str(tmp_path / "out.jsonl")
+    assert collate.collate(dirname, output, "jsonl") == 3
+    with open(output, "r") as f:
+        rows = [json.loads(line) for line in f]
+    assert {row.pop("id"): row for row in rows} == EXPECTED
+
+
+def test_collate_csv_keeps_every_field(dirname, tmp_path, monkeypatch):
+    monkeypatch.setattr(collate, "has_pyarrow", lambda: False)
+    output = collate.default_output_path(dirname, "columnar")
+    assert output.endswith(".csv")
+    assert collate.collate(dirname, output, "columnar") == 3
+    with open(output, "r", newline="") as f:
+        rows = {row["id"]: row for row in csv.DictReader(f)}
+    assert set(rows["a"]) == {"id", "name", "tags", "score", "extra"}
+    assert json.loads(rows["b"]["tags"]) == ["y"]
+    assert (rows["b"]["score"], rows["b"]["extra"]) == ("2.5", "False")
+    assert rows["a"]["score"] == rows["a"]["extra"] == ""
+
+
+def test_collate_parquet_unifies_schemas(dirname, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    output = str(tmp_path / "out.parquet")
+    assert collate.write_parquet(dirname, output) == 3
+    rows = {row.pop("id"): row for row in pq.read_table(output).to_pylist()}
+    assert rows["a"] == {"name": "A", "tags": [], "score": None, "extra": None}
+    assert rows["b"] == EXPECTED["b"]
+    assert rows["c"] == {"name": "C", "tags": [], "score": None, "extra": None}
+
+
+def test_collate_empty_folder(tmp_path):
+    output = str(tmp_path / "out.jsonl")
+    assert collate.collate(str(tmp_path), output, "jsonl") == 0
+    assert collate.write_csv(str(tmp_path), str(tmp_path / "out.csv")) == 0
@@ -0,0 +1,57 @@
+import os
+import columnar
+import shard_index
+from crawler_track_info import TrackInfoCrawler
+
+SCHEMA = [
+    ("name", "str"),
+    ("artists", "json"),
+    ("popularity", "int8"),
+    ("duration_ms", "int32"),
+    ("plays", "int64"),
+    ("explicit", "bool"),
+    ("energy", "float32"),
+]
+ROWS = {
+    "a": {"name": "Song", "artists": ["x", "y"], "popularity": 55,
+          "duration_ms": 201000, "plays": 2**40, "explicit": True,
+          "energy": 0.123},
+    "b": {"name": None, "artists": None, "popularity": None,
+          "duration_ms": None, "plays": None, "explicit": None,
+          "energy": None},
+    "c": {"name": "Ünïcode ♪", "artists": [], "popularity": -1,
+          "duration_ms": 0, "plays": 0, "explicit": False, "energy": 1.0},
+}
+
+
+def test_columns_round_trip_with_nulls(tmp_path):
+    dirpath = str(tmp_path / "saved_0.cols")
+    columnar.write_columns(dirpath, list(ROWS), list(ROWS.values()), SCHEMA)
+    assert columnar.read_columns(dirpath) == ROWS
+    # Only columns holding a null need a mask. JSON columns encode their own.
+    masks = {name for name in os.listdir(dirpath) if name.endswith(".mask")}
+    assert masks == {f"{field}.mask" for field, kind in SCHEMA if kind != "json"}
+
+
+def test_missing_fields_read_as_null(tmp_path):
+    dirpath = str(tmp_path / "saved_0.cols")
+    columnar.write_columns(dirpath, [1, 2], [{"name": "x"}, {}], SCHEMA[:3])
+    assert columnar.read_columns(dirpath) == {
+        "1": {"name": "x", "artists": None, "popularity": None},
+        "2": {"name": None, "artists": None, "popularity": None},
+    }
+
+
+def test_track_info_replaces_columnar_shard(tmp_path):
+    crawler = TrackInfoCrawler.offline_instance()
+    crawler.columnar_output = True
+    # Saved with TrackInfoCrawler's own schema, which has no "plays"
+    track = {field: value for field, value in ROWS["c"].items() if field != "plays"}
+    filepath = str(tmp_path / "saved_0.json")
+    shard_path = crawler.write_shard(filepath, {"a": ROWS["a"]})
+    assert shard_path == str(tmp_path / "saved_0.cols")
+    # Written alongside, then swapped in over the old shard
+    assert crawler.write_shard(filepath, {"c": track}) == shard_path
+    assert os.listdir(tmp_path) == ["saved_0.cols"]
+    saved = shard_index.load_shard(shard_path)
+    assert {field: saved["c"][field] for field in track} == track
@@ -0,0 +1,22 @@
+import pytest
+from crawl_options import StorageOptions, NetworkOptions
+
+
+@pytest.mark.parametrize("options", [
+    {"state_backend": "csv"},
+    {"state_backend": "sqlite", "use_journal": True},
+    {"frontier_memory_items": 10, "use_journal": True},
+    {"frontier_memory_items": 10, "state_backend": "sqlite"},
+])
+def test_storage_options_reject_conflicts(options):
+    with pytest.raises(ValueError):
+        StorageOptions(**options)
+
+
+def test_replace_copies_options():
+    network = NetworkOptions(concurrency=4)
+    replaced = network.replace(rate_limiter="limiter")
+    assert (replaced.concurrency, replaced.rate_limiter) == (4, "limiter")
+    assert network.rate_limiter == None
+    with pytest.raises(TypeError):
+        network.replace(concurency=8)
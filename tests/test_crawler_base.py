@@ -0,0 +1,208 @@
+import os
+import threading
+import pytest
+import shard_index
+import crawler_base
+import rate_limiter as rl
+from spotipy.client import SpotifyException
+from crawler_base import CrawlerBase
+from crawl_options import StorageOptions, SchedulingOptions, NetworkOptions, \
+    OutputOptions
+from frontier import unpack_id, RECORD_SIZE
+
+ITEM_IDS = [unpack_id(i.to_bytes(RECORD_SIZE, "big")) for i in range(300)]
+QUIET = OutputOptions(show_progress=False)
+
+
+@pytest.fixture(autouse=True)
+def in_tmp_path(tmp_path, monkeypatch):
+    # Crawlers save under ./data
+    monkeypatch.chdir(tmp_path)
+
+
+class SpillingCrawler(CrawlerBase):
+    # Collects its metrics from another thread as each batch is cleared, when
+    # the frontier's buffer may have run out, checking that doing so never
+    # reads the frontier ahead
+    metrics_checks = 0
+
+    def initial_setup(self):
+        self.unsearched_items.update(ITEM_IDS)
+
+    def make_search_request(self, items_to_search):
+        return [item.lower() for item in items_to_search]
+
+    def clear_searched_items(self, items_searched):
+        super().clear_searched_items(items_searched)
+        frontier = self.unsearched_items
+        before = (frontier.read_count, dict(frontier.buffer))
+        collector = threading.Thread(target=self.collect_metrics)
+        collector.start()
+        collector.join()
+        assert (frontier.read_count, dict(frontier.buffer)) == before
+        self.metrics_checks += len(items_searched)
+
+
+def test_metrics_thread_leaves_spilling_frontier_alone():
+    crawler = SpillingCrawler("spilling", items_per_file=40, count_threshold=25,
+                              storage=StorageOptions(frontier_memory_items=10),
+                              output=QUIET)
+    assert crawler.complete and crawler.metrics_checks == len(ITEM_IDS)
+    assert sorted(crawler.saved_items) == sorted(ITEM_IDS)
+
+
+class VersionedCrawler(CrawlerBase):
+    version = 1
+
+    def initial_setup(self):
+        self.unsearched_items.update(ITEM_IDS[:50])
+
+    def make_search_request(self, items_to_search):
+        return [{"version": self.version} for _ in items_to_search]
+
+
+def saved_files(dirname):
+    return sorted(name for name in os.listdir(dirname) if name.startswith("saved_"))
+
+
+@pytest.mark.parametrize("compression", ["gzip", None])
+def test_refresh_rewrites_compressed_shards(compression):
+    VersionedCrawler("versioned", items_per_file=20, count_threshold=10,
+                     storage=StorageOptions(compression="gzip"), output=QUIET)
+    dirname = os.path.join("data", "versioned")
+    assert "saved_2.json.gz" in saved_files(dirname)
+
+    # Refreshed into the same format, or a different one
+    VersionedCrawler.version = 2
+    try:
+        crawler = VersionedCrawler(
+            "versioned", items_per_file=20, count_threshold=10,
+            storage=StorageOptions(compression=compression),
+            scheduling=SchedulingOptions(refresh_max_age=0), output=QUIET)
+    finally:
+        VersionedCrawler.version = 1
+    extension = ".json.gz" if compression == "gzip" else ".json"
+    assert saved_files(dirname) == sorted(
+        f"saved_{i}{suffix}" for i in range(3) for suffix in [extension, ".idx"]) \
+        + ["saved_manifest.jsonl"]
+    assert crawler.manifest.verify() == []
+    results = {}
+    for filepath in crawler.list_shard_paths():
+        results.update(shard_index.load_shard(filepath))
+    assert results == {item: {"version": 2} for item in ITEM_IDS[:50]}
+
+
+class FailingCrawler(CrawlerBase):
+    # Batches holding a failing item raise error, until fixed
+    batch_size = 10
+    error = None
+    failing_item = ITEM_IDS[25]
+    requests = 0          # Requests for the failing item's batches
+
+    def initial_setup(self):
+        self.unsearched_items.update(ITEM_IDS[:50])
+
+    def make_search_request(self, items_to_search):
+        if self.failing_item in items_to_search and self.error != None:
+            FailingCrawler.requests += 1
+            error = self.error
+            if rl.is_rate_limited(error):
+                # Throttled once only
+                FailingCrawler.error = None
+            raise error
+        return [item.lower() for item in items_to_search]
+
+
+@pytest.fixture
+def failing_crawler(monkeypatch):
+    monkeypatch.setattr(crawler_base, "SLEEP_TIMES", [0, 0, 0])
+    monkeypatch.setattr(crawler_base, "ISOLATION_SLEEP_TIMES", [0, 0])
+    monkeypatch.setattr(FailingCrawler, "requests", 0)
+    def run(error):
+        monkeypatch.setattr(FailingCrawler, "error", error)
+        return FailingCrawler(
+            "failing", items_per_file=20, count_threshold=5,
+            storage=StorageOptions(background_checkpoints=False),
+            network=NetworkOptions(rate_limiter=rl.RateLimiter(rate=1000)),
+            output=QUIET)
+    return run
+
+
+@pytest.mark.parametrize("error", [
+    SpotifyException(503, -1, "Service unavailable", headers={}),
+    SpotifyException(429, -1, "/v1/artists:\n Max Retries", reason="too many 500 error responses"),
+])
+def test_server_errors_stop_the_crawl(failing_crawler, error):
+    with pytest.raises(SpotifyException):
+        failing_crawler(error)
+    # Retried, but not searched again in halves or set aside
+    assert FailingCrawler.requests == len(crawler_base.SLEEP_TIMES)
+    assert not os.path.exists(os.path.join("data", "failing", "invalid.json"))
+
+
+def test_throttle_is_retried(failing_crawler):
+    crawler = failing_crawler(SpotifyException(429, -1, "Too many requests",
+                                               headers={"Retry-After": "0"}))
+    assert crawler.complete and len(crawler.invalid_items) == 0
+    assert crawler.rate_limiter.rate < 1000
+
+
+def test_bad_item_is_set_aside(failing_crawler):
+    crawler = failing_crawler(SpotifyException(400, -1, "invalid id", headers={}))
+    assert crawler.complete
+    assert list(crawler.invalid_items) == [FailingCrawler.failing_item]
+    assert len(crawler.saved_items) == 49
+
+
+class FanOutCrawler(CrawlerBase):
+    # One request per item, where failing_item fails until fixed
+    batch_size = 10
+    bulk_request = False
+    error = None
+    failing_item = ITEM_IDS[25]
+
+    def initial_setup(self):
+        self.requests = {}
+        self.unsearched_items.update(ITEM_IDS[:50])
+
+    def make_single_request(self, item):
+        self.requests[item] = self.requests.get(item, 0) + 1
+        if item == self.failing_item and self.error != None:
+            error = self.error
+            if isinstance(error, crawler_base.TIMEOUT_ERRORS):
+                # Times out once only
+                self.error = None
+            raise error
+        return item.lower()
+
+
+@pytest.fixture
+def fan_out_crawler(monkeypatch):
+    monkeypatch.setattr(crawler_base, "SLEEP_TIMES", [0, 0, 0])
+    monkeypatch.setattr(crawler_base, "ISOLATION_SLEEP_TIMES", [0, 0])
+    def run(error, concurrency):
+        monkeypatch.setattr(FanOutCrawler, "error", error)
+        return FanOutCrawler(
+            "fan_out", items_per_file=20, count_threshold=5,
+            network=NetworkOptions(concurrency=concurrency), output=QUIET)
+    return run
+
+
+@pytest.mark.parametrize("concurrency", [1, 4])
+def test_fan_out_retries_only_failed_items(fan_out_crawler, concurrency):
+    crawler = fan_out_crawler(crawler_base.ReadTimeout(), concurrency)
+    assert crawler.complete and len(crawler.saved_items) == 50
+    assert crawler.requests.pop(FanOutCrawler.failing_item) == 2
+    assert set(crawler.requests.values()) == {1}
+
+
+@pytest.mark.parametrize("concurrency", [1, 4])
+def test_fan_out_sets_bad_item_aside(fan_out_crawler, concurrency):
+    crawler = fan_out_crawler(SpotifyException(400, -1, "invalid id", headers={}),
+                              concurrency)
+    assert crawler.complete
+    assert list(crawler.invalid_items) == [FanOutCrawler.failing_item]
+    assert len(crawler.saved_items) == 49
+    # The rest of its batch was not requested again while bisecting
+    del crawler.requests[FanOutCrawler.failing_item]
+    assert set(crawler.requests.values()) == {1}
@@ -0,0 +1,55 @@
+import shutil
+import pytest
+import collate
+import id_registry
+import rate_limiter as rl
+import shard_index
+from pipeline import StageFeed
+from crawl_options import NetworkOptions, OutputOptions
+from crawler_related_artists import RelatedArtistsCrawler, SEED_ARTIST_ID
+from mock_spotify_server import SyntheticCatalog, MockSpotifyServer, create_mock_accessor
+
+# Spotipy warns that the related artists endpoint is deprecated
+pytestmark = pytest.mark.filterwarnings("ignore::DeprecationWarning")
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    catalog = SyntheticCatalog(300, seed_artist_id=SEED_ARTIST_ID)
+    server = MockSpotifyServer(catalog).start()
+    yield server
+    server.stop()
+
+
+def crawl(server, **kwargs):
+    return RelatedArtistsCrawler("related_artists", 50, 10,
+                                 client=create_mock_accessor(server.url),
+                                 network=NetworkOptions(
+                                     rate_limiter=rl.RateLimiter(rate=5000)),
+                                 output=OutputOptions(show_progress=False),
+                                 **kwargs)
+
+
+def test_saved_artists_published_from_indexes(server, monkeypatch):
+    crawl(server)
+    saved = {item for item, _ in collate.iter_results("data/related_artists")}
+    assert len(saved) == 300
+    shutil.rmtree("data/ids")
+
+    # Collating at the end reads the shards, but starting up must not
+    loads = []
+    load_shard = shard_index.load_shard
+    def counting_load_shard(filepath):
+        loads.append(filepath)
+        return load_shard(filepath)
+    monkeypatch.setattr(shard_index, "load_shard", counting_load_shard)
+    crawl_loop = RelatedArtistsCrawler.crawl
+    def checked_crawl(crawler):
+        assert loads == []
+        crawl_loop(crawler)
+    monkeypatch.setattr(RelatedArtistsCrawler, "crawl", checked_crawl)
+    feed = StageFeed()
+    crawl(server, downstream=[feed])
+    assert set(feed.drain()) == saved
+    assert set(id_registry.registered_ids("data", "artists")) == saved
@@ -0,0 +1,109 @@
+import threading
+import pytest
+from frontier import PackedIdSet, SpillingFrontier, pack_id, unpack_id, RECORD_SIZE
+
+# A real artist ID from the high end of the range
+HIGH_ID = "7tYKF4w9nC0nq9CsPZTHyP"
+MAX_ID = "7N42dgm5tFLK9N8MT7fHC7"
+
+
+def test_round_trip_high_range_id():
+    assert unpack_id(pack_id(HIGH_ID)) == HIGH_ID
+    assert unpack_id(pack_id("4iHNK0tOyZPYnBU7nGAgpQ")) == "4iHNK0tOyZPYnBU7nGAgpQ"
+
+
+def test_maximum_id_is_spotifys():
+    assert unpack_id(b"\xff" * RECORD_SIZE) == MAX_ID
+    assert pack_id(MAX_ID) == b"\xff" * RECORD_SIZE
+
+
+def test_packing_keeps_id_order():
+    ids = ["0000000000000000000000", "000000000000000000000a",
+           "000000000000000000000A", HIGH_ID]
+    assert sorted(ids, key=pack_id) == ids
+
+
+def test_pack_id_rejects_non_ids():
+    for item_id in ["short", "7N42dgm5tFLK9N8MT7fHC8", "!" * 22, None]:
+        with pytest.raises(ValueError):
+            pack_id(item_id)
+
+
+def test_packed_id_set_keeps_unpackable_ids(tmp_path):
+    filepath = str(tmp_path / "seen.bin")
+    ids = PackedIdSet(filepath, merge_min=2)
+    ids.update([HIGH_ID, "not-an-id"])
+    ids.add("0000000000000000000001")
+    ids.add("zzzzzzzzzzzzzzzzzzzzzz")   # Over 128 bits
+    assert HIGH_ID in ids and "not-an-id" in ids
+    assert "zzzzzzzzzzzzzzzzzzzzzz" in ids
+    assert len(ids) == 4
+
+    count = ids.flush()
+    restored = PackedIdSet(filepath)
+    restored.load(count, ids.saved_string_count)
+    assert set(restored) == {HIGH_ID, "not-an-id", "0000000000000000000001",
+                             "zzzzzzzzzzzzzzzzzzzzzz"}
+
+
+def test_packed_id_set_load_drops_strings_after_checkpoint(tmp_path):
+    filepath = str(tmp_path / "seen.bin")
+    ids = PackedIdSet(filepath)
+    ids.add("first")
+    count = ids.flush()
+    string_count = ids.saved_string_count
+    ids.add("after-checkpoint")
+    ids.flush()
+
+    restored = PackedIdSet(filepath)
+    restored.load(count, string_count)
+    assert set(restored) == {"first"}
+
+
+def test_frontier_keeps_unpackable_ids(tmp_path):
+    frontier = SpillingFrontier(str(tmp_path), max_memory_items=2)
+    frontier.update([HIGH_ID, "zzzzzzzzzzzzzzzzzzzzzz", MAX_ID])
+    assert len(frontier) == 3
+    state = frontier.checkpoint()
+    frontier.close()
+
+    restored = SpillingFrontier(str(tmp_path), max_memory_items=2)
+    restored.load(state)
+    items = []
+    while len(restored) > 0:
+        item = next(iter(restored))
+        items.append(item)
+        restored.discard(item)
+    assert sorted(items) == sorted([HIGH_ID, "zzzzzzzzzzzzzzzzzzzzzz", MAX_ID])
+
+
+def test_frontier_count_from_another_thread_while_spilling(tmp_path):
+    # The crawl thread adds, fills and discards while a metrics thread reads
+    # the count. Every ID must still be handed out exactly once.
+    ids = [unpack_id(i.to_bytes(RECORD_SIZE, "big")) for i in range(5000)]
+    frontier = SpillingFrontier(str(tmp_path), max_memory_items=50)
+    stop = threading.Event()
+    counts = []
+
+    def read_counts():
+        while not stop.is_set():
+            counts.append(frontier.count())
+    reader = threading.Thread(target=read_counts)
+    reader.start()
+    try:
+        handed_out = []
+        for start in range(0, len(ids), 500):
+            frontier.update(ids[start:start + 500])
+            for _ in range(300):
+                item = next(iter(frontier))
+                handed_out.append(item)
+                frontier.discard(item)
+        while len(frontier) > 0:
+            item = next(iter(frontier))
+            handed_out.append(item)
+            frontier.discard(item)
+    finally:
+        stop.set()
+        reader.join()
+    assert handed_out == ids
+    assert len(counts) > 0 and all(0 <= count <= len(ids) for count in counts)
@@ -0,0 +1,66 @@
+import os
+import json
+import pytest
+import graph_export
+import shard_index
+
+# Shards oldest first. "a" was searched again in the newest, which wins.
+SHARDS = [
+    {"a": ["b"], "b": ["a", "c"]},
+    {"c": []},
+    {"a": ["c", "d", "b"]},
+]
+EXPECTED = {"a": ["c", "d", "b"], "b": ["a", "c"], "c": [], "d": []}
+
+
+@pytest.fixture
+def graph_path(tmp_path):
+    dirname = tmp_path / "related_artists"
+    dirname.mkdir()
+    for i, data in enumerate(SHARDS):
+        shard_path = str(dirname / f"saved_{i}.json")
+        with open(shard_path, "w") as f:
+            json.dump(data, f)
+        shard_index.write_index(shard_path, data.keys())
+    assert graph_export.export_graph(str(dirname)) == (4, 5)
+    return graph_export.default_output_path(str(dirname))
+
+
+def neighbour_ids(graph, artist_id):
+    return [graph.artist_id(int(node))
+            for node in graph.neighbours_of(graph.node(artist_id))]
+
+
+@pytest.mark.parametrize("use_numpy", [False, True])
+def test_export_and_load(graph_path, use_numpy):
+    if use_numpy:
+        pytest.importorskip("numpy")
+    assert graph_path.endswith("related_artists.graph")
+    graph = graph_export.load_graph(graph_path, use_numpy)
+    assert len(graph) == 4
+    assert graph.meta["searched"] == 3
+    assert {graph.artist_id(node): neighbour_ids(graph, graph.artist_id(node))
+            for node in range(len(graph))} == EXPECTED
+    # "d" was found, but not searched
+    assert graph.degree(graph.node("d")) == 0
+    assert graph.degree(graph.node("a")) == 3
+
+
+def test_export_replaces_old_graph(graph_path, tmp_path):
+    dirname = str(tmp_path / "related_artists")
+    shard_path = os.path.join(dirname, "saved_3.json")
+    with open(shard_path, "w") as f:
+        json.dump({"d": ["a"]}, f)
+    shard_index.write_index(shard_path, ["d"])
+    assert graph_export.export_graph(dirname) == (4, 6)
+    graph = graph_export.load_graph(graph_path, use_numpy=False)
+    assert neighbour_ids(graph, "d") == ["a"]
+    assert sorted(os.listdir(tmp_path)) == ["related_artists", "related_artists.graph"]
+
+
+def test_export_empty_folder(tmp_path):
+    output_dirpath = str(tmp_path / "empty.graph")
+    assert graph_export.export_graph(str(tmp_path), output_dirpath) == (0, 0)
+    graph = graph_export.load_graph(output_dirpath)
+    assert len(graph) == 0
+    assert list(graph.offsets) == [0]
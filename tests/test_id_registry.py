@@ -0,0 +1,30 @@
+import id_registry
+from id_registry import IdRegistry
+
+HIGH_ID = "7tYKF4w9nC0nq9CsPZTHyP"
+
+
+def test_registry_streams_every_id(tmp_path):
+    registry = IdRegistry(str(tmp_path / "ids"), "artists").load()
+    registry.update(["4iHNK0tOyZPYnBU7nGAgpQ", HIGH_ID, None, "not-an-id",
+                     HIGH_ID, "zzzzzzzzzzzzzzzzzzzzzz"])
+    registry.flush()
+    assert id_registry.registered_ids(str(tmp_path), "artists") == None
+
+    registry.mark_complete()
+    ids = list(id_registry.registered_ids(str(tmp_path), "artists"))
+    assert ids == ["4iHNK0tOyZPYnBU7nGAgpQ", HIGH_ID, "not-an-id",
+                   "zzzzzzzzzzzzzzzzzzzzzz"]
+
+
+def test_registry_resumes_from_checkpoint(tmp_path):
+    dirname = str(tmp_path / "ids")
+    registry = IdRegistry(dirname, "tracks").load()
+    registry.update(["0000000000000000000001", "string-1"])
+    registry.flush()
+    registry.update(["0000000000000000000002", "string-2"])
+    registry.ids.flush()   # Written, but not checkpointed
+
+    restored = IdRegistry(dirname, "tracks").load()
+    assert set(restored.ids) == {"0000000000000000000001", "string-1"}
+
@@ -0,0 +1,56 @@
+import pytest
+import markets
+from crawler_track_info import TrackInfoCrawler
+
+
+@pytest.mark.parametrize("codes", [
+    [],
+    ["GB"],
+    ["AD", "ZW"],
+    markets.COUNTRIES,
+])
+def test_markets_round_trip(codes):
+    encoded = markets.encode_markets(codes)
+    assert isinstance(encoded, str) and len(encoded) <= 46
+    assert markets.decode_markets(encoded) == codes
+
+
+def test_decoded_in_table_order():
+    encoded = markets.encode_markets(["US", "GB", "US"])
+    assert encoded == markets.encode_markets(["GB", "US"])
+    assert markets.decode_markets(encoded) == ["GB", "US"]
+
+
+def test_unknown_code_kept_as_list():
+    codes = ["GB", "XX", "US"]
+    encoded = markets.encode_markets(codes)
+    assert encoded == codes and encoded is not codes
+    assert markets.decode_markets(encoded) == codes
+
+
+def test_decode_accepts_lists_and_missing():
+    assert markets.decode_markets(["GB", "US"]) == ["GB", "US"]
+    assert markets.decode_markets(None) == None
+
+
+def track(track_id, available_markets):
+    return {"id": track_id, "name": track_id.upper(),
+            "available_markets": available_markets}
+
+
+def test_track_info_saves_bitmask():
+    crawler = TrackInfoCrawler.offline_instance()
+    crawler.fields = ["name", "available_markets"]
+    crawler.markets_format = "bitmask"
+    results = {"info": {"tracks": [track("a", ["GB", "US"]), track("b", ["GB", "XX"])]},
+               "af": [None, None]}
+    assert crawler.process_search_results(["a", "b"], results) == ["a", "b"]
+    saved = crawler.searched_items
+    assert saved["a"]["available_markets"] == markets.encode_markets(["GB", "US"])
+    assert saved["b"]["available_markets"] == ["GB", "XX"]
+    assert markets.decode_markets(saved["a"]["available_markets"]) == ["GB", "US"]
+
+
+def test_unknown_markets_format():
+    with pytest.raises(ValueError):
+        TrackInfoCrawler("track_info", markets_format="hex")
@@ -0,0 +1,78 @@
+import json
+import urllib.request
+import pytest
+import metrics as mt
+
+
+def test_prometheus_text():
+    registry = mt.MetricsRegistry(crawler="tracks")
+    searched = registry.counter("items_searched_total", "Items searched")
+    searched.inc(3)
+    searched.inc(2)
+    registry.gauge("frontier_size", "Frontier size").set(7, kind="unsearched")
+    latency = registry.histogram("request_seconds", "Latency", buckets=(0.1, 1))
+    latency.observe(0.05, endpoint="tracks")
+    latency.observe(0.5, endpoint="tracks")
+
+    lines = registry.to_prometheus().splitlines()
+    assert "# TYPE items_searched_total counter" in lines
+    assert 'items_searched_total{crawler="tracks"} 5' in lines
+    assert 'frontier_size{crawler="tracks",kind="unsearched"} 7' in lines
+    assert 'request_seconds_bucket{crawler="tracks",endpoint="tracks",le="0.1"} 1' in lines
+    assert 'request_seconds_bucket{crawler="tracks",endpoint="tracks",le="1"} 2' in lines
+    assert 'request_seconds_bucket{crawler="tracks",endpoint="tracks",le="+Inf"} 2' in lines
+    assert 'request_seconds_count{crawler="tracks",endpoint="tracks"} 2' in lines
+
+
+def test_collectors_refresh_before_export():
+    registry = mt.MetricsRegistry()
+    gauge = registry.gauge("size", "Size")
+    sizes = iter([1, 2])
+    registry.add_collector(lambda: gauge.set(next(sizes)))
+    assert registry.snapshot()["size"] == [{"labels": {}, "value": 1}]
+    assert "size 2" in registry.to_prometheus().splitlines()
+
+
+class FailingClient():
+
+    def artists(self, ids):
+        raise ValueError("bad ids")
+
+
+def test_timed_client_counts_errors():
+    registry = mt.MetricsRegistry()
+    latency = registry.histogram("request_seconds", "Latency")
+    errors = registry.counter("request_errors_total", "Errors")
+    client = mt.TimedClient(FailingClient(), latency, errors)
+    with pytest.raises(ValueError):
+        client.artists(["a"])
+    snapshot = registry.snapshot()
+    assert snapshot["request_seconds"][0]["count"] == 1
+    assert snapshot["request_errors_total"] == [
+        {"labels": {"endpoint": "artists", "exception": "ValueError"}, "value": 1}]
+
+
+def test_rolling_jsonl_rotates(tmp_path):
+    filepath = str(tmp_path / "metrics.jsonl")
+    writer = mt.RollingJsonlWriter(filepath, max_bytes=10, backups=2)
+    for i in range(4):
+        writer.write({"record": i})
+    with open(filepath, "r") as f:
+        assert json.loads(f.read()) == {"record": 3}
+    with open(filepath + ".1", "r") as f:
+        assert json.loads(f.read()) == {"record": 2}
+    with open(filepath + ".2", "r") as f:
+        assert json.loads(f.read()) == {"record": 1}
+    assert not (tmp_path / "metrics.jsonl.3").exists()
+
+
+def test_serve_metrics():
+    registry = mt.MetricsRegistry()
+    registry.counter("checks_total", "Checks").inc()
+    server = mt.serve_metrics(registry, 0, host="127.0.0.1")
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url) as response:
+            assert "checks_total 1" in response.read().decode("utf-8").splitlines()
+    finally:
+        server.shutdown()
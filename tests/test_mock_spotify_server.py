@@ -0,0 +1,19 @@
+from frontier import pack_id, unpack_id, BASE62
+from mock_spotify_server import SyntheticCatalog
+
+
+def test_catalog_ids_pack_and_round_trip():
+    catalog = SyntheticCatalog(2000)
+    for i in range(2000):
+        artist_id = catalog.artist_id(i)
+        assert unpack_id(pack_id(artist_id)) == artist_id
+        assert catalog.artist_index(artist_id) == i
+
+
+def test_catalog_ids_cover_high_range():
+    # IDs in the high range, where the first characters are near the end of
+    # the alphabet
+    catalog = SyntheticCatalog(2000)
+    ids = [catalog.artist_id(i) for i in range(2000)]
+    assert any(BASE62.index(artist_id[1]) >= BASE62.index("n")
+               for artist_id in ids if artist_id[0] == "7")
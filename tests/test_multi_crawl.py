@@ -0,0 +1,80 @@
+import os
+import json
+import collate
+import multi_crawl
+import serialization as ser
+import shared_functions as sf
+from crawler_base import CrawlerBase
+from crawl_options import OutputOptions
+
+NODES = 60
+
+
+def neighbours(item):
+    n = int(item[1:])
+    return [f"n{(n * 7 + k) % NODES}" for k in range(3)]
+
+
+class GraphCrawler(CrawlerBase):
+
+    def __init__(self, dirname, credentials=None, **kwargs):
+        super().__init__(dirname, 20, 10, False,
+                         output=OutputOptions(show_progress=False), **kwargs)
+
+    def initial_setup(self):
+        self.unsearched_items.add("n0")
+
+    def make_search_request(self, items_to_search):
+        return [neighbours(item) for item in items_to_search]
+
+    def process_search_results(self, items_to_search, results):
+        for item, result in zip(items_to_search, results):
+            self.add_new_items(result)
+            self.searched_items[item] = result
+        return items_to_search
+
+
+def test_exchange_outboxes(tmp_path):
+    folders = [str(tmp_path / f"worker_{i}") for i in range(3)]
+    for folder in folders:
+        os.makedirs(folder)
+    items = [f"id_{i}" for i in range(20)]
+    with open(os.path.join(folders[0], "outbox.json"), "w") as f:
+        json.dump(items, f)
+    owner = sf.partition_index(items[0], 3)
+    with open(os.path.join(folders[owner], "inbox.json"), "w") as f:
+        json.dump(["kept"], f)
+
+    moved, active = multi_crawl.exchange_outboxes(folders, 3)
+    assert moved == 20
+    inboxes = [set(multi_crawl.load_id_file(os.path.join(f, "inbox.json")))
+               for f in folders]
+    assert active == [i for i in range(3) if len(inboxes[i]) > 0]
+    assert "kept" in inboxes[owner]
+    for item in items:
+        assert item in inboxes[sf.partition_index(item, 3)]
+    assert ser.find_variant(os.path.join(folders[0], "outbox.json")) == None
+    # Nothing left to hand over
+    assert multi_crawl.exchange_outboxes(folders, 3)[0] == 0
+
+
+def test_multi_crawl_covers_graph(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    output_filepath = multi_crawl.multi_crawl(GraphCrawler, "graph", [{}, {}, {}])
+    with open(output_filepath, "r") as f:
+        collated = json.load(f)
+
+    # Every node reachable from n0, each searched by the worker owning it
+    reachable, queue = {"n0"}, ["n0"]
+    while queue:
+        for item in neighbours(queue.pop()):
+            if item not in reachable:
+                reachable.add(item)
+                queue.append(item)
+    assert set(collated) == reachable
+    saved = [dict(collate.iter_results(os.path.join("data", "graph", f"worker_{i}")))
+             for i in range(3)]
+    for item in reachable:
+        assert collated[item] == neighbours(item)
+        assert item in saved[sf.partition_index(item, 3)]
+    assert sum(len(worker_saved) for worker_saved in saved) == len(reachable)
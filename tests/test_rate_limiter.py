@@ -0,0 +1,53 @@
+import pytest
+import rate_limiter as rl
+
+
+class FakeClock():
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rl.time, "monotonic", clock)
+    return clock
+
+
+def test_burst_of_429s_cuts_rate_once(clock):
+    limiter = rl.RateLimiter(rate=16, decrease=0.5, cooldown=1)
+    for _ in range(20):
+        # Every request in flight is throttled at once
+        limiter.on_throttle(retry_after=2)
+        clock.now += 0.01
+    assert limiter.rate == 8
+    assert limiter.blocked_until == pytest.approx(1000.19 + 2)
+
+
+def test_throttle_after_cooldown_cuts_rate_again(clock):
+    limiter = rl.RateLimiter(rate=16, decrease=0.5, cooldown=1)
+    limiter.on_throttle(retry_after=3)
+    clock.now += 2.5
+    limiter.on_throttle(retry_after=3)
+    assert limiter.rate == 8
+    clock.now += 0.6             # Still blocked by the second Retry-After
+    limiter.on_throttle()
+    assert limiter.rate == 8
+    clock.now += 2.5
+    limiter.on_throttle()
+    assert limiter.rate == 4
+
+
+def test_throttle_without_retry_after_uses_cooldown(clock):
+    limiter = rl.RateLimiter(rate=16, decrease=0.5, cooldown=1, min_rate=5)
+    limiter.on_throttle()
+    clock.now += 0.5
+    limiter.on_throttle()
+    assert limiter.rate == 8
+    clock.now += 0.5
+    limiter.on_throttle()
+    assert limiter.rate == 5
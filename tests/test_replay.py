@@ -0,0 +1,73 @@
+import os
+import gzip
+import json
+import collate
+import replay
+from crawler_base import CrawlerBase
+from crawl_options import OutputOptions
+
+ITEMS = [f"item_{i}" for i in range(25)]
+
+
+class ListCrawler(CrawlerBase):
+
+    def initial_setup(self):
+        self.unsearched_items.update(ITEMS)
+
+    def make_search_request(self, items_to_search):
+        return [item.upper() for item in items_to_search]
+
+    def process_search_results(self, items_to_search, results):
+        for item, result in zip(items_to_search, results):
+            self.searched_items[item] = {"name": result, "length": len(result)}
+        return items_to_search
+
+
+def test_replay_matches_live_run(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    output = OutputOptions(show_progress=False, record_responses=True)
+    ListCrawler("list", items_per_file=10, count_threshold=4, output=output)
+    assert len(replay.list_raw_files(os.path.join("data", "list", "raw"))) > 0
+
+    live_filepath = str(tmp_path / "live.json")
+    assert collate.collate(os.path.join("data", "list"), live_filepath, "json") == 25
+    replayed_filepath = replay.replay(ListCrawler, "list", processes=1)
+    with open(live_filepath, "r") as f:
+        live = json.load(f)
+    with open(replayed_filepath, "r") as f:
+        assert json.load(f) == live
+    assert live["item_3"] == {"name": "ITEM_3", "length": 6}
+
+
+def test_flushed_records_survive_crash(tmp_path):
+    dirname = str(tmp_path / "raw")
+    recorder = replay.ResponseRecorder(dirname)
+    recorder.record(["a", "b"], ["A", "B"])
+    recorder.flush()
+    recorder.record(["c"], ["C"])
+    recorder.flush()
+    # Crash partway through writing the next member
+    filepath, = replay.list_raw_files(dirname)
+    member = gzip.compress(b'{"items": ["d"], "results": ["D"]}\n')
+    with open(filepath, "ab") as f:
+        f.write(member[:len(member) // 2])
+    assert list(replay.read_records(filepath)) == [
+        (["a", "b"], ["A", "B"]), (["c"], ["C"])]
+
+    # A restarted recorder carries on in a new file
+    recorder = replay.ResponseRecorder(dirname, records_per_file=1)
+    recorder.record(["e"], ["E"])
+    recorder.record(["f"], ["F"])
+    recorder.close()
+    filepaths = replay.list_raw_files(dirname)
+    assert [os.path.basename(path) for path in filepaths] == [
+        "raw_0.jsonl.gz", "raw_1.jsonl.gz", "raw_2.jsonl.gz"]
+    assert list(replay.read_records(filepaths[2])) == [(["f"], ["F"])]
+
+
+def test_torn_record_is_skipped(tmp_path):
+    filepath = str(tmp_path / "raw_0.jsonl.gz")
+    with gzip.open(filepath, "wt") as f:
+        f.write(json.dumps({"items": ["a"], "results": ["A"]}) + "\n")
+        f.write('{"items": ["b"], "res')
+    assert list(replay.read_records(filepath)) == [(["a"], ["A"])]
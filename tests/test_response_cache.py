@@ -0,0 +1,79 @@
+import pytest
+import response_cache
+from response_cache import ResponseCache, CachedSpotify, MISSING
+
+
+class Clock():
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(response_cache.time, "time", clock.time)
+    return clock
+
+
+def test_entries_expire_after_ttl(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), ttl=60)
+    cache.put("artists", "a", {"name": "A"})
+    clock.now += 60
+    assert cache.get("artists", "a") == {"name": "A"}
+    clock.now += 1
+    assert cache.get("artists", "a") is MISSING
+    # Refetched responses are fresh again
+    cache.put("artists", "a", {"name": "A2"})
+    assert cache.get("artists", "a") == {"name": "A2"}
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_least_recently_used_evicted(tmp_path, clock):
+    entry = {"data": "x" * 90}
+    size = len(response_cache.json.dumps(entry))
+    # Room for three entries. A fourth evicts down to 90%, i.e. one entry.
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), max_bytes=3.5 * size)
+    for item_id in ["a", "b", "c"]:
+        clock.now += 1
+        cache.put("tracks", item_id, entry)
+    clock.now += 1
+    cache.get("tracks", "a")   # Now b is the least recently used
+
+    clock.now += 1
+    cache.put("tracks", "d", entry)
+    assert cache.get("tracks", "b") is MISSING
+    assert all(cache.get("tracks", i) == entry for i in ["a", "c", "d"])
+    assert cache.total_bytes == 3 * size
+
+
+def test_markets_cached_separately(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    cache.put("artist_top_tracks", "a", ["us"], "US")
+    assert cache.get("artist_top_tracks", "a", "GB") is MISSING
+    assert cache.get("artist_top_tracks", "a", "US") == ["us"]
+
+
+class CountingClient():
+
+    def __init__(self):
+        self.requested = []
+
+    def artists(self, ids):
+        self.requested.append(list(ids))
+        return {"artists": [{"id": i} for i in ids]}
+
+
+def test_batches_only_request_uncached_ids(tmp_path):
+    filepath = str(tmp_path / "cache.sqlite")
+    client = CountingClient()
+    sp = CachedSpotify(client, ResponseCache(filepath))
+    sp.artists(["a", "b"])
+    # Kept on disk for the next run
+    sp = CachedSpotify(client, ResponseCache(filepath))
+    result = sp.artists(["b", "c", "a"])
+    assert result == {"artists": [{"id": "b"}, {"id": "c"}, {"id": "a"}]}
+    assert client.requested == [["a", "b"], ["c"]]
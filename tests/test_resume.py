@@ -0,0 +1,109 @@
+import os
+import json
+import threading
+import pytest
+import shard_manifest
+from crawler_base import CrawlerBase
+from crawl_options import StorageOptions, NetworkOptions, OutputOptions
+from frontier import unpack_id, RECORD_SIZE
+
+ITEM_COUNT = 300
+ITEM_IDS = [unpack_id(i.to_bytes(RECORD_SIZE, "big")) for i in range(ITEM_COUNT)]
+ITEM_NUMBERS = {item: i for i, item in enumerate(ITEM_IDS)}
+
+BACKENDS = {
+    "json": StorageOptions(),
+    "journal": StorageOptions(use_journal=True, journal_min_compaction=20),
+    "sqlite": StorageOptions(state_backend="sqlite"),
+    "frontier": StorageOptions(frontier_memory_items=8),
+}
+
+
+@pytest.fixture(autouse=True)
+def in_tmp_path(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+
+class Crash(Exception):
+    pass
+
+
+def linked_items(item):
+    # Each item links to a few others, so the frontier grows as it's crawled
+    i = ITEM_NUMBERS[item]
+    return [ITEM_IDS[j % ITEM_COUNT] for j in [2*i + 1, 2*i + 2, 7*i]]
+
+
+class GraphCrawler(CrawlerBase):
+    batch_size = 5
+
+    def __init__(self, *args, stop_at=None, crash=False, **kwargs):
+        self.stop_at = stop_at    # Stop after this many requests
+        self.crash = crash        # By crashing, rather than as if interrupted
+        self.request_count = 0
+        super().__init__(*args, **kwargs)
+
+    def initial_setup(self):
+        self.unsearched_items.add(ITEM_IDS[0])
+
+    def make_search_request(self, items_to_search):
+        self.request_count += 1
+        if self.request_count == self.stop_at:
+            if self.crash:
+                raise Crash()
+            self.stop_event.set()
+        return [linked_items(item) for item in items_to_search]
+
+    def process_search_results(self, items_to_search, results):
+        for item, links in zip(items_to_search, results):
+            self.add_new_items(links, item)
+            self.searched_items[item] = links
+        return items_to_search
+
+
+def run(**kwargs):
+    return GraphCrawler("graph", items_per_file=40, count_threshold=7,
+                        stop_event=threading.Event(),
+                        output=OutputOptions(show_progress=False), **kwargs)
+
+
+def saved_counts():
+    manifest = shard_manifest.ShardManifest(os.path.join("data", "graph")).load()
+    assert manifest.verify() == []
+    return sum(entry["count"] for entry in manifest.entries.values())
+
+
+@pytest.mark.parametrize("concurrency", [1, 4])
+@pytest.mark.parametrize("crash", [False, True])
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_resume_after_interrupt(backend, crash, concurrency):
+    kwargs = dict(storage=BACKENDS[backend],
+                  network=NetworkOptions(concurrency=concurrency))
+    if crash:
+        with pytest.raises(Crash):
+            run(stop_at=23, crash=True, **kwargs)
+    else:
+        crawler = run(stop_at=23, **kwargs)
+        assert not crawler.complete
+
+    crawler = run(**kwargs)
+    assert crawler.complete
+    # Carried on from the last checkpoint, rather than starting again
+    assert crawler.request_count < ITEM_COUNT / GraphCrawler.batch_size
+    with open(os.path.join("data", "graph.json"), "r") as f:
+        results = json.load(f)
+    assert results == {item: linked_items(item) for item in ITEM_IDS}
+    # Nothing searched before the interrupt was saved twice
+    assert saved_counts() == ITEM_COUNT
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_resume_after_crash_before_first_checkpoint(backend):
+    with pytest.raises(Crash):
+        run(stop_at=2, crash=True, storage=BACKENDS[backend])
+    crawler = run(storage=BACKENDS[backend])
+    assert crawler.complete
+    with open(os.path.join("data", "graph.json"), "r") as f:
+        results = json.load(f)
+    assert results == {item: linked_items(item) for item in ITEM_IDS}
+    assert saved_counts() == ITEM_COUNT
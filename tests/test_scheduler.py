@@ -0,0 +1,154 @@
+import os
+import threading
+import pytest
+import scheduler as sched
+from crawler_base import CrawlerBase
+from crawl_options import SchedulingOptions, OutputOptions
+
+UNSEARCHED = {"a", "b", "c", "d", "e"}
+
+
+def test_in_degree_most_referenced_first():
+    scheduler = sched.create_scheduler("in_degree")
+    for item in ["a", "b", "c", "b", "c", "c", "d"]:
+        scheduler.observe(item, "source")
+    assert scheduler.peek(4, UNSEARCHED) == ["c", "b", "a", "d"]
+    # Peeking leaves the queue as it was
+    assert scheduler.peek(2, UNSEARCHED) == ["c", "b"]
+    scheduler.discard(["c"])
+    assert scheduler.peek(2, UNSEARCHED) == ["b", "a"]
+    assert scheduler.peek(2, {"a", "d"}) == ["a", "d"]
+
+
+def test_popularity_most_popular_first():
+    scheduler = sched.create_scheduler("popularity")
+    scheduler.observe("a", "x", {"popularity": 10})
+    scheduler.observe("b", "x", None)
+    scheduler.observe("c", "x", {"popularity": 80})
+    scheduler.observe("b", "y", {"popularity": 50})
+    scheduler.observe("c", "y", None)    # Keeps its known popularity
+    assert scheduler.peek(3, UNSEARCHED) == ["c", "b", "a"]
+
+
+def test_bfs_buckets_by_depth():
+    scheduler = sched.create_scheduler("bfs")
+    scheduler.observe("a")
+    scheduler.observe("d", "a")
+    scheduler.observe("e", "d")
+    scheduler.observe("b", "a")
+    scheduler.observe("c", "e")
+    assert scheduler.priorities == {"a": 0, "d": 1, "b": 1, "e": 2, "c": 3}
+    assert scheduler.peek(5, UNSEARCHED) == ["a", "d", "b", "e", "c"]
+    # A shorter path found later moves the item up
+    scheduler.observe("c", "a")
+    scheduler.discard(["a"])
+    assert scheduler.peek(5, UNSEARCHED) == ["d", "b", "c", "e"]
+    # Items queued without a source go after the deepest
+    scheduler.requeue(["x"])
+    assert scheduler.priorities["x"] == 3
+    assert scheduler.peek(5, UNSEARCHED | {"x"}) == ["d", "b", "c", "e", "x"]
+
+
+def test_heap_compacts_stale_entries():
+    scheduler = sched.create_scheduler("in_degree")
+    items = [f"item_{i}" for i in range(10)]
+    for _ in range(500):
+        for item in items:
+            scheduler.observe(item, "source")
+        assert len(scheduler.heap) <= 2 * len(items) + sched.MIN_COMPACTION + 1
+    scheduler.observe("item_3", "source")
+    scheduler.compact()
+    assert len(scheduler.heap) == len(items)
+    assert scheduler.peek(3, set(items)) == ["item_3", "item_0", "item_1"]
+
+
+def test_changes_since_checkpoint():
+    scheduler = sched.create_scheduler("in_degree")
+    scheduler.observe("a", "x")
+    scheduler.observe("b", "x")
+    scheduler.observe("a", "y")
+    assert scheduler.take_changes() == {"a": -2, "b": -1}
+    scheduler.discard(["b", "missing"])
+    scheduler.requeue(["c"])
+    assert scheduler.take_changes() == {"b": None, "c": 0}
+    assert scheduler.take_changes() == {}
+
+    restored = sched.create_scheduler("in_degree")
+    restored.load(scheduler.state())
+    assert restored.peek(3, UNSEARCHED) == ["a", "c"]
+    with pytest.raises(ValueError):
+        sched.create_scheduler("depth")
+
+
+NODES = 200
+
+
+def linked_items(item):
+    n = int(item)
+    return [str(j % NODES) for j in [2*n + 1, 2*n + 2, 7*n]]
+
+
+def bfs_depths():
+    depths = {"0": 0}
+    queue = ["0"]
+    for item in queue:
+        for linked_item in linked_items(item):
+            if linked_item not in depths:
+                depths[linked_item] = depths[item] + 1
+                queue.append(linked_item)
+    return depths
+
+
+class GraphCrawler(CrawlerBase):
+    batch_size = 4
+
+    def __init__(self, *args, stop_at=None, **kwargs):
+        self.stop_at = stop_at
+        self.request_count = 0
+        self.order = []
+        super().__init__(*args, **kwargs)
+
+    def initial_setup(self):
+        self.unsearched_items.add("0")
+
+    def make_search_request(self, items_to_search):
+        self.request_count += 1
+        if self.request_count == self.stop_at:
+            self.stop_event.set()
+        self.order += items_to_search
+        return [linked_items(item) for item in items_to_search]
+
+    def process_search_results(self, items_to_search, results):
+        for item, links in zip(items_to_search, results):
+            self.add_new_items(links, item)
+            self.searched_items[item] = links
+        return items_to_search
+
+
+def run(stop_at):
+    return GraphCrawler("graph", items_per_file=20, count_threshold=3,
+                        stop_at=stop_at, stop_event=threading.Event(),
+                        scheduling=SchedulingOptions(scheduler="bfs"),
+                        output=OutputOptions(show_progress=False))
+
+
+def test_crawler_resumes_bfs_order(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    depths = bfs_depths()
+    crawler = run(stop_at=10)
+    assert not crawler.complete
+    searched = [depths[item] for item in crawler.order]
+    assert searched == sorted(searched)
+    # Changes since the snapshot were journaled
+    assert os.path.getsize(os.path.join("data", "graph", "scheduler.jsonl")) > 0
+
+    crawler = run(stop_at=1)
+    assert set(crawler.scheduler.priorities) == crawler.unsearched_items
+    for item, depth in crawler.scheduler.priorities.items():
+        assert depth == depths[item]
+    resumed = [depths[item] for item in crawler.order]
+    assert resumed[0] >= searched[-1] and resumed == sorted(resumed)
+
+    crawler = run(stop_at=None)
+    assert crawler.complete
+    assert len(crawler.saved_items) == len(depths)
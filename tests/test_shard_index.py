@@ -0,0 +1,75 @@
+import os
+import shard_index
+from crawler_base import CrawlerBase
+from crawl_options import OutputOptions
+
+ITEMS = [f"item_{i}" for i in range(30)]
+
+
+def test_index_round_trip(tmp_path):
+    shard_path = str(tmp_path / "saved_0.json")
+    ids = ["b", "a", 3, "7tYKF4w9nC0nq9CsPZTHyP"]
+    shard_index.write_index(shard_path, ids, {"a": 100, "3": 200},
+                            {"a": shard_index.FLAG_CHANGED})
+    assert os.path.isfile(tmp_path / "saved_0.idx")
+    assert shard_index.read_index(shard_path) == sorted(str(i) for i in ids)
+    times = shard_index.read_index_times(shard_path)
+    assert times["a"] == (100, shard_index.FLAG_CHANGED)
+    assert times["3"] == (200, 0)
+    assert times["b"] == (0, 0)
+
+
+def test_index_contains(tmp_path):
+    shard_path = str(tmp_path / "saved_0.json")
+    ids = [f"id_{i}" for i in range(100)]
+    shard_index.write_index(shard_path, ids)
+    index_data = shard_index.read_index_data(shard_path)
+    assert all(shard_index.index_contains(index_data, i) for i in ids)
+    for missing in ["id_100", "id_", "a", "id_99_and_more"]:
+        assert not shard_index.index_contains(index_data, missing)
+
+
+def test_index_shared_by_every_shard_format(tmp_path):
+    for extension in [".json", ".json.gz", ".msgpack.zst", ".cols"]:
+        shard_path = str(tmp_path / f"saved_4{extension}")
+        assert shard_index.index_path(shard_path) == str(tmp_path / "saved_4.idx")
+
+
+def test_bad_index_is_ignored(tmp_path):
+    shard_path = str(tmp_path / "saved_0.json")
+    assert shard_index.read_index(shard_path) == None
+    shard_index.write_index(shard_path, ["a", "b"])
+    with open(tmp_path / "saved_0.idx", "r+b") as f:
+        f.truncate(os.path.getsize(tmp_path / "saved_0.idx") - 1)
+    assert shard_index.read_index(shard_path) == None
+    assert shard_index.read_index_times(shard_path) == None
+
+
+class ListCrawler(CrawlerBase):
+
+    def initial_setup(self):
+        self.unsearched_items.update(ITEMS)
+
+    def make_search_request(self, items_to_search):
+        return [item.upper() for item in items_to_search]
+
+
+def test_saved_items_load_from_indexes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    quiet = OutputOptions(show_progress=False)
+    ListCrawler("list", items_per_file=10, count_threshold=5, output=quiet)
+    dirname = os.path.join("data", "list")
+    os.remove(os.path.join(dirname, "saved_1.idx"))
+
+    # Only the shard whose index was lost is read, and it is indexed again
+    loads = []
+    load_shard = shard_index.load_shard
+    def counting_load_shard(filepath):
+        loads.append(os.path.basename(filepath))
+        return load_shard(filepath)
+    monkeypatch.setattr(shard_index, "load_shard", counting_load_shard)
+    crawler = ListCrawler("list", items_per_file=10, count_threshold=5,
+                          output=quiet)
+    assert loads[0] == "saved_1.json"
+    assert sorted(crawler.saved_items) == sorted(ITEMS)
+    assert shard_index.read_index(os.path.join(dirname, "saved_1.json")) != None
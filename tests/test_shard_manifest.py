@@ -0,0 +1,95 @@
+import os
+import json
+import shard_index
+import shard_manifest
+from shard_manifest import ShardManifest
+
+
+def write_shard(manifest, data):
+    shard_path = manifest.allocate()
+    with open(shard_path, "w") as f:
+        json.dump(data, f)
+    shard_index.write_index(shard_path, data.keys())
+    manifest.record(shard_path, data.keys())
+    return shard_path
+
+
+def test_record_and_load(tmp_path):
+    manifest = ShardManifest(str(tmp_path)).load()
+    first = write_shard(manifest, {"b": 1, "a": 2})
+    second = write_shard(manifest, {"c": 3})
+    assert [os.path.basename(p) for p in (first, second)] == \
+        ["saved_0.json", "saved_1.json"]
+
+    loaded = ShardManifest(str(tmp_path)).load()
+    assert loaded.shard_paths() == [first, second]
+    assert loaded.next_index == 2
+    entry = loaded.entries[0]
+    assert (entry["count"], entry["min_id"], entry["max_id"]) == (2, "a", "b")
+    assert entry["bytes"] == os.path.getsize(first)
+    assert loaded.verify() == []
+
+
+def test_rewritten_shard_replaces_entry(tmp_path):
+    manifest = ShardManifest(str(tmp_path)).load()
+    shard_path = write_shard(manifest, {"a": 1})
+    with open(shard_path, "w") as f:
+        json.dump({"a": 1, "b": 2}, f)
+    shard_index.write_index(shard_path, ["a", "b"])
+    manifest.record(shard_path, ["a", "b"])
+
+    loaded = ShardManifest(str(tmp_path)).load()
+    assert loaded.entries[0]["count"] == 2
+    # Replaced lines are dropped on load
+    with open(loaded.filepath, "r") as f:
+        assert len(f.readlines()) == 1
+
+
+def test_torn_line_is_dropped(tmp_path):
+    manifest = ShardManifest(str(tmp_path)).load()
+    write_shard(manifest, {"a": 1})
+    with open(manifest.filepath, "a") as f:
+        f.write('{"index": 1, "pa')
+    loaded = ShardManifest(str(tmp_path)).load()
+    assert list(loaded.entries) == [0]
+    assert os.path.basename(loaded.allocate()) == "saved_1.json"
+    with open(loaded.filepath, "r") as f:
+        assert [json.loads(line)["index"] for line in f] == [0]
+
+
+def test_verify_finds_problems(tmp_path):
+    manifest = ShardManifest(str(tmp_path)).load()
+    changed = write_shard(manifest, {"a": 1})
+    missing = write_shard(manifest, {"b": 2})
+    reindexed = write_shard(manifest, {"c": 3})
+    with open(changed, "w") as f:
+        json.dump({"a": 9}, f)
+    os.remove(missing)
+    shard_index.write_index(reindexed, ["c", "d"])
+    with open(tmp_path / "saved_7.json", "w") as f:
+        json.dump({}, f)
+
+    assert manifest.verify() == [
+        "saved_0.json: checksum mismatch",
+        "saved_1.json: missing",
+        "saved_2.json: index does not match the 1 IDs recorded",
+        "saved_7.json: not in manifest",
+    ]
+
+
+def test_rebuild_from_disk(tmp_path):
+    # Shards saved before manifests (or indexes) existed
+    for i, data in enumerate([{"a": 1}, {"b": 2, "c": 3}]):
+        with open(tmp_path / f"saved_{i}.json", "w") as f:
+            json.dump(data, f)
+    dirname = str(tmp_path)
+    assert shard_manifest.list_shard_paths(dirname) == \
+        shard_index.list_shard_paths(dirname)
+    assert not os.path.exists(shard_manifest.manifest_path(dirname))
+
+    manifest = ShardManifest(dirname).load()
+    assert os.path.isfile(manifest.filepath)
+    assert [entry["count"] for entry in manifest.entries.values()] == [1, 2]
+    assert shard_index.read_index(str(tmp_path / "saved_1.json")) == ["b", "c"]
+    assert manifest.verify() == []
+    assert os.path.basename(manifest.allocate()) == "saved_2.json"
@@ -0,0 +1,65 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import shared_functions as sf
+
+
+@pytest.fixture
+def server():
+    # Answers with the queued status codes in turn, then 200s
+    class Handler(BaseHTTPRequestHandler):
+        statuses = []
+        requests = 0
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            Handler.requests += 1
+            status = Handler.statuses.pop(0) if Handler.statuses else 200
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}/"
+    httpd.handler = Handler
+    yield httpd
+    httpd.shutdown()
+
+
+def test_session_retries_server_errors(server):
+    server.handler.statuses = [503, 502]
+    session = sf.create_http_session(retries=3, backoff_factor=0)
+    assert session.get(server.url).status_code == 200
+    assert server.handler.requests == 3
+
+
+def test_session_leaves_throttling_to_rate_limiter(server):
+    server.handler.statuses = [429]
+    session = sf.create_http_session(retries=3, backoff_factor=0)
+    assert session.get(server.url).status_code == 429
+    assert server.handler.requests == 1
+
+
+def test_session_pool_and_retry_config():
+    session = sf.create_http_session(pool_size=16, retries=5)
+    adapter = session.get_adapter("https://api.spotify.com/v1/artists")
+    assert adapter._pool_maxsize == 16
+    assert adapter.max_retries.total == 5
+    # Read timeouts are left to the crawler
+    assert adapter.max_retries.read == False
+
+
+def test_accessor_shares_session_and_timeouts():
+    session = sf.create_http_session()
+    sp = sf.create_spotipy_accessor({"client_id": "id", "client_secret": "secret"},
+                                    connect_timeout=2, read_timeout=7,
+                                    session=session)
+    assert sp._session is session
+    assert sp.requests_timeout == (2, 7)
+    manager = sp.auth_manager
+    assert manager._session is session
+    assert manager.requests_timeout == (2, 7)